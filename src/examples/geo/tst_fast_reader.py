@@ -0,0 +1,42 @@
+#! /usr/bin/env python
+
+import sys
+import time
+import string
+import tempfile
+from pathlib import Path
+DATADIR = str(Path(__file__).resolve().parent.parent.parent )+ "/data/"
+CODEDIR = str(Path(__file__).resolve().parent.parent.parent )+ ""
+sys.path.append(CODEDIR)
+
+from Bio.PDB import PDBParser, MMCIFIO
+from maptial.geo import pdbloader as pl
+
+# times the Biopython and the fast reader on a large structure tiled from copies of 6eex, as pdb and cif
+if __name__ == "__main__":
+    pdb = "6eex"
+    copies = 300
+    with open(DATADIR + pdb + ".pdb","r") as fr:
+        atom_lines = [line for line in fr.readlines() if line[0:6] in ("ATOM  ","HETATM")]
+    chains = string.ascii_uppercase + string.digits
+    tmpdir = tempfile.mkdtemp() + "/"
+    with open(tmpdir + "big.pdb","w") as fw:
+        for copy in range(copies):
+            chain = chains[copy % len(chains)]
+            offset = 1000 * (copy // len(chains))
+            for line in atom_lines:
+                fw.write(line[:21] + chain + str(int(line[22:26]) + offset).rjust(4) + line[26:])
+        fw.write("END\n")
+    io = MMCIFIO()
+    io.set_structure(PDBParser(PERMISSIVE=True).get_structure("big",tmpdir + "big.pdb"))
+    io.save(tmpdir + "big.cif")
+
+    for cif in [False,True]:
+        start = time.time()
+        bio = pl.PdbLoader("big",tmpdir,cif=cif,cache=False).load_pdb()
+        bio_secs = time.time() - start
+        start = time.time()
+        fast = pl.PdbLoader("big",tmpdir,cif=cif,fast=True,cache=False).load_pdb()
+        fast_secs = time.time() - start
+        same = bio.dataFrame().equals(fast.dataFrame())
+        print("cif=",cif,"atoms=",len(fast.lines),"biopython secs=",round(bio_secs,3),"fast secs=",round(fast_secs,3),"same=",same)
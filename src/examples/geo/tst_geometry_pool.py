@@ -0,0 +1,38 @@
+#! /usr/bin/env python
+
+import io
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+from pathlib import Path
+DATADIR = str(Path(__file__).resolve().parent.parent.parent )+ "/data/"
+CODEDIR = str(Path(__file__).resolve().parent.parent.parent )+ ""
+sys.path.append(CODEDIR)
+
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbgeometry as pg
+from maptial.geo import geometrypool as gp
+
+# times the geometry of many structures, copies of 6eex, in one process and then sharded over a pool of processes
+if __name__ == "__main__":
+    geos = ["N:CA","N:CA:C:N+1","C-1:N:CA:C","CA:{O&3@1}"]
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = tmp + "/"
+        pdb_codes = [f"x{i:03d}" for i in range(200)]
+        for pdb_code in pdb_codes:
+            shutil.copy(DATADIR + "6eex.pdb",tmpdir + pdb_code + ".pdb")
+
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            pobjs = [pl.PdbLoader(pdb_code,tmpdir,fast=True).load_pdb() for pdb_code in pdb_codes]
+            serial = pg.GeometryMaker(pobjs).calculateGeometry(geos)
+        print("serial rows=",len(serial),"secs=",round(time.time() - start,3))
+
+        for processes in [2,4]:
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                with gp.GeometryPool(tmpdir,processes=processes,chunk_size=10) as pool:
+                    pooled = pool.calculate_geometry(pdb_codes,geos)
+            print("processes=",processes,"rows=",len(pooled),"secs=",round(time.time() - start,3),"same=",pooled.equals(serial))
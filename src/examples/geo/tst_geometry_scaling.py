@@ -0,0 +1,40 @@
+#! /usr/bin/env python
+
+import io
+import sys
+import time
+import tempfile
+import contextlib
+from pathlib import Path
+DATADIR = str(Path(__file__).resolve().parent.parent.parent )+ "/data/"
+CODEDIR = str(Path(__file__).resolve().parent.parent.parent )+ ""
+sys.path.append(CODEDIR)
+
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbgeometry as pg
+
+# times the backbone geometry of one long chain made of copies of 6eex, each copy 10 residue numbers on from the last
+# and moved so they don't overlap, the time should grow with the number of residues rather than its square,
+# for the backbone from the residue index and for the nearest atoms from the k-d trees
+if __name__ == "__main__":
+    geo_sets = {"backbone":["N:CA","N:CA:C","N:CA:C:N+1","C-1:N:CA:C"],"nearest":["CA:{O&3@1}","N:(O,N&2@0)"]}
+    with open(DATADIR + "6eex.pdb","r") as fr:
+        atom_lines = [line for line in fr.readlines() if line[0:6] == "ATOM  "]
+    tmpdir = tempfile.mkdtemp() + "/"
+    for copies in [100,200,400,800]:
+        with open(tmpdir + "long.pdb","w") as fw:
+            for copy in range(copies):
+                for line in atom_lines:
+                    rid = int(line[22:26]) - 700 + 10 * copy
+                    x = float(line[30:38]) + (copy % 10) * 12.0
+                    y = float(line[38:46]) + ((copy // 10) % 10) * 12.0
+                    z = float(line[46:54]) + (copy // 100) * 12.0
+                    fw.write(line[:22] + str(rid).rjust(4) + line[26:30] + f"{x:8.3f}{y:8.3f}{z:8.3f}" + line[54:])
+            fw.write("END\n")
+        po = pl.PdbLoader("long",tmpdir,fast=True).load_pdb()
+        for name,geos in geo_sets.items():
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                df = pg.GeometryMaker([po]).calculateGeometry(geos)
+            secs = time.time() - start
+            print(name,"residues=",sum([len(res) for res in po.chains.values()]),"rows=",len(df),"secs=",round(secs,3))
@@ -0,0 +1,39 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import contextlib
+import importlib.util
+from pathlib import Path
+DATADIR = str(Path(__file__).resolve().parent.parent.parent )+ "/data/"
+CODEDIR = str(Path(__file__).resolve().parent.parent.parent )+ ""
+sys.path.append(CODEDIR)
+
+from maptial.geo import geometrystream as gs
+
+# streams the geometry of many structures, copies of 6eex, the peak memory should not grow with the number of them
+# the rows are written to parquet if pyarrow is installed, otherwise only counted
+if __name__ == "__main__":
+    geos = ["N:CA","N:CA:C:N+1","C-1:N:CA:C","CA:{O&3@1}"]
+    write = importlib.util.find_spec("pyarrow") is not None
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = tmp + "/"
+        for copies in [50,200,400]:
+            pdb_codes = [f"x{i:03d}" for i in range(copies)]
+            for pdb_code in pdb_codes:
+                shutil.copy(DATADIR + "6eex.pdb",tmpdir + pdb_code + ".pdb")
+            start = time.time()
+            tracemalloc.start()
+            with open(os.devnull,"w") as devnull, contextlib.redirect_stdout(devnull):
+                frames = gs.iter_geometry(pdb_codes,geos,tmpdir)
+                if write:
+                    rows = gs.write_frames(frames,tmpdir + "geo.parquet")
+                else:
+                    rows = sum([len(df) for df in frames])
+            current,peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("structures=",copies,"rows=",rows,"written=",write,"peak MB=",round(peak/1e6,2),"secs=",round(time.time() - start,3))
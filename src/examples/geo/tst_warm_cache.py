@@ -0,0 +1,43 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from pathlib import Path
+DATADIR = str(Path(__file__).resolve().parent.parent.parent )+ "/data/"
+CODEDIR = str(Path(__file__).resolve().parent.parent.parent )+ ""
+sys.path.append(CODEDIR)
+
+from maptial.geo import pdbloader as pl
+
+def time_cache(directory, pdb_codes):
+    if len(pdb_codes) == 0:
+        pdb_codes = sorted([f[:-4] for f in os.listdir(directory) if f.endswith(".pdb")])
+    start = time.time()
+    failed = pl.warm_cache(pdb_codes,directory,log_level=1)
+    print("Cached",len(pdb_codes)-len(failed),"failed",failed,"secs=",round(time.time()-start,3))
+
+    start = time.time()
+    for pdb_code in pdb_codes:
+        pl.PdbLoader(pdb_code,directory,cif=False,cache=False).load_pdb()
+    print("Parsed secs=",round(time.time()-start,3))
+    start = time.time()
+    for pdb_code in pdb_codes:
+        pl.PdbLoader(pdb_code,directory,cif=False,cache=True).load_pdb()
+    print("Cached secs=",round(time.time()-start,3))
+
+# Caches every pdb file in a directory, then times loading them from the files and from the cache
+# usage: tst_warm_cache.py [directory] [pdb codes...]
+# The .npz caches are written into the directory given, without one the pdb files of DATADIR are copied to a
+# temporary directory so nothing is left in DATADIR
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        time_cache(os.path.join(sys.argv[1],""),sys.argv[2:])
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            for f in os.listdir(DATADIR):
+                if f.endswith(".pdb"):
+                    shutil.copy2(DATADIR + f,tmp)
+            time_cache(os.path.join(tmp,""),[])
@@ -0,0 +1,30 @@
+#! /usr/bin/env python
+
+import sys
+import time
+from pathlib import Path
+DATADIR = str(Path(__file__).resolve().parent.parent.parent )+ "/data/"
+CODEDIR = str(Path(__file__).resolve().parent.parent.parent )+ ""
+sys.path.append(CODEDIR)
+
+from maptial.map import mapsmanager as mman
+from maptial.map import mapfunctions as mfun
+from maptial.xyz import vectorthree as v3
+
+# times a bspline slice over 1,2,4 and 8 processes
+if __name__ == "__main__":
+    pdb = "6eex"
+    interp_method = "bspline"
+    mman.MapsManager().set_dir(DATADIR)
+    ml = mman.MapsManager().get_or_create(pdb,file=1,header=1,values=1)
+    mo,po = ml.mobj,ml.pobj
+    central = v3.VectorThree().from_coords(po.get_coords_key("A:709@CA.A"))
+    linear = v3.VectorThree().from_coords(po.get_coords_key("A:709@C.A"))
+    planar = v3.VectorThree().from_coords(po.get_coords_key("A:709@N.A"))
+
+    for processes in [1,2,4,8]:
+        mf = mfun.MapFunctions(pdb,mo,po,interp_method,processes=processes)
+        start = time.time()
+        vals = mf.get_slice(central,linear,planar,6,100,interp_method,deriv=0)
+        print("Processes=",processes,"secs=",round(time.time()-start,3))
+        mf.close_pool()
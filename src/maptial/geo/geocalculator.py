@@ -1,5 +1,6 @@
 
 import math
+import numpy as np
 
 
 def getMagnitude(x,y,z):
@@ -90,4 +91,88 @@ def getDihedral(x1, y1, z1, x2, y2, z2, x3, y3, z3, x4, y4, z4):
 
         return (round(theta_deg, 3))
     except:
-        return -180 #there is a 0 max for cos theta
\ No newline at end of file
+        return -180 #there is a 0 max for cos theta
+
+
+# The array versions take (N,3) coordinate arrays, one per atom, and return the N values with the same
+# arithmetic, sign and rounding as the functions above
+
+def getDistances(c1, c2):
+    """
+    param: c1,c2= (N,3) arrays of the coordinates of the first and second atoms
+    returns: array of the N distances
+    """
+
+    c1 = np.asarray(c1,dtype=float).reshape(-1,3)
+    c2 = np.asarray(c2,dtype=float).reshape(-1,3)
+    d = c2 - c1
+    return np.sqrt((d[:,0] * d[:,0]) + (d[:,1] * d[:,1]) + (d[:,2] * d[:,2]))
+
+def getAngles(c1, c2, c3):
+    """
+    param: c1,c2,c3= (N,3) arrays of the coordinates of the first, second and third atoms
+    returns: array of the N angles, nan where getAngle would fail on a zero length or a rounding outside acos
+    """
+
+    c1 = np.asarray(c1,dtype=float).reshape(-1,3)
+    c2 = np.asarray(c2,dtype=float).reshape(-1,3)
+    c3 = np.asarray(c3,dtype=float).reshape(-1,3)
+    d = c2 - c1
+    e = c2 - c3
+    dot = (d[:,0] * e[:,0]) + (d[:,1] * e[:,1]) + (d[:,2] * e[:,2])
+    magA = np.sqrt((d[:,0] * d[:,0]) + (d[:,1] * d[:,1]) + (d[:,2] * d[:,2]))
+    magB = np.sqrt((e[:,0] * e[:,0]) + (e[:,1] * e[:,1]) + (e[:,2] * e[:,2]))
+    with np.errstate(divide="ignore",invalid="ignore"):
+        cos_theta = dot / (magA * magB)
+        theta = np.arccos(cos_theta)
+    theta_deg = (theta / 3.141592653589793238463) * 180
+    return _round3(theta_deg)
+
+def crossProducts(A, B):
+    x = (A[:,1] * B[:,2]) - (A[:,2] * B[:,1])
+    y = (A[:,2] * B[:,0]) - (A[:,0] * B[:,2])
+    z = (A[:,0] * B[:,1]) - (A[:,1] * B[:,0])
+    return np.stack([x,y,z],axis=1)
+
+def getDihedrals(c1, c2, c3, c4):
+    """
+    param: c1,c2,c3,c4= (N,3) arrays of the coordinates of the first, second, third and fourth atoms
+    returns: array of the N dihedrals, -180 where getDihedral returns it
+    """
+
+    c1 = np.asarray(c1,dtype=float).reshape(-1,3)
+    c2 = np.asarray(c2,dtype=float).reshape(-1,3)
+    c3 = np.asarray(c3,dtype=float).reshape(-1,3)
+    c4 = np.asarray(c4,dtype=float).reshape(-1,3)
+    A = c2 - c1
+    B = c2 - c3
+    C = c4 - c3
+    crossAB = crossProducts(A,B)
+    crossBC = crossProducts(B,C)
+    dot = (crossAB[:,0] * crossBC[:,0]) + (crossAB[:,1] * crossBC[:,1]) + (crossAB[:,2] * crossBC[:,2])
+    magAB = np.sqrt((crossAB[:,0] ** 2) + (crossAB[:,1] ** 2) + (crossAB[:,2] ** 2))
+    magBC = np.sqrt((crossBC[:,0] ** 2) + (crossBC[:,1] ** 2) + (crossBC[:,2] ** 2))
+    with np.errstate(divide="ignore",invalid="ignore"):
+        cos_theta = dot / (magAB * magBC)
+        theta = np.arccos(cos_theta)
+    theta_deg = (theta / 3.141592653589793238463) * 180
+    cross = crossProducts(crossAB,crossBC)
+    dotB = (cross[:,0] * B[:,0]) + (cross[:,1] * B[:,1]) + (cross[:,2] * B[:,2])
+    theta_deg = np.where(dotB > 0,-theta_deg,theta_deg)
+    # there is a 0 max for cos theta
+    failed = (magAB * magBC == 0) | (np.abs(cos_theta) > 1)
+    return np.where(failed,-180.0,_round3(theta_deg))
+
+def _round3(vals):
+    # python's round(val,3), which rounds the exact value half to even where np.round rounds val*1000 after it has
+    # been rounded itself. The error in val*1000 is found exactly by Dekker's split, so the halves are decided as python does
+    y = vals * 1000
+    split = vals * 134217729.0
+    hi = split - (split - vals)
+    lo = vals - hi
+    err = (hi * 1000 - y) + lo * 1000
+    low = np.floor(y)
+    d = (y - low) - 0.5
+    up = (d > 0) | ((d == 0) & (err > 0)) | ((d == 0) & (err == 0) & (np.mod(low,2) == 1))
+    rounded = np.copysign((low + up) / 1000,vals)
+    return np.where(np.isfinite(y),rounded,vals)
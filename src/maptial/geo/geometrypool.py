@@ -0,0 +1,116 @@
+"""
+RSA 19/10/26
+
+Geometry over many structures from a pool of worker processes.
+The pdb codes are sharded over the workers, each loads its own structures with PdbLoader rather than being sent
+parsed ones, and sends back the rows of each as a compact columnar chunk.
+The chunks are joined in the order of the codes, so the result is the same whatever the number of processes.
+
+"""
+
+import multiprocessing
+import numpy as np
+import pandas as pd
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbgeometry as pg
+
+# worker process state, set once by _init_worker
+_worker_loader = {}
+
+def _init_worker(loader):
+    global _worker_loader
+    _worker_loader = loader
+
+def _load(pdb_code):
+    return pl.PdbLoader(pdb_code,**_worker_loader).load_pdb()
+
+def _geometry_chunk(args):
+    pdb_code,geos = args
+    try:
+        return pdb_code,to_chunk(pg.GeometryMaker([_load(pdb_code)]).calculateGeometry(geos)),""
+    except Exception as e:
+        return pdb_code,None,str(e)
+
+def _data_chunk(pdb_code):
+    try:
+        return pdb_code,to_chunk(pg.GeometryMaker([_load(pdb_code)]).calculateData()),""
+    except Exception as e:
+        return pdb_code,None,str(e)
+
+def to_chunk(df):
+    # A DataFrame as a columnar chunk, numpy columns with the non numeric ones coded against their unique values
+    chunk = {"index":df.index.to_numpy(),"columns":[]}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            chunk["columns"].append((col,df[col].to_numpy(),None))
+        else:
+            codes,uniques = pd.factorize(df[col],use_na_sentinel=False)
+            chunk["columns"].append((col,codes.astype(np.int32),uniques))
+    return chunk
+
+def from_chunk(chunk):
+    cols = {}
+    for col,vals,uniques in chunk["columns"]:
+        cols[col] = vals if uniques is None else uniques.take(vals)
+    return pd.DataFrame(cols,index=chunk["index"])
+
+def join_chunks(chunks, ignore_index=True):
+    # the chunks as one DataFrame in the order given, those with no rows only give the columns
+    dfs = [from_chunk(chunk) for chunk in chunks]
+    filled = [df for df in dfs if len(df) > 0]
+    if len(filled) == 0:
+        return dfs[0] if len(dfs) > 0 else pd.DataFrame()
+    return pd.concat(filled,axis=0,ignore_index=ignore_index)
+
+class GeometryPool(object):
+    def __init__(self, directory, processes=4, cif=False, fast=True, cache=True, cache_key="mtime", chunk_size=1):
+        #Paramaters
+        #-----------
+        #directory : str
+        #    Where the workers load the structures from, as for PdbLoader
+        #processes : int = 4
+        #cif, fast, cache, cache_key :
+        #    How the structures are loaded, see PdbLoader
+        #chunk_size : int = 1
+        #    The number of structures sent to a worker at a time
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.failed = [] # the codes that could not be loaded or calculated in the last call
+        loader = {"directory":directory,"cif":cif,"fast":fast,"cache":cache,"cache_key":cache_key}
+        self._pool = multiprocessing.get_context().Pool(processes,initializer=_init_worker,initargs=(loader,))
+
+    def calculate_geometry(self, pdb_codes, geos):
+        # GeometryMaker.calculateGeometry over the structures of the codes, in the order of the codes
+        return self._join(self._pool.imap(_geometry_chunk,[(pdb_code,geos) for pdb_code in pdb_codes],self.chunk_size),True)
+
+    def calculate_data(self, pdb_codes):
+        # GeometryMaker.calculateData over the structures of the codes, in the order of the codes
+        return self._join(self._pool.imap(_data_chunk,list(pdb_codes),self.chunk_size),False)
+
+    def iter_geometry(self, pdb_codes, geos):
+        # Yields the calculateGeometry DataFrame of each structure in the order of the codes, as the workers finish them,
+        # to stream a survey through geometrystream.write_frames
+        for chunk in self._iter_chunks(self._pool.imap(_geometry_chunk,((pdb_code,geos) for pdb_code in pdb_codes),self.chunk_size)):
+            yield from_chunk(chunk)
+
+    def _join(self, results, ignore_index):
+        return join_chunks(list(self._iter_chunks(results)),ignore_index)
+
+    def _iter_chunks(self, results):
+        self.failed = []
+        for pdb_code,chunk,error in results:
+            if chunk is None:
+                print("Error calculating",pdb_code,error)
+                self.failed.append(pdb_code)
+            else:
+                yield chunk
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,146 @@
+"""
+RSA 19/10/26
+
+The rows of a geo for a residue, shared by GeometryMaker and ContactMaker.
+The atom tuples of the residue are gathered, those that fail the criteria are dropped, and the values of the rest
+are calculated together as arrays, so many residues can be gathered first and calculated in one call.
+
+"""
+
+import itertools
+import numpy as np
+from maptial.geo import geocalculator as calc
+
+class GeometryRows:
+    # A base for the makers, which give getMatchingStartAtoms, getBestAtoms and infoAtoms
+
+    def calculateOneGeometry(self,pobj, chain, resno, geo_atoms,geo_type,log=0):
+        """Creates the geoemtry from the structure in the class for 1 geo
+
+        :param chain: The chain id
+        :param rid: The residue number
+        :param geo_atoms: A list of tuples that is the atom, the displacement
+
+        :returns: [bool,float,bfactor, occupancy, atoms, GeoAtom] a bool for if it could be calculated, and the value, and the reference atom
+        """
+        rows,vals = self.selectAtoms(pobj, chain, resno, geo_atoms,geo_type)
+        if vals is None:
+            vals = self.calculateValues([combo for row in rows for combo in row],geo_type)
+        return self.finishGeometry(rows,vals)
+
+    def selectAtoms(self,pobj, chain, resno, geo_atoms,geo_type):
+        # The atom tuples of a residue's geo that match the criteria, a list per first atom, and their values if the
+        # criteria needed them, otherwise None for them to be calculated later with calculateValues
+        criteria = ""
+        atom_groups = []
+        first_atoms = self.getMatchingStartAtoms(pobj, chain, resno,geo_atoms[0])
+        for chain, residue,atom in first_atoms:
+            atom_row = []
+            atom_row.append([atom])
+            for i in range(1,len(geo_atoms)):
+                best_atom,criteria = self.getBestAtoms(pobj, resno, chain, residue,atom, geo_atoms[i])
+                atom_row.append(best_atom)
+            atom_groups.append(atom_row)
+        # a dis criterion is checked against the value of the last tuple taken in the row, so those are calculated in turn
+        on_dis = any([crit.split("|")[0].lower() == "dis" for crit in criteria.split(",")])
+        rows = []
+        vals = [] if on_dis else None
+        for atoms in atom_groups:
+            if len(atoms) not in [2,3,4]:
+                continue
+            row = []
+            val = 0
+            for combo in itertools.product(*atoms):
+                num = len(combo)
+                if num > 2 and not all([atm.matchesCriteria(criteria,rids=[combo[j].res.rid for j in range(num) if j != i],dis=val) for i,atm in enumerate(combo)]):
+                    continue
+                row.append(combo)
+                if on_dis:
+                    val = self.calculateValue(combo,geo_type)
+                    vals.append(val)
+            rows.append(row)
+        return rows,vals
+
+    def finishGeometry(self,rows,vals):
+        # The rows of calculateOneGeometry from the selected tuples and their values
+        total_rid = 0
+        total_ridx = 0
+        nonempty_return = []
+        v = 0
+        for row in rows:
+            total_bfactor = 0
+            total_occupancy = 0
+            for combo in row:
+                num = len(combo)
+                val = vals[v]
+                v += 1
+                if num == 2:
+                    total_bfactor = 0
+                    total_occupancy = 0
+                # the totals run on over a residue's combinations of 3 and 4 atoms
+                info = self.infoAtoms(combo)
+                for atm in combo:
+                    total_bfactor += atm.bfactor
+                    total_occupancy  += atm.occupancy
+                total_occupancy = total_occupancy / num
+                total_bfactor = total_bfactor / num
+                rid2 = combo[1].res.rid
+                rid3 = combo[2].res.rid if num > 2 else 0
+                rid4 = combo[3].res.rid if num > 3 else 0
+                nonempty_return.append((val,total_bfactor,total_occupancy,total_rid,total_ridx,num,info,rid2,rid3,rid4))
+
+        return nonempty_return
+
+    def calculateValues(self, combos, geo_type):
+        # the distances, angles or dihedrals of the atom tuples, or the max, min or sum of their distances
+        if len(combos) == 0:
+            return []
+        num = len(combos[0])
+        if len(combos) < 8:
+            # a few tuples are quicker without the arrays
+            return [self.calculateValue(combo,geo_type) for combo in combos]
+        coords = [np.array([(combo[i].x,combo[i].y,combo[i].z) for combo in combos],dtype=float) for i in range(num)]
+        if num == 2:
+            vals = calc.getDistances(coords[0],coords[1])
+        elif geo_type == "normal":
+            vals = calc.getAngles(*coords) if num == 3 else calc.getDihedrals(*coords)
+        elif geo_type in ["max","min","sum"]:
+            diss = [calc.getDistances(coords[i],coords[j]) for i,j in itertools.combinations(range(num),2)]
+            vals = diss[0]
+            for dis in diss[1:]:
+                if geo_type == "max":
+                    vals = np.maximum(vals,dis)
+                elif geo_type == "min":
+                    vals = np.minimum(vals,dis)
+                else:
+                    vals = vals + dis
+        else:
+            vals = np.zeros(len(combos))
+        return vals.tolist()
+
+    def calculateValue(self, combo, geo_type):
+        # calculateValues for one tuple from the scalar functions, with nan for an angle the arrays give nan for
+        if len(combo) == 2:
+            at0,at1 = combo
+            return calc.getDistance(at0.x, at0.y, at0.z,at1.x, at1.y, at1.z)
+        elif geo_type == "normal":
+            if len(combo) == 3:
+                at0,at1,at2 = combo
+                try:
+                    return calc.getAngle(at0.x, at0.y, at0.z,at1.x, at1.y, at1.z,at2.x, at2.y, at2.z)
+                except (ZeroDivisionError,ValueError):
+                    # a zero length or a rounding outside acos
+                    return float("nan")
+            at0,at1,at2,at3 = combo
+            return calc.getDihedral(at0.x, at0.y, at0.z,at1.x, at1.y, at1.z,at2.x, at2.y, at2.z,at3.x, at3.y, at3.z)
+        elif geo_type in ["max","min","sum"]:
+            diss = [calc.getDistance(ati.x, ati.y, ati.z,atj.x, atj.y, atj.z) for ati,atj in itertools.combinations(combo,2)]
+            if geo_type == "max":
+                return max(diss)
+            elif geo_type == "min":
+                return min(diss)
+            val = diss[0]
+            for dis in diss[1:]:
+                val = val + dis
+            return val
+        return 0
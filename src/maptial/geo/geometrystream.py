@@ -0,0 +1,107 @@
+"""
+RSA 19/10/26
+
+Geometry over a stream of structures, each is loaded when it is reached and let go once its rows are out,
+so only one structure and its rows are held at a time whatever the size of the survey.
+The rows come as a DataFrame per structure, which can be written batch by batch to a Parquet or Arrow IPC file
+(pyarrow is only needed for the writing).
+
+"""
+
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbobject as po
+from maptial.geo import pdbgeometry as pg
+
+def iter_structures(structures, directory="", cif=False, fast=True, cache=True, cache_key="mtime", failed=None):
+    # Yields the PdbObjects of an iterable of pdb codes or PdbObjects, loading each code as it is reached
+    #failed : list
+    #    if given the codes that could not be loaded are added to it
+    for struc in structures:
+        if isinstance(struc,po.PdbObject):
+            yield struc
+            continue
+        try:
+            pobj = pl.PdbLoader(struc,directory,cif=cif,fast=fast,cache=cache,cache_key=cache_key).load_pdb()
+        except Exception as e:
+            print("Error loading",struc,str(e))
+            if failed is not None:
+                failed.append(struc)
+            continue
+        yield pobj
+
+def iter_geometry(structures, geos, directory="", cif=False, fast=True, cache=True, cache_key="mtime", failed=None):
+    # Yields the GeometryMaker.calculateGeometry DataFrame of each structure in turn, see iter_structures
+    for pobj in iter_structures(structures,directory,cif,fast,cache,cache_key,failed):
+        yield pg.GeometryMaker([pobj]).calculateGeometry(geos)
+
+def iter_data(structures, directory="", cif=False, fast=True, cache=True, cache_key="mtime", failed=None):
+    # Yields the atom DataFrame of each structure in turn, see iter_structures
+    for pobj in iter_structures(structures,directory,cif,fast,cache,cache_key,failed):
+        yield pobj.dataFrame()
+
+def write_frames(frames, path, format="", schema=None, settle=10):
+    # Writes DataFrames to a Parquet or Arrow IPC file a batch at a time as they come, returns the number of rows.
+    # Every DataFrame is cast to one schema, nothing is written if there are no rows.
+    #format : str
+    #    parquet or arrow, from the extension of the path if not given (.parquet is parquet, anything else arrow)
+    #schema : pyarrow.Schema = None
+    #    If not given it is settled from the first settle DataFrames with rows, which are held back until then.
+    #    Their types are unified, so an int column that meets a float one is float, and a column of only None is float.
+    #    A later DataFrame that does not fit raises a ValueError, the schema should be given for surveys that vary more.
+    import pyarrow as pa
+    if format == "":
+        format = "parquet" if path.endswith(".parquet") else "arrow"
+    writer = None
+    pending = []
+    rows = 0
+    try:
+        for df in frames:
+            if len(df) == 0:
+                continue
+            pending.append(pa.Table.from_pandas(df,preserve_index=False))
+            if schema is None:
+                if len(pending) < settle:
+                    continue
+                schema = _settle_schema(pending)
+            if writer is None:
+                writer = _open_writer(path,format,schema)
+            for table in pending:
+                writer.write_table(_cast_table(table,schema))
+                rows += len(table)
+            pending = []
+        if len(pending) > 0:
+            # too few to settle the schema before the end
+            schema = _settle_schema(pending)
+            writer = _open_writer(path,format,schema)
+            for table in pending:
+                writer.write_table(_cast_table(table,schema))
+                rows += len(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+def _settle_schema(tables):
+    import pyarrow as pa
+    schema = pa.unify_schemas([table.schema for table in tables],promote_options="permissive")
+    for i,field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i,field.with_type(pa.float64()))
+    # the pandas metadata is that of the first DataFrame, which may have had other types
+    return schema.remove_metadata()
+
+def _open_writer(path, format, schema):
+    import pyarrow as pa
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(path,schema)
+    return pa.ipc.new_file(path,schema)
+
+def _cast_table(table, schema):
+    import pyarrow as pa
+    if sorted(table.schema.names) != sorted(schema.names):
+        raise ValueError("A DataFrame has other columns than the schema: " + str(table.schema.names))
+    try:
+        return table.select(schema.names).cast(schema)
+    except pa.ArrowInvalid as e:
+        raise ValueError("A DataFrame does not fit the schema settled from the first ones, give write_frames a schema: " + str(e))
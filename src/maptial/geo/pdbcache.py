@@ -0,0 +1,81 @@
+"""
+RSA 19/10/26
+
+A binary cache of parsed structures, an .npz of the columnar AtomTable with the header and metadata,
+written next to the pdb or cif file it was read from (6eex.pdb is cached as 6eex.pdb.npz).
+It is keyed on the size and modification time of that file, or on a hash of its contents,
+so a file that has changed is parsed again.
+
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from maptial.geo import pdbtable as ptable
+from maptial.geo import pdbobject as po
+
+# bumped if what is cached changes, older caches are then ignored
+CACHE_VERSION = 1
+
+def get_cache_path(source_path):
+    return source_path + ".npz"
+
+def get_source_key(source_path, key="mtime"):
+    #key : str = mtime
+    #    mtime for the file size and modification time, hash for a sha1 of the contents
+    if key == "hash":
+        sha = hashlib.sha1()
+        with open(source_path,"rb") as fr:
+            for block in iter(lambda: fr.read(1 << 20),b""):
+                sha.update(block)
+        return {"version":CACHE_VERSION,"hash":sha.hexdigest()}
+    stat = os.stat(source_path)
+    return {"version":CACHE_VERSION,"size":stat.st_size,"mtime_ns":stat.st_mtime_ns}
+
+def save_pobj(pobj, source_path, key="mtime"):
+    # writes the cache of a PdbObject read from source_path, returns the cache path
+    table = pobj.get_table()
+    arrays = {"coords":table.coords,"order":table.order}
+    for col in ptable.CODED:
+        arrays["names_" + col] = np.array(table.names[col],dtype=str)
+        arrays["codes_" + col] = table.codes[col]
+    for col in ptable.NUMERIC:
+        arrays["col_" + col] = table.columns[col]
+    info = {"key":get_source_key(source_path,key),"resolution":pobj.resolution,"exp_method":pobj.exp_method,
+            "metadata":pobj.metadata,"chains":list(pobj.chains.keys())}
+    arrays["info"] = np.array(json.dumps(info))
+    # written to the side and moved into place so a reader never sees half a file
+    path = get_cache_path(source_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path,"wb") as fw:
+        np.savez(fw,**arrays)
+    os.replace(tmp_path,path)
+    return path
+
+def load_pobj(pdb_code, source_path, key="mtime"):
+    # A PdbObject from the cache of source_path, None if there is no cache or the source has changed since
+    path = get_cache_path(source_path)
+    if not os.path.exists(path) or not os.path.exists(source_path):
+        return None
+    try:
+        with np.load(path,allow_pickle=False) as npz:
+            info = json.loads(str(npz["info"]))
+            if info["key"] != get_source_key(source_path,key):
+                return None
+            table = ptable.AtomTable(pdb_code,info["resolution"])
+            table.coords = npz["coords"]
+            table.order = npz["order"]
+            for col in ptable.CODED:
+                table.names[col] = list(npz["names_" + col])
+                table.codes[col] = npz["codes_" + col]
+            for col in ptable.NUMERIC:
+                table.columns[col] = npz["col_" + col]
+    except Exception as e:
+        print("Error loading cache",path,str(e))
+        return None
+    pobj = po.PdbObject(pdb_code)
+    pobj.exp_method = info["exp_method"]
+    pobj.metadata = info["metadata"]
+    pobj.add_table(table,info["chains"])
+    return pobj
@@ -10,13 +10,15 @@ def ret_get():
     return "leucippy"
 
 from operator import itemgetter
+import numpy as np
 import pandas as pd
 from maptial.geo import pdbobject as po
-from maptial.geo import geocalculator as calc
+from maptial.geo import pdbspace as pspace
+from maptial.geo import geometryrows as gr
 from maptial.xyz import vectorthree as v3
 
 
-class GeometryMaker:
+class GeometryMaker(gr.GeometryRows):
     def __init__(self,pobjs,log=0,exc_hetatm=True):
         """Initialises a GeoDataFrame with the list of biopython structures
 
@@ -34,7 +36,6 @@ class GeometryMaker:
         #:param hues:A list of hues hat will associate with the geoemtric values, can be bfactor, amino acid (aa), residue number (rid) etc see docs
         #:returns: the pandas dataframe with a r per geoemtric calculation per residue wh columns of geoemtric measures and hues
         
-        print("HERE")
         geo2 = ["val","blob"]
         vals = []
         hues=['pdb_code','resolution','aa','chain','rid']#,'rid2','rid3','rid4']
@@ -45,6 +46,7 @@ class GeometryMaker:
                 count += 1
 
             hue_res = geopdb.resolution
+            geo_rets = self.calculateGeometries(geopdb,geos,log)
             ridx = 1
             for chain, res in geopdb.chains.items():                
                 for rid, resd in res.items():                    
@@ -52,22 +54,9 @@ class GeometryMaker:
                     geo_cols = {}
                     geo_col = -1
                     for geo in geos:
-                        # we can ask for a maxdis or mindis instead of the angle or dihedral
-                        geo_kind="normal"
-                        if geo[:7].upper() == "MAXDIS|":
-                            geo_kind = "max"
-                            geo = geo[7:]
-                        elif geo[:7].upper() == "MINDIS|":
-                            geo_kind = "min"
-                            geo = geo[7:]
-                        elif geo[:7].upper() == "SUMDIS|":  
-                            geo_kind = "sum"
-                            geo = geo[7:]
-                            
                         geo_col += 1
                         geo_cols[geo_col] = []
-                        geo_as_atoms = self.geoToAtoms(geo)                        
-                        ret = self.calculateOneGeometry(geopdb,chain,rid,geo_as_atoms,geo_kind,log)
+                        ret = geo_rets[geo_col][(chain,rid)]
                         for row in ret:#we will need to cross product each of the matches against all others                                                        
                             if self.log > 1:
                                 print("leuci-geo(2)",row)
@@ -207,7 +196,6 @@ class GeometryMaker:
             geos2.append("rid4_" + geo)
         
         df = pd.DataFrame(vals,columns=geos2)
-        print(geos2)
         return df
 
     def geoToAtoms(self, geo):
@@ -262,165 +250,40 @@ class GeometryMaker:
     
     
     ###### MODICFIED VERSION ########
-    def calculateOneGeometry(self,pobj, chain, resno, geo_atoms,geo_type,log=0):
-        """Creates the geoemtry from the structure in the class for 1 geo
-
-        :param chain: The chain id
-        :param rid: The residue number
-        :param geo_atoms: A list of tuples that is the atom, the displacement
-
-        :returns: [bool,float,bfactor, occupancy, atoms, GeoAtom] a bool for if it could be calculated, and the value, and the reference atom
-        """
-        
-        total_rid = 0
-        total_ridx = 0
-        rid2,rid3,rid4 = 0,0,0
-        
-        nonempty_return = []
-        
-        atoms = []
-        atom_groups = []
-
-        first_atoms = self.getMatchingStartAtoms(pobj, chain, resno,geo_atoms[0])        
-        #print(len(first_atoms))                
-        for chain, residue,atom in first_atoms:
-            atom_row = []
-            atom_row.append([atom])            
-            #print("FIRST ATOM=",chain,residue,atom)
-            for i in range(1,len(geo_atoms)):                
-                candidate_atoms, nearest,criteria = self.getMatchingAtoms(pobj, resno, chain, residue,atom, geo_atoms[i])
-                #candidate_atoms = self.applyCriteria()
-                if len(candidate_atoms) > 0:
-                    best_atom = self.getNearestAtomMatch(pobj, atom, candidate_atoms, nearest,criteria)
-                    #for chain_m, residue_m,atom_m in candidate_atoms:
-                    #    print("CANDIDATE=",chain_m, residue_m,atom_m)
-                                        
-                    if len(best_atom) > 1:                        
-                        atom_row.append(best_atom)
-                    elif len(best_atom) == 1:
-                        atom_row.append(best_atom)
-                    else:
-                        atom_row.append([])
-                else:
-                    atom_row.append([])
-            atom_groups.append(atom_row)
-                
-        
+    def calculateGeometries(self,pobj,geos,log=0):
+        # The calculateOneGeometry rows of each geo keyed on (chain, rid), the atoms of all the residues are selected
+        # first so that each geo's values are calculated in one call
+        geo_rets = []
+        for geo in geos:
+            # we can ask for a maxdis or mindis instead of the angle or dihedral
+            geo_kind="normal"
+            if geo[:7].upper() == "MAXDIS|":
+                geo_kind = "max"
+                geo = geo[7:]
+            elif geo[:7].upper() == "MINDIS|":
+                geo_kind = "min"
+                geo = geo[7:]
+            elif geo[:7].upper() == "SUMDIS|":  
+                geo_kind = "sum"
+                geo = geo[7:]
+            geo_as_atoms = self.geoToAtoms(geo)
+            selected = {}
+            for chain, res in pobj.chains.items():
+                for rid in res:
+                    selected[(chain,rid)] = self.selectAtoms(pobj,chain,rid,geo_as_atoms,geo_kind)
+            # the values not already calculated for the criteria, all together
+            vals = self.calculateValues([combo for rows,row_vals in selected.values() if row_vals is None for row in rows for combo in row],geo_kind)
+            rets = {}
+            v = 0
+            for key,(rows,row_vals) in selected.items():
+                if row_vals is None:
+                    num = sum([len(row) for row in rows])
+                    row_vals = vals[v:v + num]
+                    v += num
+                rets[key] = self.finishGeometry(rows,row_vals)
+            geo_rets.append(rets)
+        return geo_rets
 
-        
-        
-        for atoms in atom_groups:
-            ats0, ats1,ats2,ats3 = [],[],[],[]
-            if len(atoms) >= 2:
-                ats0 = atoms[0]
-                ats1 = atoms[1]
-            if len(atoms) >= 3:
-                ats2 = atoms[2]                
-            if len(atoms) >= 4:
-                ats3 = atoms[3]                            
-            val = 0
-            total_bfactor = 0                
-            total_occupancy = 0
-            if len(atoms) in [2,3,4]:                                
-                if len(atoms) == 2:  
-                    for at0 in ats0:
-                        for at1 in ats1:
-                            #print(at0,at1)
-                            val = calc.getDistance(at0.x, at0.y, at0.z,at1.x, at1.y, at1.z)
-                            #print(chain,at0.res.rid,at0.x, at0.y, at0.z)
-                            #print(chain,at1.res.rid,at1.x, at1.y, at1.z)
-                            total_bfactor = 0                
-                            total_occupancy = 0
-                            info = self.infoAtoms([at0,at1])
-                            for atm in [at0,at1]:
-                                total_bfactor += atm.bfactor
-                                total_occupancy  += atm.occupancy
-                            total_occupancy = total_occupancy / 2
-                            total_bfactor = total_bfactor / 2
-                            rid2 = at1.res.rid
-                            rid3 = 0
-                            rid4 = 0
-                            nonempty_return.append((val,total_bfactor,total_occupancy,total_rid,total_ridx,len(atoms),info,rid2,rid3,rid4))
-                
-                elif len(atoms) == 3:
-                    for at0 in ats0:
-                        for at1 in ats1:
-                            for at2 in ats2:
-                                if at0.matchesCriteria(criteria,rids=[at1.res.rid,at2.res.rid],dis=val):
-                                    if at1.matchesCriteria(criteria,rids=[at0.res.rid,at2.res.rid],dis=val):
-                                        if at2.matchesCriteria(criteria,rids=[at1.res.rid,at0.res.rid],dis=val):
-                                            val = 0
-                                            if geo_type == "normal":
-                                                val = calc.getAngle(at0.x, at0.y, at0.z,
-                                                                    at1.x, at1.y, at1.z,
-                                                                    at2.x, at2.y, at2.z)
-                                            elif geo_type in ["max","min","sum"]:
-                                                vala = calc.getDistance(at0.x, at0.y, at0.z,at1.x, at1.y, at1.z)
-                                                valb = calc.getDistance(at0.x, at0.y, at0.z,at2.x, at2.y, at2.z)
-                                                valc = calc.getDistance(at1.x, at1.y, at1.z,at2.x, at2.y, at2.z)
-                                                if geo_type == "max":
-                                                    val = max(vala,valb,valc)
-                                                elif geo_type == "min":
-                                                    val = min(vala,valb,valc)
-                                                elif geo_type == "sum":
-                                                    val = vala + valb + valc
-
-                                            info = self.infoAtoms([at0,at1,at2])
-                                            for atm in [at0,at1,at2]:
-                                                total_bfactor += atm.bfactor
-                                                total_occupancy  += atm.occupancy
-                                            total_occupancy = total_occupancy / 3
-                                            total_bfactor = total_bfactor / 3
-                                            rid2 = at1.res.rid
-                                            rid3 = at2.res.rid
-                                            rid4 = 0
-                                            nonempty_return.append((val,total_bfactor,total_occupancy,total_rid,total_ridx,len(atoms),info,rid2,rid3,rid4))
-                
-                elif len(atoms) == 4:
-                    for at0 in ats0:
-                        for at1 in ats1:
-                            for at2 in ats2:
-                                for at3 in ats3:
-                                    if at0.matchesCriteria(criteria,rids=[at1.res.rid,at2.res.rid,at3.res.rid],dis=val):
-                                        if at1.matchesCriteria(criteria,rids=[at0.res.rid,at2.res.rid,at3.res.rid],dis=val):
-                                            if at2.matchesCriteria(criteria,rids=[at1.res.rid,at0.res.rid,at3.res.rid],dis=val):
-                                                if at3.matchesCriteria(criteria,rids=[at1.res.rid,at2.res.rid,at0.res.rid],dis=val):
-                                                    val = 0
-                                                    info = self.infoAtoms([at0,at1,at2,at3])
-                                                    if geo_type == "normal":
-                                                        val = calc.getDihedral(at0.x, at0.y, at0.z,
-                                                                            at1.x, at1.y, at1.z,
-                                                                            at2.x, at2.y, at2.z,
-                                                                            at3.x, at3.y, at3.z)
-                                                    elif geo_type in ["max","min","sum"]:
-                                                        vala = calc.getDistance(at0.x, at0.y, at0.z,at1.x, at1.y, at1.z)
-                                                        valb = calc.getDistance(at0.x, at0.y, at0.z,at2.x, at2.y, at2.z)
-                                                        valc = calc.getDistance(at0.x, at0.y, at0.z,at3.x, at3.y, at3.z)
-                                                        vald = calc.getDistance(at1.x, at1.y, at1.z,at2.x, at2.y, at2.z)
-                                                        vale = calc.getDistance(at1.x, at1.y, at1.z,at3.x, at3.y, at3.z)
-                                                        valf = calc.getDistance(at2.x, at2.y, at2.z,at3.x, at3.y, at3.z)
-                                                        if geo_type == "max":
-                                                            val = max(vala,valb,valc,vald,vale,valf)
-                                                        elif geo_type == "min":
-                                                            val = min(vala,valb,valc,vald,vale,valf)
-                                                        elif geo_type == "sum":
-                                                            val = vala + valb + valc + vald+ vale + valf
-
-                                                        
-                                                    for atm in [at0,at1,at2,at3]:
-                                                        total_bfactor += atm.bfactor
-                                                        total_occupancy  += atm.occupancy
-                                                    total_occupancy = total_occupancy / 4
-                                                    total_bfactor = total_bfactor / 4                                                                
-                                                    rid2 = at1.res.rid
-                                                    rid3 = at2.res.rid
-                                                    rid4 = at3.res.rid
-                                                    nonempty_return.append((val,total_bfactor,total_occupancy,total_rid,total_ridx,len(atoms),info,rid2,rid3,rid4))
-            
-        return nonempty_return
-        
-        
-    
     def getMatchingStartAtoms(self,pobj, chain, resno,geo_atom):
         
         atom_starts = []
@@ -452,24 +315,20 @@ class GeometryMaker:
                 atom_name = geo_a
             res_match = resno + geo_atom[1]
             
-            for ch,resdic in pobj.chains.items():
-                if ch == chain:
-                    for no,res in resdic.items():
-                        if res.rid == res_match:
-                            for attype,atm in res.atoms.items():
-                                if atm.matchesCriteria(criteria):
-                                    if atom_type != "" and atm.atom_type == atom_type:
-                                        atom_starts.append((chain,res,atm))
-                                    elif atom_name != "" and atm.atom_name == atom_name:
-                                        atom_starts.append((chain,res,atm))
-                            break
+            res = pobj.get_residue(chain,res_match)
+            if res is not None:
+                for attype,atm in res.atoms.items():
+                    if atm.matchesCriteria(criteria):
+                        if atom_type != "" and atm.atom_type == atom_type:
+                            atom_starts.append((chain,res,atm))
+                        elif atom_name != "" and atm.atom_name == atom_name:
+                            atom_starts.append((chain,res,atm))
         
         return atom_starts
     
-    def getMatchingAtoms(self,pobj, resno,chain, res,atom, geo_atom):
-        
+    def parseGeoAtom(self, geo_atom):
+        # (atom_list, element, need_same_residue, nearest, farthest, criteria) of a geo atom after the first
         need_same_residue = True
-        atom_matches = []
         criteria = ""
         element = False 
 
@@ -513,7 +372,11 @@ class GeometryMaker:
             atom_list = atom_list.split(",")
         else:
             atom_list = [geo_atom[0]]
-        
+        return atom_list,element,need_same_residue,nearest,farthest,criteria
+
+    def getMatchingAtoms(self,pobj, resno,chain, res,atom, geo_atom):
+        atom_list,element,need_same_residue,nearest,farthest,criteria = self.parseGeoAtom(geo_atom)
+        atom_matches = []
         for geo_a in atom_list:
             atom_type = ""
             atom_name = ""
@@ -524,19 +387,56 @@ class GeometryMaker:
             
             res_match = resno + geo_atom[1]
             
-            for thischain,resdic in pobj.chains.items():
-                if thischain == chain: #must be the same chain
-                    for no,res in resdic.items():
-                        if need_same_residue and res.rid == res_match or not need_same_residue:
-                            if farthest == 0 or (farthest > 0 and abs(res.rid-res_match) >= farthest):
-                                for attype,atm in res.atoms.items():
-                                    if atom_type != "" and atm.atom_type == atom_type:
-                                        atom_matches.append(atm)                                    
-                                    elif atom_name != "" and atm.atom_name == atom_name:
-                                        atom_matches.append(atm)
+            # must be the same chain, the candidates come from the residue or the chain's atom indexes
+            if need_same_residue:
+                res = pobj.get_residue(chain,res_match)
+                candidates = []
+                if res is not None and atom_name in res.atoms:
+                    candidates = [res.atoms[atom_name]]
+            else:
+                candidates = pobj.get_chain_atoms(chain,atom_name,atom_type)
+            for atm in candidates:
+                if farthest == 0 or (farthest > 0 and abs(atm.res.rid-res_match) >= farthest):
+                    atom_matches.append(atm)
                                                 
         return atom_matches, nearest,criteria
 
+    def getBestAtoms(self,pobj, resno,chain, res,atom, geo_atom):
+        # The matched atoms of a geo atom after the first, and its criteria.
+        # Atoms in the same residue are looked up directly, the nearest atoms from the chain's AtomSpaces
+        atom_list,element,need_same_residue,nearest,farthest,criteria = self.parseGeoAtom(geo_atom)
+        if need_same_residue:
+            candidate_atoms, nearest,criteria = self.getMatchingAtoms(pobj, resno, chain, res,atom, geo_atom)
+            if len(candidate_atoms) == 0:
+                return [],criteria
+            return self.getNearestAtomMatch(pobj, atom, candidate_atoms, nearest,criteria),criteria
+        res_match = resno + geo_atom[1]
+        spaces,keeps = [],[]
+        for geo_a in atom_list:
+            if element:
+                space = pobj.get_atom_space(chain,element=geo_a)
+            else:
+                space = pobj.get_atom_space(chain,atom_name=geo_a)
+            # matchesCriteria excludes the disordered atoms
+            keep = ~space.disordered
+            if farthest != 0:
+                keep &= (farthest > 0) & (np.abs(space.rids - res_match) >= farthest)
+            spaces.append(space)
+            keeps.append(keep)
+        # in order of distance and then of the candidates, as the stable sort in getNearestAtomMatch
+        k = max([len(space) for space in spaces]) if int(nearest) == -1 else 2*int(nearest) + 8
+        rids = [atom.res.rid]
+        matches = []
+        for dis,si,i in pspace.iter_nearest(spaces,(atom.x,atom.y,atom.z),keeps,k=k):
+            atom_m = spaces[si].atoms[i]
+            if atom_m.matchesCriteria(criteria,rids=rids,dis=dis):
+                matches.append(atom_m)
+                if int(nearest) != -1 and len(matches) > int(nearest):
+                    return [matches[int(nearest)]],criteria
+        if int(nearest) == -1:
+            return matches,criteria
+        return [],criteria
+
     def getNearestAtomMatch(self, pobj, atom, candidate_atoms, nearest,criteria):             
         disses = []
         va = v3.VectorThree(float(atom.x),float(atom.y),float(atom.z))
@@ -572,53 +472,37 @@ class GeometryMaker:
     def getNearestAtom(self,pobj,refatm, ref_rid,ref_chain,atmtypes,resmax,nearest,log=0,elements=False):
         if log > 1:
             print('leuci-geo(2) nearest:',atmtypes,"within res num=",resmax,"nearest=",nearest)
-        dic_res = {}
-        last_dis = 10000
+        if int(nearest) < 1:
+            return 0, "", ""
+        space = pobj.get_atom_space()
+        inlist = np.zeros(len(space.names),dtype=bool)
+        for n,attype in enumerate(space.names):
+            if elements:
+                if attype[:1] in atmtypes:
+                    inlist[n]=True
+                elif len(attype) > 1:
+                    if attype[:2] in atmtypes:
+                        inlist[n] = True
+            else:
+                if attype in atmtypes:
+                    inlist[n]=True
+        keep = inlist[space.name_codes] & ((np.abs(space.rids - int(ref_rid)) >= int(resmax)) | (space.chains != ref_chain))
+        # the nearest-th distinct distance, of equal distances the last atom in the chains is taken
+        count = 0
+        last_dis = None
         last_atom = None
-        other = ''
-        for chain,resdic in pobj.chains.items():
-            for no,res in resdic.items():
-                for attype,atm in res.atoms.items():
-                    inlist = False
-                    if elements:
-                        if attype[:1] in atmtypes:
-                            inlist=True
-                        elif len(attype) > 1:
-                            if attype[:2] in atmtypes:
-                                inlist = True
-                    else:
-                        if attype in atmtypes:
-                            inlist=True
-                    if inlist:
-                        distance = calc.getDistance(refatm.x, refatm.y,refatm.z,atm.x,atm.y,atm.z)
-                        if (abs(int(no) - int(ref_rid)) >= int(resmax) or ref_chain != chain):
-                            other = str(res.amino_acid) + "|" + str(no) + str(chain) + "|" + atm.atom_name
-                            dic_res[distance] = [atm,other]
-                            if log > 2:
-                                print("leuci-geo(3) to dictionary", other)
-
-                        #    last_dis = distance
-                        #    last_atom = atm
-
-
-        count = 1
-        sorted_dic = dict(sorted(dic_res.items()))
-        found = False
-        for dis,st in sorted_dic.items():
-            if log > 2:
-                print("leuci-geo(3) nearest", count,nearest,round(dis,4),st[0].atom_name)
-            if int(count) == int(nearest):
+        for dis,si,i in pspace.iter_nearest([space],(refatm.x,refatm.y,refatm.z),[keep],k=2*int(nearest) + 8):
+            if dis != last_dis:
+                if count == int(nearest):
+                    break
+                count += 1
                 last_dis = dis
-                last_atom = st[0]
-                other = st[1]
-                found = True
-                if log > 3:
-                    print("...leuci-geo(4) found")
-                break
-            count +=1
-
-        if found:
-            #print("...LeucipPy return",last_dis,other)
+            last_atom = space.atoms[i]
+            if log > 2:
+                print("leuci-geo(3) nearest", count,nearest,round(dis,4),last_atom.atom_name)
+        if count == int(nearest):
+            res = last_atom.res
+            other = str(res.amino_acid) + "|" + str(res.rid) + str(last_atom.chain) + "|" + last_atom.atom_name
             return last_dis,last_atom,other
         else:
             return 0, "", ""
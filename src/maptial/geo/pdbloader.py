@@ -10,13 +10,19 @@ from Bio import BiopythonWarning
 warnings.simplefilter('ignore', BiopythonWarning)
 
 from maptial.geo import pdbobject as po
+from maptial.geo import pdbreader as prd
+from maptial.geo import pdbcache as pcache
 
 """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 class PdbLoader(object):
-    def __init__(self, pdb_code, directory="", cif=False,source="ebi"):        
+    def __init__(self, pdb_code, directory="", cif=False,source="ebi",fast=False,cache=True,cache_key="mtime"):        
         self.pdb_code = pdb_code
         self.directory = directory        
         self.cif = cif
+        self.fast = fast # read the coordinates with pdbreader rather than Biopython, falling back if it can't
+        self.cache = cache # keep the parsed structure in an .npz next to the file, see pdbcache
+        self.cache_key = cache_key # mtime or hash
+        self.source_filepath = "" # the file the structure was read from
         self.pobj = po.PdbObject(pdb_code)                
         if source == "ebi":
             self.cif_filepath = f"{directory}{pdb_code}.cif"
@@ -53,11 +59,27 @@ class PdbLoader(object):
         return True
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
     def load_pdb(self):
+        if self.cache and self.load_cache():
+            return self.pobj
+        if not (self.fast and self.load_pdb_fast()):
+            self.load_pdb_bio()
+        if self.cache:
+            try:
+                pcache.save_pobj(self.pobj,self.source_filepath,self.cache_key)
+            except Exception as e:
+                print("Error saving cache", str(e))
+        return self.pobj
+    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
+    def load_pdb_bio(self):
         loaded = False
         if self.cif:
             try:
                 self.download_pdb(cif=True)
-                structure = MMCIFParser().get_structure(self.pdb_code, self.cif_filepath)            
+                parser = MMCIFParser()
+                structure = parser.get_structure(self.pdb_code, self.cif_filepath)            
+                # the parser keeps the whole mmcif dictionary so the metadata comes from the same read
+                self.pobj.metadata = prd.read_cif_metadata(parser._mmcif_dict)
+                self.source_filepath = self.cif_filepath
                 loaded = True
             except Exception as e:                              
                 print("Error loading cif file", str(e))
@@ -65,7 +87,52 @@ class PdbLoader(object):
         if not loaded:
             self.download_pdb(cif=False)            
             structure = PDBParser(PERMISSIVE=True).get_structure(self.pdb_code, self.pdb_filepath)                                        
+            self.pobj.metadata = prd.read_pdb_metadata(prd.read_pdb_head(self.pdb_filepath),structure.header)
+            self.source_filepath = self.pdb_filepath
         self.pobj.add_atoms(structure)          
         #print(structure.header)
         return self.pobj
-    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
\ No newline at end of file
+    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
+    def load_pdb_fast(self):
+        # the coordinates straight from the file, False if it needs Biopython
+        try:
+            if self.cif:
+                self.download_pdb(cif=True)
+                struc = prd.read_cif(self.cif_filepath)
+            else:
+                self.download_pdb(cif=False)
+                struc = prd.read_pdb(self.pdb_filepath)
+        except (prd.ReaderFallback,OSError):
+            return False
+        self.source_filepath = self.cif_filepath if self.cif else self.pdb_filepath
+        self.pobj.bio_struc = None
+        self.pobj.metadata = struc.metadata
+        self.pobj.add_models(struc.header,struc.models)
+        return True
+    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
+    def load_cache(self):
+        # the structure from its cache if that is there and up to date
+        # a cif that could not be read fell back to the pdb file, so the cache of that is tried too
+        self.download_pdb(cif=self.cif)
+        filepaths = [self.cif_filepath,self.pdb_filepath] if self.cif else [self.pdb_filepath]
+        for filepath in filepaths:
+            pobj = pcache.load_pobj(self.pdb_code,filepath,self.cache_key)
+            if pobj is not None:
+                self.pobj = pobj
+                self.source_filepath = filepath
+                return True
+        return False
+    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
+
+def warm_cache(pdb_codes, directory, cif=False, fast=True, cache_key="mtime", log_level=0):
+    # parses and caches each structure that is not cached already or has changed, returns the codes that failed
+    failed = []
+    for pdb_code in pdb_codes:
+        try:
+            PdbLoader(pdb_code,directory,cif=cif,fast=fast,cache=True,cache_key=cache_key).load_pdb()
+            if log_level > 0:
+                print("cached",pdb_code)
+        except Exception as e:
+            print("Error caching",pdb_code,str(e))
+            failed.append(pdb_code)
+    return failed
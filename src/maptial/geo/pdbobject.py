@@ -5,7 +5,9 @@ https://pynative.com/make-python-class-json-serializable/#:~:text=Use%20toJSON()
 """
 
 from maptial.xyz import vectorthree as v3
-import pandas as pd
+from maptial.geo import pdbspace as pspace
+from maptial.geo import pdbtable as ptable
+import numpy as np
 import json
 
 amino_acids = ["ala","arg","asn","asp","cys","gln","glu","gly","his","ile","leu","lys","met","phe","pro","ser","thr","trp","tyr","val"]
@@ -15,41 +17,80 @@ class PdbObject(object):
         self.pdb_code = pdb_code
         self.resolution = -1
         self.exp_method = ""
+        self.metadata = {} # exp_method, resolution and em_code as MapLoader needs them, read with the structure
         self.chains = {}
         self.exc_hetatm = False
-        self.lines = []
+        # PRIVATE INTERFACE
+        # the atoms are held in the columnar AtomTable, the line dicts of lines are only made if it is used,
+        # after which the table is made from them so they can be edited in place
+        self._lines = None
+        self._added = [] # the lines added since the table was made while there are no line dicts, as LINE_COLUMNS tuples
+        # the indexes below are rebuilt when next needed once the version has moved on from the one they were made at,
+        # add_line_string moves it and so does invalidate, which must be called after editing lines or chains directly
+        self._version = 0
+        self._space = None # the spatial index of lines
+        self._space_version = -1
+        self._keys = {} # (chain, rid, atom, version) to the index of the first line with it
+        self._keys_version = 0
+        self._table = None # the columnar AtomTable of lines and chains
+        self._table_version = -1
+        self._atom_index = None # (chain, atom name) and (chain, element) to the PdbAtoms in chain order
+        self._atom_index_version = -1
+        self._atom_spaces = {} # AtomSpaces over the atom index, cleared with it
               
     def __str__(self):
         return f"{self.pdb_code}\t{self.resolution}\t{self.exp_method}"
     
-    def lines(self,atoms=False):
-        lines = []
-        for chain,resdic in self.chains.items():
-            for no,res in resdic.items():                
-                lines.append(chain + "\t" + str(res))
-                for attype,atm in res.atoms.items():
-                    if atoms:
-                        lines.append(atm)
-        return lines
-                                
+    @property
+    def lines(self):
+        # the atoms as a list of dicts, made from the table the first time they are wanted
+        if self._lines is None:
+            keys = [key for key,col in ptable.LINE_COLUMNS]
+            lines = [] if self._table is None else self._table.get_lines()
+            self._lines = lines + [dict(zip(keys,line)) for line in self._added]
+            self._added = []
+        return self._lines
+
+    @lines.setter
+    def lines(self,lines):
+        self._lines = lines
+        self._added = []
+
     def add_atoms(self,bio_struc):
         self.bio_struc = bio_struc
-        self.resolution = self.bio_struc.header['resolution']        
-        self.exp_method = self.bio_struc.header["structure_method"]                
-        atomNo = 0
-        ridx = 0
-        last_bad = ""
+        models = []
         for model in self.bio_struc:
+            chains = {}
             for chain in model:
-                self.chains[chain.id] = {} ####  a chain is a dictionary of residue number to GeoResidue ############################################################
+                chains[chain.id] = []
                 for residue in chain:
-                    aa = residue.get_resname()
-                    rid = residue.get_full_id()[3][1]                    
+                    hetatm,rid,mutation = residue.get_full_id()[3]
+                    atoms = []
+                    for atom in residue:
+                        disordered = atom.is_disordered()
+                        if disordered and atom.disordered_has_id("A"):
+                            atom.disordered_select("A")
+                        vec = atom.get_vector()
+                        atoms.append((atom.get_name(),atom.get_full_id()[4][1],vec[0],vec[1],vec[2],atom.get_occupancy(),atom.get_bfactor(),disordered))
+                    chains[chain.id].append((hetatm,rid,mutation,residue.get_resname(),atoms))
+            models.append(chains)
+        self.add_models(self.bio_struc.header,models)
+
+    def add_models(self,header,models):
+        # header : dict with the resolution and structure_method
+        # models : a list per model of chain to a list of residues (hetatm, rid, insertion code, aa, atoms)
+        #          with atoms (name, altloc, x, y, z, occupancy, bfactor, disordered), as from a Biopython structure or pdbreader
+        self.resolution = header['resolution']        
+        self.exp_method = header["structure_method"]                
+        atomNo = 0
+        ridx = 0
+        last_bad = ""
+        for model in models:
+            for chain,residues in model.items():
+                self.chains[chain] = {} ####  a chain is a dictionary of residue number to GeoResidue ############################################################
+                for hetatm,rid,mutation,aa,atoms in residues:
                     resd = PdbResidue(aa,rid,ridx)
-                    chain = residue.get_full_id()[2]                    
-                    hetatm = residue.get_full_id()[3][0]
-                    aah = residue.get_full_id()
-                    mutation = aah[3][2] #these are alternative conformations where mutations could occur do not add
+                    #mutation: these are alternative conformations where mutations could occur do not add
                     # in fact remove any that area lready there
                     if mutation.strip() != "":
                         #self.chains[chain][rid] = resd
@@ -75,31 +116,53 @@ class PdbObject(object):
                                     # only proceed if we explicitly want hetatms                        
                                     ridx = ridx + 1
 
-                                    for atom in residue:
+                                    for atom_name,occupant,x,y,z,occupancy,bfactor,is_disordered in atoms:
                                         disordered = 'N'
-                                        if atom.is_disordered():
+                                        if is_disordered:
                                             disordered = 'Y'
-                                            if atom.disordered_has_id("A"):
-                                                atom.disordered_select("A")
-                                        if atom.get_occupancy() == None:
+                                        if occupancy is None:
                                             disordered = 'Y'
-                                        elif atom.get_occupancy() < 1:
+                                        elif occupancy < 1:
                                             disordered = 'Y'
                                         atomNo += 1
-                                        atom_name = atom.get_name()
-                                        occupant = atom.get_full_id()[4][1]
                                         if occupant == ' ':
                                             occupant = 'A'
-                                        x = atom.get_vector()[0]
-                                        y = atom.get_vector()[1]
-                                        z = atom.get_vector()[2]
-                                        bfactor = atom.get_bfactor()
-                                        occupancy = atom.get_occupancy()
                                         one_atom = PdbAtom(chain,resd,atom_name[0],atom_name,atomNo,disordered,occupancy,bfactor,x,y,z)
                                         self.add_line_string(atomNo, rid, aa, atom_name, chain, occupant, x, y, z, occupancy, bfactor, atom_name[0])
                                         resd.atoms[atom_name] = one_atom
                                     self.chains[chain][rid] = resd
                                     last_bad = ""
+        self.invalidate()
+        self.get_table()
+        self.get_space()
+
+    def add_table(self,table,chain_names):
+        # the atoms of an AtomTable, as saved by pdbcache, with the chains rebuilt from it, the chain names in their order
+        self.bio_struc = None
+        self.resolution = table.resolution
+        for chain in chain_names:
+            self.chains[chain] = {}
+        chains,aas,atms,eles = [table.get_column(col) for col in ["chain","aa","atom","element"]]
+        xs,ys,zs,occs = [table.get_column(col) for col in ["x","y","z","occupancy"]]
+        cols = {col:vals.tolist() for col,vals in table.columns.items()}
+        atom_nos,rids,bfs = cols["atom_no"],cols["rid"],cols["bfactor"]
+        for i in table.order.tolist():
+            resd = self.chains[chains[i]].get(rids[i])
+            if resd is None:
+                resd = PdbResidue(aas[i],rids[i],cols["ridx"][i])
+                self.chains[chains[i]][rids[i]] = resd
+            disordered = 'Y' if cols["disordered"][i] else 'N'
+            resd.atoms[atms[i]] = PdbAtom(chains[i],resd,eles[i],atms[i],atom_nos[i],disordered,occs[i],bfs[i],xs[i],ys[i],zs[i])
+        self._lines = None
+        self._added = []
+        self.invalidate()
+        self._table = table
+        self._table_version = self._version
+        self.get_space()
+
+    def invalidate(self):
+        # marks the indexes of lines and chains as out of date, to be called after editing them other than by add_line_string
+        self._version += 1
 
     def elementInList(self,element, atomlist):
         for atm in atomlist:
@@ -111,15 +174,19 @@ class PdbObject(object):
     def get_first_three(self):
         atm1, atm2, atm3 = {},{},{}
         count = 0
-        for atm in self.lines:
-            if atm["atm"] == "CA" and (atm["version"] == "A" or atm["version"] == ""):
-                atm1 = atm
+        # only the CA, C and O rows are looked at
+        table = self.get_table()
+        atms,vers = table.get_strings("atom"),table.get_strings("version")
+        rows = np.where(np.isin(atms,["CA","C","O"]) & np.isin(vers,["A",""]))[0]
+        for i in rows.tolist():
+            if atms[i] == "CA":
+                atm1 = self.get_line(i)
                 count += 1
-            elif atm["atm"] == "C" and (atm["version"] == "A" or atm["version"] == ""):
-                atm2 = atm
+            elif atms[i] == "C":
+                atm2 = self.get_line(i)
                 count += 1
-            elif atm["atm"] == "O" and (atm["version"] == "A" or atm["version"] == ""):
-                atm3 = atm
+            elif atms[i] == "O":
+                atm3 = self.get_line(i)
                 count += 1
             if count == 3:
                 return atm1,atm2,atm3
@@ -137,21 +204,61 @@ class PdbObject(object):
         return f"({atm['x']},{atm['y']},{atm['z']})"
     
     def get_atm_key(self,key):
-        #A:709@C.A
         try:
-            sx = key.split("@")
-            s01 = sx[0].split(":")
-            s23 = sx[1].split(".")
-            ch,rid,am,ver = s01[0],s01[1],s23[0],s23[1]            
-            for atm in self.lines:                                
-                if atm["chain"] == ch:
-                    if int(atm["rid"]) == int(rid):
-                        if atm["atm"] == am:
-                            if atm["version"] == ver: 
-                                return atm
+            i = self._find_key(key)
         except Exception as e:
             print("Error finding key",key,e)
             return {}
+        return None if i is None else self.get_line(i)
+
+    def _find_key(self,key):
+        # the index of the line with the key, None if there isn't one
+        #A:709@C.A
+        sx = key.split("@")
+        s01 = sx[0].split(":")
+        s23 = sx[1].split(".")
+        ch,rid,am,ver = s01[0],s01[1],s23[0],s23[1]            
+        return self.get_key_index().get((ch,int(rid),am,ver))
+
+    def get_coords_keys(self,keys):
+        # the coordinates of many keys as an (N,3) array, a key that is not found is (0,0,0)
+        coords = np.zeros((len(keys),3))
+        rows,found = [],[]
+        for i,key in enumerate(keys):
+            try:
+                row = self._find_key(key)
+            except Exception as e:
+                print("Error finding key",key,e)
+                row = None
+            if row is not None:
+                rows.append(row)
+                found.append(i)
+        if len(rows) > 0:
+            coords[found] = self.get_table().coords[rows]
+        return coords
+
+    def get_key_index(self):
+        # the hash of atom keys to line indices, kept up to date by add_line_string and rebuilt after invalidate
+        if self._keys_version != self._version:
+            table = self.get_table()
+            self._keys = {}
+            keys = zip(*[table.get_column(col) for col in ["chain","rid","atom","version"]])
+            for i,key in enumerate(keys):
+                self._keys.setdefault(key,i)
+            self._keys_version = self._version
+        return self._keys
+
+    def get_line(self,i):
+        # the dict of line i, from lines if they have been made otherwise from the table
+        if self._lines is not None:
+            return self._lines[i]
+        return self.get_table().get_lines([i])[0]
+
+    def get_num_lines(self):
+        # the number of lines, without making their dicts
+        if self._lines is not None:
+            return len(self._lines)
+        return (0 if self._table is None else len(self._table)) + len(self._added)
         
     def get_key(self,atm):
         if atm == {}:
@@ -164,6 +271,12 @@ class PdbObject(object):
             return ""
         #A:709@C.A
         return f"{round(dis,3)}:{atm['aa']}:{atm['chain']}:{atm['rid']}@{atm['atm']}.{atm['version']}"
+
+    def get_row_description(self,i,dis):
+        # get_description of line i, from the table
+        table = self.get_table()
+        aa,chain,atm,ver = [table.get_string(col,i) for col in ["aa","chain","atom","version"]]
+        return f"{round(dis,3)}:{aa}:{chain}:{table.columns['rid'][i]}@{atm}.{ver}"
     
     def get_next_key(self,key, offset=1):
         try:
@@ -177,50 +290,119 @@ class PdbObject(object):
 
     def get_atom_coords(self):
         atoms = []
-        for atm in self.lines:
-            coord = v3.VectorThree(atm["x"],atm["y"],atm["z"])
+        for x,y,z in self.get_coords_array().tolist():
+            coord = v3.VectorThree(x,y,z)
             atoms.append(coord)
         return atoms
     
+    def get_table(self):
+        # the columnar AtomTable, made when the atoms are added or again if lines or chains have changed since
+        if self._table is None or self._table_version != self._version:
+            self._table = ptable.make_table(self,self._get_rows())
+            self._added = []
+            self._table_version = self._version
+        return self._table
+
+    def _get_rows(self):
+        # the lines as a list per column, from the line dicts if they have been made, otherwise the table and those added since
+        if self._lines is not None:
+            return ptable.lines_to_rows(self._lines)
+        rows = {}
+        for i,(key,col) in enumerate(ptable.LINE_COLUMNS):
+            rows[col] = [] if self._table is None else self._table.get_column(col)
+            rows[col] += [line[i] for line in self._added]
+        return rows
+
+    def get_coords_array(self):
+        # the (N,3) coordinates of lines
+        return self.get_table().coords
+
+    def get_space(self):
+        # the spatial index over lines, built once the atoms are added
+        if self._space is None or self._space_version != self._version:
+            self._space = pspace.PdbSpace(self.get_coords_array())
+            self._space_version = self._version
+        return self._space
+
+    def get_residue(self,chain,rid):
+        # the PdbResidue with this number in the chain, None if there isn't one
+        return self.chains.get(chain,{}).get(rid)
+
+    def get_chain_atoms(self,chain,atom_name="",element=""):
+        # the PdbAtoms of the chain with this atom name, or this element (the first letter of the name), in chain order
+        names,elements,atoms = self.get_atom_index()
+        if element != "":
+            return elements.get((chain,element),[])
+        return names.get((chain,atom_name),[])
+
+    def get_atom_index(self):
+        # the atom name and element indexes of the chains and all their atoms, rebuilt if the chains have changed
+        if self._atom_index is None or self._atom_index_version != self._version:
+            names,elements,atoms = {},{},[]
+            for chain,resdic in self.chains.items():
+                for no,res in resdic.items():
+                    for attype,atm in res.atoms.items():
+                        names.setdefault((chain,atm.atom_name),[]).append(atm)
+                        elements.setdefault((chain,atm.atom_type),[]).append(atm)
+                        atoms.append(atm)
+            self._atom_index = (names,elements,atoms)
+            self._atom_index_version = self._version
+            self._atom_spaces = {}
+        return self._atom_index
+
+    def get_atom_space(self,chain=None,atom_name="",element=""):
+        # an AtomSpace over get_chain_atoms, or over all the atoms in the chains if chain is None
+        names,elements,atoms = self.get_atom_index()
+        key = (chain,atom_name,element)
+        if key not in self._atom_spaces:
+            if chain is None:
+                self._atom_spaces[key] = pspace.AtomSpace(atoms)
+            else:
+                self._atom_spaces[key] = pspace.AtomSpace(self.get_chain_atoms(chain,atom_name,element))
+        return self._atom_spaces[key]
+
     def get_inscope_atoms(self,anchor,distance,log_level=0):
         in_scope = []
-        for atm in self.lines:
-            crd = v3.VectorThree(float(atm["x"]),float(atm["y"]),float(atm["z"]))
-            dis = anchor.distance(crd)
-            if dis <= distance:
-                in_scope.append(atm)
-                if log_level > 0:                        
-                    print("neighbour in scope", self.get_description(atm,dis))
+        idxs,dists = self.get_space().query_radius(anchor,distance)
+        for i,dis in zip(idxs,dists):
+            atm = self.get_line(i)
+            in_scope.append(atm)
+            if log_level > 0:                        
+                print("neighbour in scope", self.get_description(atm,dis))
         return in_scope
+
+    def get_nearest_atoms(self,coords,k=1):
+        # the (distances, line indices) of the k nearest atoms to each of many coordinates
+        return self.get_space().query_nearest(coords,k)
+
+    def get_inscope_atoms_batch(self,coords,distance):
+        # a list per coordinate of the (line indices, distances) within distance
+        return self.get_space().query_radius_batch(coords,distance)
     
     def get_neighbours(self,coord,rnge,atoms=None,ishtml=False):
         a = ""
         if atoms == None:
-            atoms = self.lines
-        for atm in atoms:
-            crd = v3.VectorThree(float(atm["x"]),float(atm["y"]),float(atm["z"]))
-            dis = coord.distance(crd)
-            if dis >= rnge[0] and dis <= rnge[1]:
-                desc = self.get_description(atm,dis)
-                if desc not in a:
-                    if ishtml:
-                        a+="<br>......"+ desc
-                    else:
-                        a+="\n......"+desc
+            idxs,dists = self.get_space().query_radius(coord,rnge[1],rnge[0])
+            descs = [self.get_row_description(i,dis) for i,dis in zip(idxs,dists)]
+        else:
+            # the atoms' own coordinates, they need not be in lines
+            c = self.get_space()._as_coord(coord)
+            pnts = np.array([[float(atm["x"]),float(atm["y"]),float(atm["z"])] for atm in atoms],dtype=float).reshape(-1,3)
+            da,db,dc = c[0] - pnts[:,0],c[1] - pnts[:,1],c[2] - pnts[:,2]
+            dists = np.sqrt(da*da + db*db + dc*dc)
+            keep = np.where((dists >= rnge[0]) & (dists <= rnge[1]))[0]
+            descs = [self.get_description(atoms[i],dis) for i,dis in zip(keep,dists[keep])]
+        for desc in descs:
+            if desc not in a:
+                if ishtml:
+                    a+="<br>......"+ desc
+                else:
+                    a+="\n......"+desc
         return a
     ##################################################################################
     def dataFrame(self):        
-        dicdfs = []        
-        for chain,resdic in self.chains.items():
-            for no,res in resdic.items():
-                for attype,atm in res.atoms.items():     
-                    dic={'pdbCode':self.pdb_code,'resolution':self.resolution,
-                    'chain':atm.chain,'aa':res.amino_acid,'rid':res.rid,'ridx':res.ridx,                    
-                    'atom':atm.atom_name, 'atomNo':atm.atom_no,'element':atm.atom_type,
-                    'bfactor':atm.bfactor, 'occupancy':atm.occupancy,
-                    'x':atm.x, 'y':atm.y, 'z':atm.z}
-                    dicdfs.append(dic)
-        return pd.DataFrame.from_dict(dicdfs)
+        # the atoms in the chains, a new DataFrame made from the columns of the table
+        return self.get_table().dataFrame()
     
     # if we add lines from a cif file I will do something different    
     def add_line_string(self,aid, rid, aa, am, ch, ver, x, y, z, occ, bf, ele):
@@ -238,14 +420,31 @@ class PdbObject(object):
             #occ = line[54:60].strip()
             #bf = line[60:66].strip()
             #ele = line[66:].strip()
+        if ver == "":
+            ver = "A"
+        index = self.get_num_lines()
+        if self._lines is None:
+            # no dict is made while the lines are only in the table
+            self._added.append((rid, aid, aa, am, ch, ver, x, y, z, occ, bf, ele))
+        else:
+            self._lines.append(self._make_line(aid, rid, aa, am, ch, ver, x, y, z, occ, bf, ele))
+        # the key index is kept up to date if it was, the others are rebuilt when next needed
+        keys_current = self._keys_version == self._version
+        self._version += 1
+        if keys_current:
+            self._keys.setdefault((ch,int(rid),am,ver),index)
+            self._keys_version = self._version
+        #if "HETATM" in line[:8]:
+        #    print(line)
+        #    print(atm)
+
+    def _make_line(self,aid, rid, aa, am, ch, ver, x, y, z, occ, bf, ele):
         atm = {}
         atm["rid"] = rid
         atm["aid"] = aid
         atm["aa"] = aa
         atm["atm"] = am
         atm["chain"] = ch
-        if ver == "":
-            ver = "A"
         atm["version"] = ver            
         atm["x"] = x
         atm["y"] = y
@@ -253,18 +452,20 @@ class PdbObject(object):
         atm["occupancy"] = occ
         atm["bfactor"] = bf
         atm["element"] = ele        
-        self.lines.append(atm)
-        #if "HETATM" in line[:8]:
-        #    print(line)
-        #    print(atm)
+        return atm
 
     #################################
     def toJson(self):
-        return json.dumps(self, default=lambda o: o.__dict__)
+        # the lines are serialised as dicts, the table and indexes are not, they are rebuilt when needed
+        private = ["_added","_version","_space","_space_version","_keys","_keys_version","_table","_table_version","_atom_index","_atom_index_version","_atom_spaces"]
+        def fields(o):
+            return {("lines" if k == "_lines" else k):(self.lines if k == "_lines" else v) for k,v in o.__dict__.items() if k not in private}
+        return json.dumps(self, default=fields)
     
     def fromJson(self, jsndic):    
         self.pdb_code = jsndic["pdb_code"]
         self.lines = jsndic["lines"]
+        self.invalidate()
 
 
     
@@ -0,0 +1,406 @@
+"""
+RSA 19/10/26
+
+A fast reader of the coordinates of PDB and mmCIF files, straight from the fixed columns of the ATOM/HETATM records
+or the _atom_site loop, without building a Biopython structure that add_atoms then throws away.
+Residues and alternative locations are resolved as Biopython's structure builder resolves them, which is what
+add_atoms relies on: the same models, chains, residue ids (hetero flag, number, insertion code) and the same
+selected alternative location of each disordered atom.
+The files Biopython would have to repair (redefined residues, duplicate atoms without an altloc, atom names that
+differ only in spaces) raise ReaderFallback so the caller can parse them with Biopython instead.
+
+"""
+
+import re
+import sys
+import numpy as np
+
+class ReaderFallback(Exception):
+    # the file needs Biopython's handling of a case this reader does not reproduce
+    pass
+
+# the mmCIF categories read, _atom_site for the coordinates and the rest for the header and metadata
+CIF_CATEGORIES = ["_atom_site","_exptl","_refine","_refine_hist","_em_3d_reconstruction",
+                  "_database_2","_em_diffraction_shell","_reflns"]
+
+class ParsedStructure(object):
+    def __init__(self):
+        # PUBLIC INTERFACE
+        self.header = {"structure_method":"unknown","resolution":None}
+        # what MapLoader needs to find the density: exp_method, resolution and em_code of any related EMDB entry
+        self.metadata = {}
+        # a list per model of chain id to its list of residues, a residue is (hetero flag, rid, insertion code, aa, atoms)
+        # and an atom is (name, altloc, x, y, z, occupancy, bfactor, disordered) as add_models takes them
+        self.models = []
+        # PRIVATE INTERFACE
+        self._chains = None
+        self._residues = None
+        self._atoms = None
+        self._rows = {"x":[],"y":[],"z":[],"occupancy":[],"bfactor":[]}
+
+    def init_model(self):
+        self._chains = {}
+        self.models.append(self._chains)
+        self._residues = None
+
+    def init_chain(self, chain):
+        # a chain that is discontinuous carries on where it was left
+        self._residues = self._chains.setdefault(chain,{})
+
+    def init_residue(self, field, resseq, icode, resname):
+        if field == "H":
+            field = "H_" + resname
+        res_id = (field,resseq,icode)
+        if res_id in self._residues:
+            raise ReaderFallback(f"Residue {res_id} redefined")
+        self._atoms = {}
+        self._residues[res_id] = (field,resseq,icode,resname,self._atoms)
+
+    def init_atom(self, name, fullname, altloc, x, y, z, occupancy, bfactor):
+        rows = self._rows
+        row = len(rows["x"])
+        rows["x"].append(x)
+        rows["y"].append(y)
+        rows["z"].append(z)
+        rows["occupancy"].append(occupancy)
+        rows["bfactor"].append(bfactor)
+        same = self._atoms.get(name)
+        if same is None:
+            self._atoms[name] = [(altloc,fullname,row)]
+        elif altloc == " " or same[0][0] == " " or same[0][1] != fullname or altloc in [alt for alt,full,r in same]:
+            raise ReaderFallback(f"Duplicate atom {name}")
+        else:
+            same.append((altloc,fullname,row))
+
+    def finish(self):
+        # resolves the disordered atoms and swaps the residue dictionaries for the lists add_models takes
+        rows = self._rows
+        # the coordinates are held as float32 as Biopython holds them
+        coords = np.array([rows["x"],rows["y"],rows["z"]],dtype=np.float32).astype(float).T.tolist()
+        occs,bfs = rows["occupancy"],rows["bfactor"]
+        models = []
+        for chains in self.models:
+            model = {}
+            for chain,residues in chains.items():
+                model[chain] = []
+                for field,resseq,icode,resname,atoms in residues.values():
+                    res_atoms = []
+                    for name,alts in atoms.items():
+                        if len(alts) == 1 and alts[0][0] == " ":
+                            altloc,row,disordered = " ",alts[0][2],False
+                        else:
+                            altloc,row = self._select_altloc(alts,occs)
+                            disordered = True
+                        x,y,z = coords[row]
+                        res_atoms.append((name,altloc,x,y,z,occs[row],bfs[row],disordered))
+                    model[chain].append((field,resseq,icode,resname,res_atoms))
+            models.append(model)
+        self.models = models
+        self._rows = None
+        return self
+
+    def _select_altloc(self, alts, occs):
+        # A if there is one, otherwise the first with the highest occupancy as a DisorderedAtom is built
+        last = -sys.maxsize
+        selected = None
+        for altloc,fullname,row in alts:
+            if occs[row] is None:
+                raise ReaderFallback("Disordered atom without an occupancy")
+            if occs[row] > last:
+                last = occs[row]
+                selected = (altloc,row)
+        for altloc,fullname,row in alts:
+            if altloc == "A":
+                selected = (altloc,row)
+        return selected
+
+#################################################
+############ PDB ##################
+#################################################
+def read_pdb(filepath):
+    # A ParsedStructure of a pdb file, the header as Biopython's parse_pdb_header gives the resolution and method
+    with open(filepath,"r") as fr:
+        lines = fr.readlines()
+    struc = ParsedStructure()
+    start = len(lines)
+    for i,line in enumerate(lines):
+        if line[0:6] in ("ATOM  ","HETATM","MODEL "):
+            start = i
+            break
+    struc.header = read_pdb_header(lines[:start])
+    struc.metadata = read_pdb_metadata(lines[:start],struc.header)
+    try:
+        _read_pdb_coords(struc,lines[start:])
+    except ReaderFallback:
+        raise
+    except Exception as e:
+        raise ReaderFallback(f"Unreadable coordinates {e}")
+    return struc.finish()
+
+def read_pdb_header(lines):
+    header = {"structure_method":"unknown","resolution":None}
+    for line in lines:
+        line = re.sub(r"[\s\n\r]*\Z","",line)
+        key = line[:6].strip()
+        tail = line[10:].strip()
+        if key == "EXPDTA":
+            expd = _chop_end_codes(tail)
+            expd = re.sub(r"\s\s\s\s\s\s\s.*\Z","",expd)
+            header["structure_method"] = expd.lower()
+        elif key == "REMARK" and re.search("REMARK   2 RESOLUTION.",line):
+            res = _chop_end_codes(re.sub("REMARK   2 RESOLUTION.","",line))
+            res = re.sub(r"\s+ANGSTROM.*","",res)
+            try:
+                header["resolution"] = float(res)
+            except ValueError:
+                header["resolution"] = None
+    if header["structure_method"] == "unknown":
+        if header["resolution"] is not None and header["resolution"] > 0.0:
+            header["structure_method"] = "x-ray diffraction"
+    return header
+
+def read_pdb_head(filepath):
+    # the header lines of a pdb file, the lines before the coordinates
+    lines = []
+    with open(filepath,"r") as fr:
+        for line in fr:
+            if line[0:6] in ("ATOM  ","HETATM","MODEL "):
+                break
+            lines.append(line)
+    return lines
+
+def read_pdb_metadata(lines, header):
+    metadata = {"exp_method":header["structure_method"],"resolution":header["resolution"],"em_code":""}
+    for line in lines:
+        #REMARK 900 RELATED ID: EMD-6240   RELATED DB: EMDB                              
+        if "REMARK 900 RELATED ID:" in line and "EMD-" in line:
+            metadata["em_code"] = line.split(" ")[4]
+            break
+    return metadata
+
+def _chop_end_codes(line):
+    return re.sub(r"\s\s\s\s+[\w]{4}.\s+\d*\Z","",line)
+
+def _read_pdb_coords(struc, lines):
+    model_open = False
+    current_chain = None
+    current_residue = None
+    for line in lines:
+        line = line.rstrip("\n")
+        record = line[0:6]
+        if record == "ATOM  " or record == "HETATM":
+            if not model_open:
+                struc.init_model()
+                model_open = True
+            fullname = line[12:16]
+            split_name = fullname.split()
+            if len(split_name) != 1:
+                raise ReaderFallback(f"Atom name {fullname}")
+            resname = line[17:20].strip()
+            field = " "
+            if record == "HETATM":
+                field = "W" if resname in ("HOH","WAT") else "H"
+            residue = (field,int(line[22:26].split()[0]),line[26],resname)
+            try:
+                occupancy = float(line[54:60])
+            except Exception:
+                occupancy = None
+            try:
+                bfactor = float(line[60:66])
+            except Exception:
+                bfactor = 0.0
+            chain = line[21]
+            if chain != current_chain:
+                current_chain = chain
+                struc.init_chain(chain)
+                current_residue = residue
+                struc.init_residue(*residue)
+            elif residue != current_residue:
+                current_residue = residue
+                struc.init_residue(*residue)
+            struc.init_atom(split_name[0],fullname,line[16],float(line[30:38]),float(line[38:46]),float(line[46:54]),occupancy,bfactor)
+        elif record == "MODEL ":
+            struc.init_model()
+            model_open = True
+            current_chain = None
+            current_residue = None
+        elif record == "ENDMDL":
+            model_open = False
+            current_chain = None
+            current_residue = None
+        elif record == "END   " or record == "CONECT":
+            break
+
+#################################################
+############ mmCIF ##################
+#################################################
+def read_cif(filepath):
+    # A ParsedStructure of an mmcif file, with the auth chains and residue numbers as MMCIFParser uses by default
+    with open(filepath,"r") as fr:
+        items = read_cif_items(fr,CIF_CATEGORIES)
+    struc = ParsedStructure()
+    struc.header = read_cif_header(items)
+    struc.metadata = read_cif_metadata(items)
+    try:
+        _read_cif_coords(struc,items)
+    except ReaderFallback:
+        raise
+    except Exception as e:
+        raise ReaderFallback(f"Unreadable coordinates {e}")
+    return struc.finish()
+
+def read_cif_header(items):
+    header = {"structure_method":"","resolution":None}
+    for target,keys in [("structure_method",["_exptl.method"]),
+                        ("resolution",["_refine.ls_d_res_high","_refine_hist.d_res_high","_em_3d_reconstruction.resolution"])]:
+        for key in keys:
+            vals = items.get(key,[])
+            if len(vals) > 0 and vals[0] != "?":
+                header[target] = vals[0]
+                break
+    if header["resolution"] is not None:
+        try:
+            header["resolution"] = float(header["resolution"])
+        except ValueError:
+            header["resolution"] = None
+    return header
+
+def read_cif_metadata(items):
+    # items can be from read_cif_items or MMCIF2Dict, the values are kept as the strings in the file
+    metadata = {"exp_method":"","resolution":"","em_code":""}
+    if "_exptl.method" in items:
+        metadata["exp_method"] = items["_exptl.method"][0]
+    dbs,db_vals = items.get("_database_2.database_id",[]),items.get("_database_2.database_code",[])
+    for db,db_val in zip(dbs,db_vals):
+        if db == "EMDB":
+            metadata["em_code"] = db_val
+            metadata["resolution"] = items.get("_em_diffraction_shell.high_resolution",[""])[0]
+            return metadata
+    metadata["resolution"] = items.get("_reflns.d_resolution_high",[""])[0]
+    return metadata
+
+def _read_cif_coords(struc, items):
+    if "_atom_site.pdbx_PDB_model_num" not in items:
+        raise ReaderFallback("No model numbers")
+    unassigned = (".","?")
+    names = items["_atom_site.label_atom_id"]
+    resnames = items["_atom_site.label_comp_id"]
+    chains = items["_atom_site.auth_asym_id"]
+    rids = items.get("_atom_site.auth_seq_id",items["_atom_site.label_seq_id"])
+    xs,ys,zs = items["_atom_site.Cartn_x"],items["_atom_site.Cartn_y"],items["_atom_site.Cartn_z"]
+    alts,icodes = items["_atom_site.label_alt_id"],items["_atom_site.pdbx_PDB_ins_code"]
+    bfs,occs = items["_atom_site.B_iso_or_equiv"],items["_atom_site.occupancy"]
+    groups,models = items["_atom_site.group_PDB"],items["_atom_site.pdbx_PDB_model_num"]
+    current_model = None
+    current_chain = None
+    current_residue = None
+    for i in range(len(names)):
+        if rids[i] == ".":
+            continue
+        if models[i] != current_model:
+            current_model = models[i]
+            struc.init_model()
+            current_chain = None
+        resname = resnames[i]
+        field = " "
+        if groups[i] == "HETATM":
+            field = "W" if resname in ("HOH","WAT") else "H"
+        icode = " " if icodes[i] in unassigned else icodes[i]
+        residue = (field,int(rids[i]),icode,resname)
+        if chains[i] != current_chain:
+            current_chain = chains[i]
+            struc.init_chain(current_chain)
+            current_residue = None
+        if residue != current_residue:
+            current_residue = residue
+            struc.init_residue(*residue)
+        altloc = " " if alts[i] in unassigned else alts[i]
+        struc.init_atom(names[i],names[i],altloc,float(xs[i]),float(ys[i]),float(zs[i]),float(occs[i]),float(bfs[i]))
+
+def read_cif_items(handle, categories):
+    # A dictionary of mmcif key to its list of values, as MMCIF2Dict, for only the keys in the given categories
+    items = {}
+    loop_keys = None # the keys of a loop, while reading its header
+    loop_vals = None # the flat values of a loop, while reading its rows
+    key = None # a key waiting for its value
+    text = None # the lines of a multi-line text value
+    def wanted(k):
+        return k.split(".")[0] in categories
+    def end_loop():
+        n = len(loop_keys)
+        if n > 0 and wanted(loop_keys[0]):
+            for i,k in enumerate(loop_keys):
+                items[k] = loop_vals[i::n]
+    for line in handle:
+        if text is not None:
+            if line.startswith(";"):
+                tokens = ["\n".join(text)]
+                text = None
+                line = line[1:]
+            else:
+                text.append(line.rstrip("\r\n"))
+                continue
+        elif line.startswith(";"):
+            text = [line[1:].rstrip("\r\n")]
+            continue
+        else:
+            tokens = []
+        tokens += _cif_split(line)
+        for t,token in enumerate(tokens):
+            if loop_vals is not None:
+                if len(loop_vals) % len(loop_keys) == 0 and (token.startswith("_") or token == "loop_" or token.startswith("data_")):
+                    end_loop()
+                    loop_keys,loop_vals = None,None
+                else:
+                    # the rest of the line is all values of the loop
+                    loop_vals.extend(tokens[t:])
+                    break
+            if key is not None:
+                if wanted(key):
+                    items[key] = [token]
+                key = None
+            elif loop_keys is not None and loop_vals is None:
+                if token.startswith("_"):
+                    loop_keys.append(token)
+                else:
+                    loop_vals = []
+                    loop_vals.extend(tokens[t:])
+                    break
+            elif token == "loop_":
+                loop_keys = []
+            elif token.startswith("_"):
+                key = token
+    if loop_vals is not None:
+        end_loop()
+    return items
+
+def _cif_split(line):
+    # the tokens of a line, quotes only close before white space, a # outside quotes starts a comment
+    if "'" not in line and '"' not in line and "#" not in line:
+        return line.split()
+    tokens = []
+    i,n = 0,len(line)
+    while i < n:
+        c = line[i]
+        if c.isspace():
+            i += 1
+        elif c == "#":
+            break
+        elif c == "'" or c == '"':
+            j = i + 1
+            while True:
+                j = line.find(c,j)
+                if j == -1 or j + 1 >= n or line[j+1].isspace():
+                    break
+                j += 1
+            if j == -1:
+                j = n
+            tokens.append(line[i+1:j])
+            i = j + 1
+        else:
+            j = i
+            while j < n and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
@@ -0,0 +1,140 @@
+"""
+RSA 19/10/26
+
+A spatial index over the atom coordinates of a structure, a k-d tree built once so that
+radius and nearest neighbour searches do not scan every atom.
+Distances are recalculated exactly as VectorThree.distance does so the boundaries match the scans they replace.
+
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+class PdbSpace(object):
+    def __init__(self, coords):
+        #Paramaters
+        #-----------
+        #coords : (N,3) array like
+        #    The atom coordinates, the indices returned are into this
+        self.coords = np.asarray(coords,dtype=float).reshape(-1,3)
+        self.tree = None
+        if len(self.coords) > 0:
+            self.tree = cKDTree(self.coords)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def get_distances(self, coord, idxs):
+        # exactly as VectorThree.distance
+        pnts = self.coords[idxs]
+        da,db,dc = coord[0] - pnts[:,0],coord[1] - pnts[:,1],coord[2] - pnts[:,2]
+        return np.sqrt(da*da + db*db + dc*dc)
+
+    def query_radius(self, coord, distance, min_distance=-1):
+        # The (indices, distances) of the atoms within distance of coord, in index order
+        coord = self._as_coord(coord)
+        if self.tree is None:
+            return np.zeros(0,dtype=int),np.zeros(0)
+        idxs = np.sort(np.asarray(self.tree.query_ball_point(coord,distance + 0.000001),dtype=int))
+        dists = self.get_distances(coord,idxs)
+        keep = (dists <= distance) & (dists >= min_distance)
+        return idxs[keep],dists[keep]
+
+    def query_radius_batch(self, coords, distance):
+        # a list per coordinate of the (indices, distances) within distance
+        coords = np.asarray(coords,dtype=float).reshape(-1,3)
+        if self.tree is None:
+            return [(np.zeros(0,dtype=int),np.zeros(0)) for coord in coords]
+        results = []
+        for coord,idxs in zip(coords,self.tree.query_ball_point(coords,distance + 0.000001)):
+            idxs = np.sort(np.asarray(idxs,dtype=int))
+            dists = self.get_distances(coord,idxs)
+            keep = dists <= distance
+            results.append((idxs[keep],dists[keep]))
+        return results
+
+    def query_radius_pairs(self, coords, distance, min_distance=-1):
+        # All the (coordinate index, atom index, distance) pairs within range as aligned arrays,
+        # ordered by coordinate and then atom, from a single ball query
+        coords = np.asarray(coords,dtype=float).reshape(-1,3)
+        if self.tree is None or len(coords) == 0:
+            return np.zeros(0,dtype=int),np.zeros(0,dtype=int),np.zeros(0)
+        found = self.tree.query_ball_point(coords,distance + 0.000001)
+        lengths = np.array([len(idxs) for idxs in found],dtype=int)
+        coord_idxs = np.repeat(np.arange(len(coords)),lengths)
+        atom_idxs = np.array([i for idxs in found for i in idxs],dtype=int)
+        order = np.lexsort((atom_idxs,coord_idxs))
+        coord_idxs,atom_idxs = coord_idxs[order],atom_idxs[order]
+        pnts,cs = self.coords[atom_idxs],coords[coord_idxs]
+        da,db,dc = cs[:,0] - pnts[:,0],cs[:,1] - pnts[:,1],cs[:,2] - pnts[:,2]
+        dists = np.sqrt(da*da + db*db + dc*dc)
+        keep = (dists <= distance) & (dists >= min_distance)
+        return coord_idxs[keep],atom_idxs[keep],dists[keep]
+
+    def query_nearest(self, coords, k=1):
+        # The (distances, indices) of the k nearest atoms to each coordinate, shaped (N,k)
+        coords = np.asarray(coords,dtype=float).reshape(-1,3)
+        k = min(k,len(self.coords))
+        if k == 0:
+            return np.zeros((len(coords),0)),np.zeros((len(coords),0),dtype=int)
+        dists,idxs = self.tree.query(coords,k=k)
+        return np.asarray(dists).reshape(len(coords),k),np.asarray(idxs).reshape(len(coords),k)
+
+    def query_nearest_bounded(self, coord, k):
+        # The (indices, exact distances) of the k nearest atoms to one coordinate, and a distance below which
+        # no atom has been left out, infinite when k is all of them
+        coord = self._as_coord(coord)
+        k = min(k,len(self.coords))
+        if k == 0:
+            return np.zeros(0,dtype=int),np.zeros(0),np.inf
+        tree_dists,idxs = self.query_nearest(coord,k)
+        idxs = idxs[0]
+        bound = np.inf if k == len(self.coords) else tree_dists[0,-1] - 0.000001
+        return idxs,self.get_distances(coord,idxs),bound
+
+    def _as_coord(self, coord):
+        if hasattr(coord,"A"):
+            return np.array([coord.A,coord.B,coord.C],dtype=float)
+        return np.asarray(coord,dtype=float)
+
+class AtomSpace(PdbSpace):
+    def __init__(self, atoms):
+        #Paramaters
+        #-----------
+        #atoms : list of PdbAtom
+        #    The atoms, with their residue numbers, chains, names and disorder kept as arrays for filtering
+        PdbSpace.__init__(self,[(atm.x,atm.y,atm.z) for atm in atoms])
+        self.atoms = atoms
+        self.rids = np.array([atm.res.rid for atm in atoms],dtype=int)
+        self.chains = np.array([atm.chain for atm in atoms],dtype=object)
+        self.disordered = np.array([atm.disordered == "Y" for atm in atoms],dtype=bool)
+        names,codes = np.unique(np.array([atm.atom_name for atm in atoms],dtype=str),return_inverse=True)
+        self.names = list(names)
+        self.name_codes = codes.reshape(-1)
+
+def iter_nearest(spaces, coord, keeps, k=16):
+    # Yields (distance, space index, atom index) of the atoms kept in several spaces, in order of distance then
+    # space then atom, so ties come in the order of the spaces' atoms one after the other.
+    # Neighbours are queried k at a time, doubling k only if more are taken.
+    #keeps : list of boolean arrays, the atoms of each space to include
+    done = 0
+    while True:
+        found = []
+        bound = np.inf
+        for si,space in enumerate(spaces):
+            idxs,dists,space_bound = space.query_nearest_bounded(coord,k)
+            bound = min(bound,space_bound)
+            keep = keeps[si][idxs]
+            found.append((dists[keep],np.full(keep.sum(),si),idxs[keep]))
+        dists = np.concatenate([f[0] for f in found] + [np.zeros(0)])
+        sis = np.concatenate([f[1] for f in found] + [np.zeros(0,dtype=int)])
+        idxs = np.concatenate([f[2] for f in found] + [np.zeros(0,dtype=int)])
+        complete = dists < bound
+        dists,sis,idxs = dists[complete],sis[complete],idxs[complete]
+        order = np.lexsort((idxs,sis,dists))
+        for j in order[done:]:
+            yield dists[j],sis[j],idxs[j]
+            done += 1
+        if bound == np.inf:
+            return
+        k *= 2
@@ -0,0 +1,121 @@
+"""
+RSA 19/10/26
+
+A columnar table of the atoms of a structure, numpy columns with the strings int-coded against a list of names.
+It is where a PdbObject holds its atoms, with a row per line, and the line dicts are made from the rows when wanted.
+order picks out the rows of the atoms kept in the chains, in the order the chains hold them,
+which is the order of PdbObject.dataFrame().
+
+"""
+
+import numpy as np
+import pandas as pd
+
+CODED = ["chain","aa","atom","element","version"]
+NUMERIC = {"atom_no":int,"rid":int,"ridx":int,"bfactor":float,"occupancy":float,"disordered":bool}
+# the keys of a PdbObject line dict, in its order, and the column each comes from
+LINE_COLUMNS = [("rid","rid"),("aid","atom_no"),("aa","aa"),("atm","atom"),("chain","chain"),("version","version"),
+                ("x","x"),("y","y"),("z","z"),("occupancy","occupancy"),("bfactor","bfactor"),("element","element")]
+
+class AtomTable(object):
+    def __init__(self, pdb_code="", resolution=-1):
+        # PUBLIC INTERFACE
+        self.pdb_code = pdb_code
+        self.resolution = resolution
+        self.coords = np.zeros((0,3))
+        self.order = np.zeros(0,dtype=int)
+        self.names = {} # coded column to its list of names
+        self.codes = {} # coded column to its int codes
+        self.columns = {} # the numeric columns
+        for col in CODED:
+            self.names[col] = []
+            self.codes[col] = np.zeros(0,dtype=int)
+        for col,typ in NUMERIC.items():
+            self.columns[col] = np.zeros(0,dtype=typ)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def set_rows(self, rows, order):
+        #rows : dict of column to a list of values, x,y,z and the CODED and NUMERIC columns
+        #order : list of int, the rows in the chains
+        self.coords = np.array([rows["x"],rows["y"],rows["z"]],dtype=float).T.reshape(-1,3)
+        for col in CODED:
+            names,codes = np.unique(np.array(rows[col],dtype=str),return_inverse=True)
+            self.names[col] = list(names)
+            self.codes[col] = codes.reshape(-1).astype(int)
+        for col,typ in NUMERIC.items():
+            self.columns[col] = np.array(rows[col],dtype=typ)
+        self.order = np.array(order,dtype=int)
+
+    def get_strings(self, col, rows=None):
+        # the decoded strings of a coded column, for the given rows or all of them
+        codes = self.codes[col]
+        if rows is not None:
+            codes = codes[rows]
+        return np.array(self.names[col],dtype=object)[codes] if len(self.names[col]) > 0 else np.zeros(0,dtype=object)
+
+    def get_string(self, col, row):
+        # the decoded string of a coded column for one row
+        return self.names[col][self.codes[col][row]]
+
+    def get_column(self, col, rows=None):
+        # a column of the lines as python values, for the given rows or all of them, a nan occupancy is None
+        if col in CODED:
+            return self.get_strings(col,rows).tolist()
+        if col in ["x","y","z"]:
+            vals = self.coords[:,"xyz".index(col)]
+        else:
+            vals = self.columns[col]
+        if rows is not None:
+            vals = vals[rows]
+        vals = vals.tolist()
+        if col == "occupancy":
+            vals = [None if occ != occ else occ for occ in vals]
+        return vals
+
+    def get_lines(self, rows=None):
+        # the PdbObject line dicts of the given rows or all of them
+        keys = [key for key,col in LINE_COLUMNS]
+        cols = [self.get_column(col,rows) for key,col in LINE_COLUMNS]
+        return [dict(zip(keys,vals)) for vals in zip(*cols)]
+
+    def get_structure_coords(self):
+        # the coordinates of the atoms in the chains, in dataFrame order
+        return self.coords[self.order]
+
+    def dataFrame(self):
+        rows = self.order
+        if len(rows) == 0:
+            return pd.DataFrame.from_dict([])
+        return pd.DataFrame({"pdbCode":[self.pdb_code]*len(rows),"resolution":[self.resolution]*len(rows),
+                    "chain":self.get_strings("chain",rows),"aa":self.get_strings("aa",rows),
+                    "rid":self.columns["rid"][rows],"ridx":self.columns["ridx"][rows],
+                    "atom":self.get_strings("atom",rows),"atomNo":self.columns["atom_no"][rows],
+                    "element":self.get_strings("element",rows),
+                    "bfactor":self.columns["bfactor"][rows],"occupancy":self.columns["occupancy"][rows],
+                    "x":self.coords[rows,0],"y":self.coords[rows,1],"z":self.coords[rows,2]})
+
+def lines_to_rows(lines):
+    # the line dicts as a list per column, as make_table takes them
+    return {col:[atm[key] for atm in lines] for key,col in LINE_COLUMNS}
+
+def make_table(pobj, rows):
+    # An AtomTable of a PdbObject's lines, with the residue index, disorder and order from its chains
+    #rows : dict of the LINE_COLUMNS columns to a list of values, one per line, see lines_to_rows
+    in_chains = {}
+    order_nos = []
+    for chain,resdic in pobj.chains.items():
+        for no,res in resdic.items():
+            for attype,atm in res.atoms.items():
+                in_chains[atm.atom_no] = (res.ridx,atm.disordered == "Y")
+                order_nos.append(atm.atom_no)
+    rows = dict(rows)
+    rows["occupancy"] = [np.nan if occ is None else occ for occ in rows["occupancy"]]
+    in_lines = [in_chains.get(no,(-1,False)) for no in rows["atom_no"]]
+    rows["ridx"] = [ridx for ridx,disordered in in_lines]
+    rows["disordered"] = [disordered for ridx,disordered in in_lines]
+    row_of_no = {no:i for i,no in enumerate(rows["atom_no"])}
+    table = AtomTable(pobj.pdb_code,pobj.resolution)
+    table.set_rows(rows,[row_of_no[no] for no in order_nos])
+    return table
@@ -6,16 +6,26 @@ RSA 4/2/23
 from maptial.xyz import spacetransform as space
 from maptial.xyz import crstransform as crs
 from maptial.xyz import gridmaker as grid
+from maptial.xyz import vectorthree as v3
+from maptial.xyz import matrix3d as d3
 from maptial.pol import interpolator as pol
-from operator import itemgetter
+from maptial.pol import interpolatorpool as ipool
+from maptial.pol import criticalfinder as cfind
+from maptial.map import slicecache as scache
+from maptial.map import sliceneighbours as snay
 import datetime
 import math
+import numpy as np
+import pandas as pd
 
 #####################################################################
 class MapFunctions(object):
-    def __init__(self, pdb_code, mobj,pobj, interp_method,as_sd=0,fo=2,fc=-1,log_level=0):
+    def __init__(self, pdb_code, mobj,pobj, interp_method,as_sd=0,fo=2,fc=-1,log_level=0,cache_size=32,cache_tolerance=0.0001,processes=1):
         # PUBLIC INTERFACE
         self.pdb_code = pdb_code        
+        self.slice_cache = scache.SliceCache(cache_size,cache_tolerance)
+        self.processes = processes # more than 1 evaluates the slices in a pool of processes over shared memory
+        self.interper_pool = None
         self.mobj = mobj
         self.pobj = pobj
         self.interper_vals = [] #default top using only the main density, which for xray is 2Fo-1Fc
@@ -71,21 +81,177 @@ class MapFunctions(object):
             if log_level > 0:
                 print("New interper, Fos=",fo,"Fcs=",fc,"mains=",vs,"diffs=",ds)
             self.interper = pol.create_interpolator(interp_method,self.interper_vals,(self.mobj.F,self.mobj.M,self.mobj.S),log_level=log_level,as_sd=self.as_sd)
+            if self.processes > 1:
+                self.close_pool()
+                self.interper_pool = ipool.InterpolatorPool(self.interper,self.processes)
+                self.interper.pool = self.interper_pool
         self.interp_method = interp_method
         self.fo = fo
         self.fc = fc
                     
+    def close_pool(self):
+        # the worker processes and shared memory need to be released when finished with
+        if self.interper_pool is not None:
+            self.interper_pool.close()
+            self.interper_pool = None
+
     def max_min(self):
         return self.interper.min,self.interper.max
 
+    def get_critical_points(self,interp_method="bspline",fo=2,fc=-1,min_value=None,box=None,log_level=0):
+        # A numpy structured array of all the critical points in the map, or in a region of it, see CriticalPointFinder
+        #box : ((x,y,z),(x,y,z)) = None
+        #    The low and high corners of a region in angstroms, searched over the crs box that holds it, None is the whole cell
+        self.make_interper_if_needed(interp_method,log_level,fo,fc)
+        crs_box = None
+        if box is not None:
+            lo,hi = np.asarray(box[0],dtype=float),np.asarray(box[1],dtype=float)
+            corners = np.array([[(lo,hi)[i][0],(lo,hi)[j][1],(lo,hi)[k][2]] for i in [0,1] for j in [0,1] for k in [0,1]])
+            crs_corners = self.crs_spc.xyz_to_crs_array(v3.VectorArray(corners)).npy
+            crs_box = (crs_corners.min(axis=0),crs_corners.max(axis=0))
+        table = cfind.CriticalPointFinder(self.interper).find(min_value=min_value,box=crs_box)
+        if len(table) > 0:
+            crs_vals = v3.VectorArray(np.stack([table["c"],table["r"],table["s"]],axis=1))
+            xyz_vals = self.crs_spc.crs_to_xyz_array(crs_vals)
+            table["x"],table["y"],table["z"] = xyz_vals.A,xyz_vals.B,xyz_vals.C
+        if log_level > 0:
+            print("Critical points=",len(table))
+        return table
+
     def get_slices(self,central, linear, planar, width, samples, interp_method, derivs=[0], fo=2,fc=-1,log_level=0,degree=-1,ret_type="np"):
-        vals = []
+        # The 2d slices for several derivatives, those not already cached are calculated together in one pass
+        keys = {}
         for deriv in derivs:
-            val = self.get_slice(central, linear, planar, width, samples, interp_method, deriv, fo,fc,log_level,degree,ret_type=ret_type)
-            vals.append(val)
-        return vals
+            keys[deriv] = self.slice_cache.make_key(central,linear,planar,width,samples,interp_method.lower(),1,deriv,fo,fc,self.as_sd)
+        found = {}
+        for deriv,key in keys.items():
+            cached = self.slice_cache.get(key)
+            if cached is not None:
+                found[deriv] = cached[0]
+        missing = [deriv for deriv in keys if deriv not in found]
+        if len(missing) > 0:
+            all_vals,xyz_coords = self._calc_slices(central, linear, planar, width, samples, interp_method, missing, fo,fc,log_level)
+            for deriv,vals in zip(missing,all_vals):
+                self.slice_cache.put(keys[deriv],(vals,xyz_coords))
+                found[deriv] = vals
+        return [found[deriv].copy().get_as(ret_type) for deriv in derivs]
+
+    def get_slice(self,central, linear, planar, width, samples, interp_method, depth_samples=1, deriv=0, fo=2,fc=-1,log_level=0, ret_type="np",prev=None,progressive=False,first_samples=25,deadline=-1):
+        #prev : (central, linear, planar, vals) = None
+        #    The previous 2d slice with the same width, samples, method and deriv. 
+        #    If the plane has only moved within itself by whole sample steps the overlap is reused.
+        #progressive : bool = False
+        #    If True a generator is returned, see get_slice_progressive
+        if progressive:
+            return self.get_slice_progressive(central, linear, planar, width, samples, interp_method, deriv, fo,fc,log_level, ret_type,first_samples,deadline)
+        if depth_samples > 1:
+            # 3d volumes are too big to keep, and to copy on every hit, so only 2d slices are cached
+            vals,xyz_coords = self._calc_slice(central, linear, planar, width, samples, interp_method, depth_samples, deriv, fo,fc,log_level)
+            return vals.get_as(ret_type),xyz_coords
+        # the same slice is often asked for again, so they are cached
+        key = self.slice_cache.make_key(central,linear,planar,width,samples,interp_method.lower(),1,deriv,fo,fc,self.as_sd)
+        cached = self.slice_cache.get(key)
+        if cached is None:
+            shift = None
+            if prev is not None:
+                shift = self._get_inplane_shift(prev[:3],central,linear,planar,width,samples)
+            if shift is None:
+                cached = self._calc_slice(central, linear, planar, width, samples, interp_method, 1, deriv, fo,fc,log_level)
+            else:
+                cached = self._calc_slice_shifted(prev[3],shift,central, linear, planar, width, samples, interp_method, deriv, fo,fc,log_level)
+            self.slice_cache.put(key,cached)
+        # the cached values are copied so the caller can't change them
+        return cached[0].copy().get_as(ret_type)
+
+    def get_slice_progressive(self,central, linear, planar, width, samples, interp_method, deriv=0, fo=2,fc=-1,log_level=0, ret_type="np",first_samples=25,deadline=-1):
+        #A generator of 2d slices from first_samples up to samples, coarse to fine, see get_progressive_levels.
+        #Where a level's grid holds the one below it the samples already calculated are reused and only the gaps filled in
+        #deadline : float = -1
+        #    Seconds after which no more refinement is started, -1 is no deadline
+        if first_samples < 2:
+            raise ValueError("first_samples must be at least 2")
+        start = datetime.datetime.now()
+        key = self.slice_cache.make_key(central,linear,planar,width,samples,interp_method.lower(),1,deriv,fo,fc,self.as_sd)
+        cached = self.slice_cache.get(key)
+        if cached is not None:
+            yield cached[0].copy().get_as(ret_type)
+            return
+        levels = self.get_progressive_levels(samples,first_samples)
+        prev_samples,prev_vals = -1,None
+        for level in levels:
+            self.make_interper_if_needed(interp_method,log_level,fo,fc)
+            spc = space.SpaceTransform(central, linear, planar)
+            gm = grid.GridMaker()
+            xyz_coords = spc.convert_coords(gm.get_unit_grid(width,level))
+            vals = np.zeros((level,level))
+            todo = np.ones((level,level),dtype=bool)
+            if prev_vals is not None and (level-1) % (prev_samples-1) == 0:
+                step = (level-1) // (prev_samples-1)
+                vals[::step,::step] = prev_vals
+                todo[::step,::step] = False
+            self._fill_slice(vals,todo,xyz_coords,deriv)
+            ret_vals = d3.Matrix3d(level,level)
+            ret_vals.set_from_np(vals)
+            if level == samples:
+                self.slice_cache.put(key,(ret_vals,xyz_coords))
+            yield ret_vals.copy().get_as(ret_type)
+            prev_samples,prev_vals = level,vals
+            if deadline >= 0 and (datetime.datetime.now() - start).total_seconds() >= deadline:
+                return
+
+    def get_progressive_levels(self,samples,first_samples=25):
+        # The sample counts from first_samples up to samples, coarse to fine.
+        # If samples-1 divides down to first_samples the grids hold each other all the way (eg 193 -> 97 -> 49 -> 25, 
+        # 100 -> 34 -> 25), otherwise the levels double up from first_samples (eg 25, 49, 97 then 200)
+        levels = [samples]
+        while True:
+            gaps,below = levels[0] - 1,-1
+            for factor in range(2,gaps + 1):
+                if gaps // factor + 1 < first_samples:
+                    break
+                if gaps % factor == 0:
+                    below = gaps // factor + 1
+                    break
+            if below < 0:
+                break
+            levels.insert(0,below)
+        if levels[0] - 1 >= 2*(first_samples - 1):
+            # it stopped above the coarse levels
+            levels = [first_samples]
+            while 2*(levels[-1] - 1) + 1 <= (samples - 1)//2 + 1:
+                levels.append(2*(levels[-1] - 1) + 1)
+            levels.append(samples)
+        elif levels[0] > first_samples:
+            levels.insert(0,first_samples)
+        return levels
+
+    def navigate_slice(self,central, linear, planar, nav, nav_distance, width, samples, interp_method, deriv=0, fo=2,fc=-1,log_level=0, ret_type="np",prev_vals=None):
+        # Moves the plane with SpaceTransform.navigate and returns the new points and the slice there.
+        # Give the 2d values of the slice before the move as prev_vals and a pan by whole samples only calculates the new strip.
+        spc = space.SpaceTransform(central, linear, planar)
+        central2 = spc.navigate(central,nav,nav_distance)
+        linear2 = spc.navigate(linear,nav,nav_distance)
+        planar2 = spc.navigate(planar,nav,nav_distance)
+        prev = None
+        if prev_vals is not None:
+            prev = (central, linear, planar, prev_vals)
+        vals = self.get_slice(central2, linear2, planar2, width, samples, interp_method, deriv=deriv, fo=fo,fc=fc,log_level=log_level, ret_type=ret_type,prev=prev)
+        return central2,linear2,planar2,vals
 
-    def get_slice(self,central, linear, planar, width, samples, interp_method, depth_samples=1, deriv=0, fo=2,fc=-1,log_level=0, ret_type="np"):
+    def invalidate_slice_cache(self,interp_method=None,fo=None,fc=None):
+        # Removes cached slices for the interpolator, eg if the values have changed. None matches everything.
+        def matches(key):
+            method_k,fo_k,fc_k = key[5],key[8],key[9]
+            if interp_method is not None and interp_method.lower() != method_k:
+                return False
+            if fo is not None and fo != fo_k:
+                return False
+            if fc is not None and fc != fc_k:
+                return False
+            return True
+        return self.slice_cache.invalidate(matches)
+
+    def _calc_slice(self,central, linear, planar, width, samples, interp_method, depth_samples=1, deriv=0, fo=2,fc=-1,log_level=0):
         # change interpolator if necessary        
         self.make_interper_if_needed(interp_method,log_level,fo,fc)        
         #############        
@@ -93,35 +259,100 @@ class MapFunctions(object):
         spc = space.SpaceTransform(central, linear, planar)        
         gm = grid.GridMaker()        
         #########                                        
+        if depth_samples > 1:
+            # the volume is filled a layer at a time
+            vals = d3.Matrix3d(samples,samples,depth_samples)
+            xyz_coords = d3.Matrix3d(samples,samples,depth_samples,vector=True)
+            for layer,slab,xyz_layer in self.get_slice_slabs(central, linear, planar, width, samples, interp_method, depth_samples, deriv, fo,fc,log_level):
+                vals.npy[:,:,layer] = slab
+                xyz_coords.npy[:,:,layer] = xyz_layer.npy[:,:,0]
+            return vals,xyz_coords
         u_coords = gm.get_unit_grid(width,samples,depth_samples=depth_samples)
         xyz_coords = spc.convert_coords(u_coords)
         crs_coords = self.crs_spc.convert_coords_to_crs(xyz_coords)
-        if depth_samples > 1:    
-            vals = self.interper.get_val_slice3d(crs_coords,deriv=deriv,ret_type=ret_type)        
-            return vals,xyz_coords
-        else:
-            vals = self.interper.get_val_slice(crs_coords,deriv=deriv,ret_type=ret_type)        
-            return vals
+        vals = self.interper.get_val_slice(crs_coords,deriv=deriv,ret_type="3d")        
+        return vals,xyz_coords
+
+    def get_slice_slabs(self,central, linear, planar, width, samples, interp_method, depth_samples, deriv=0, fo=2,fc=-1,log_level=0):
+        # A generator of (layer, 2d values, xyz Matrix3d) through the depth of a 3d slice,
+        # so a large volume can be streamed without holding all its coordinates at once
+        self.make_interper_if_needed(interp_method,log_level,fo,fc)
+        spc = space.SpaceTransform(central, linear, planar)
+        gm = grid.GridMaker()
+        for layer in range(depth_samples):
+            u_coords = gm.get_unit_grid_layer(width,samples,depth_samples,layer)
+            xyz_coords = spc.convert_coords(u_coords)
+            crs_coords = self.crs_spc.xyz_to_crs_array(xyz_coords.get_as_vector_array())
+            slab = self.interper.get_deriv_values(crs_coords.npy,deriv)
+            yield layer,np.asarray(slab,dtype=float).reshape(samples,samples),xyz_coords
+    
+    def _calc_slices(self,central, linear, planar, width, samples, interp_method, derivs, fo=2,fc=-1,log_level=0):
+        self.make_interper_if_needed(interp_method,log_level,fo,fc)
+        spc = space.SpaceTransform(central, linear, planar)
+        gm = grid.GridMaker()
+        u_coords = gm.get_unit_grid(width,samples)
+        xyz_coords = spc.convert_coords(u_coords)
+        crs_coords = self.crs_spc.convert_coords_to_crs(xyz_coords)
+        all_vals = self.interper.get_val_slices(crs_coords,derivs=derivs,ret_type="3d")
+        return all_vals,xyz_coords
     
+    def _get_inplane_shift(self,prev_points,central, linear, planar, width, samples):
+        # The whole sample steps (i,j) the plane has moved within itself, or None if it is not such a move
+        spc_prev = space.SpaceTransform(prev_points[0],prev_points[1],prev_points[2])
+        spc = space.SpaceTransform(central, linear, planar)
+        for ax_prev,ax in [(spc_prev.xAxis,spc.xAxis),(spc_prev.yAxis,spc.yAxis),(spc_prev.zAxis,spc.zAxis)]:
+            if not np.allclose(ax_prev.npy,ax.npy,atol=1e-6):
+                return None
+        gap = width/(samples-1)
+        offset = spc.centre.npy - spc_prev.centre.npy
+        steps = []
+        for ax in [spc_prev.xAxis,spc_prev.yAxis,spc_prev.zAxis]:
+            steps.append(np.dot(offset,ax.npy)/gap)
+        si,sj,sk = steps
+        if abs(sk) > 0.0001 or abs(si-round(si)) > 0.0001 or abs(sj-round(sj)) > 0.0001:
+            return None
+        si,sj = int(round(si)),int(round(sj))
+        if abs(si) >= samples or abs(sj) >= samples:
+            return None
+        return si,sj
+
+    def _calc_slice_shifted(self,prev_vals,shift,central, linear, planar, width, samples, interp_method, deriv=0, fo=2,fc=-1,log_level=0):
+        # The new slice[i,j] is the old slice[i+si,j+sj], only the exposed strip needs interpolating
+        self.make_interper_if_needed(interp_method,log_level,fo,fc)
+        spc = space.SpaceTransform(central, linear, planar)
+        gm = grid.GridMaker()
+        u_coords = gm.get_unit_grid(width,samples)
+        xyz_coords = spc.convert_coords(u_coords)
+        prev_vals = np.asarray(prev_vals,dtype=float).reshape(samples,samples)
+        si,sj = shift
+        vals = np.zeros((samples,samples))
+        exposed = np.ones((samples,samples),dtype=bool)
+        i0,i1 = max(0,-si),min(samples,samples-si)
+        j0,j1 = max(0,-sj),min(samples,samples-sj)
+        vals[i0:i1,j0:j1] = prev_vals[i0+si:i1+si,j0+sj:j1+sj]
+        exposed[i0:i1,j0:j1] = False
+        self._fill_slice(vals,exposed,xyz_coords,deriv)
+        ret_vals = d3.Matrix3d(samples,samples)
+        ret_vals.set_from_np(vals)
+        return ret_vals,xyz_coords
+
+    def _fill_slice(self,vals,todo,xyz_coords,deriv):
+        # interpolates the 2d slice vals only where todo is True
+        if todo.any():
+            xyz_todo = v3.VectorArray(xyz_coords.npy[:,:,0][todo])
+            crs_todo = self.crs_spc.xyz_to_crs_array(xyz_todo)
+            vals[todo] = self.interper.get_deriv_values(crs_todo.npy,deriv)
+
     def get_slice_neighbours(self,central, linear, planar, width, samples,rnge,log_level=0):
-        #############        
-        # objects needed
+        return self.get_slice_neighbours_batch(central, linear, planar, width, samples,rnge,log_level).get_texts()
+
+    def get_slice_neighbours_batch(self,central, linear, planar, width, samples,rnge,log_level=0):
+        # A SliceNeighbours of the atoms near every pixel, the strings are only made for the pixels asked for
         spc = space.SpaceTransform(central, linear, planar)
         gm = grid.GridMaker()        
-        #########                                        
         u_coords = gm.get_unit_grid(width,samples)                
         xyz_coords = spc.convert_coords(u_coords)                
-        in_scope = self.pobj.get_inscope_atoms(central,width+rnge[1],log_level)                
-        a,b,c = xyz_coords.shape()
-        naybs = []
-        for i in range(a):
-            row = []
-            for j in range(b):
-                coord = xyz_coords.get(i,j)                
-                nayb = self.pobj.get_neighbours(coord,rnge,in_scope)
-                row.append(nayb)
-            naybs.append(row)
-        return naybs
+        return snay.SliceNeighbours(self.pobj,xyz_coords,rnge)
             
     def get_xyz(self,crs_coords):
         xyz_coords = self.crs_spc.crs_to_xyz(crs_coords)        
@@ -131,40 +362,107 @@ class MapFunctions(object):
         crs_coords = self.crs_spc.xyz_to_crs(xyz_coords)        
         return crs_coords
 
-    def get_map_projection(self, sliced, xmin=-1,xmax=-1,ymin=-1,ymax=-1):
-        vals = self.interper.get_projection(sliced.lower(), xmin,xmax,ymin,ymax)        
+    def get_slice_projection(self,central, linear, planar, width, samples, interp_method, depth, step=-1, projection="max", deriv=0, fo=2,fc=-1,log_level=0, ret_type="np", batch_size=100000):
+        # A projection in any direction, through the box of the given depth either side of the plane.
+        # Each pixel's ray is marched along the plane's normal and reduced to its max or mean
+        #Paramaters
+        #-----------
+        #depth : float
+        #    The length of the rays in angstroms, centred on the plane
+        #step : float = -1
+        #    The distance between samples along a ray, -1 uses the in plane sample gap
+        #projection : string ("max","mean")
+        #batch_size : int = 100000
+        #    The rays are marched a batch of layers at a time with about this many points
+        if step <= 0:
+            step = width/(samples-1)
+        key = self.slice_cache.make_key(central,linear,planar,width,samples,interp_method.lower(),depth,deriv,fo,fc,self.as_sd,"projection",step,projection)
+        cached = self.slice_cache.get(key)
+        if cached is None:
+            self.make_interper_if_needed(interp_method,log_level,fo,fc)
+            spc = space.SpaceTransform(central, linear, planar)
+            u_coords = grid.GridMaker().get_unit_grid(width,samples)
+            num_steps = int(math.floor(depth/step)) + 1
+            depths = (np.arange(num_steps) - (num_steps-1)/2) * step
+            layers = max(1,batch_size // (samples*samples))
+            u_npy = u_coords.get_as_np()[:,:,0]
+            vals = None
+            for start in range(0,num_steps,layers):
+                batch = depths[start:start+layers]
+                rays = np.repeat(u_npy[None,:,:,:],len(batch),axis=0)
+                rays[:,:,:,2] = batch[:,None,None]
+                xyz = spc.apply_transformations(v3.VectorArray(rays.reshape(-1,3)))
+                crs_coords = self.crs_spc.xyz_to_crs_array(xyz)
+                batch_vals = np.asarray(self.interper.get_deriv_values(crs_coords.npy,deriv),dtype=float).reshape(len(batch),samples,samples)
+                if projection == "mean":
+                    batch_vals = batch_vals.sum(axis=0)
+                    vals = batch_vals if vals is None else vals + batch_vals
+                else:
+                    batch_vals = batch_vals.max(axis=0)
+                    vals = batch_vals if vals is None else np.maximum(vals,batch_vals)
+            if projection == "mean":
+                vals = vals / num_steps
+            cached = d3.Matrix3d(samples,samples)
+            cached.set_from_np(vals)
+            self.slice_cache.put(key,cached)
+        return cached.copy().get_as(ret_type)
+
+    def get_view_projection(self,central, direction, width, samples, interp_method, depth, up=None, step=-1, projection="max", deriv=0, fo=2,fc=-1,log_level=0, ret_type="np"):
+        # The projection looking along a view direction through central, up is the optional in-image y direction
+        view = direction.npy / np.linalg.norm(direction.npy)
+        across = np.zeros(3)
+        if up is not None:
+            across = np.cross(up.npy,view)
+        if up is None or np.linalg.norm(across) <= 1e-6 * np.linalg.norm(up.npy):
+            # no up or one along the view, any direction that is not the view will do
+            across = np.cross(np.eye(3)[np.argmin(np.abs(view))],view)
+        across = across / np.linalg.norm(across)
+        upward = np.cross(view,across)
+        linear = v3.VectorThree(abc=list(central.npy + across))
+        planar = v3.VectorThree(abc=list(central.npy + upward))
+        return self.get_slice_projection(central, linear, planar, width, samples, interp_method, depth, step, projection, deriv, fo,fc,log_level, ret_type)
+
+    def get_map_projection(self, sliced, xmin=-1,xmax=-1,ymin=-1,ymax=-1,projection="max"):
+        vals = self.interper.get_projection(sliced.lower(), xmin,xmax,ymin,ymax,projection)        
         return vals
         
     def get_atoms_projection(self, interp_method,log_level=0):
-        
-        minx,miny,minz = 1000,1000,1000
-        maxx,maxy,maxz = -1000,-1000,-1000
-
-        atoms = self.pobj.get_atom_coords()
+        coords = self.pobj.get_coords_array()
+        if len(coords) == 0:
+            return [],[],[],[],(1000,-1000),(1000,-1000),(1000,-1000)
+        atoms = v3.VectorArray(coords)
         self.make_interper_if_needed(interp_method,log_level,2,-1)
-        crss = []        
-        for atm in atoms:
-            crs_coord = self.get_crs(atm)
-            val = self.interper.get_value(crs_coord.A,crs_coord.B,crs_coord.C)
-            crss.append((crs_coord,val))
+        crss = self.crs_spc.xyz_to_crs_array(atoms).npy
+        vals = np.asarray(self.interper.get_values(crss),dtype=float)
         # now sort on the values
-        sorted_crs = sorted(crss,key=itemgetter(1))
-        xs,ys,zs,vs = [],[],[],[]
-        for co,va in sorted_crs:
-            xs.append(float(co.A))
-            ys.append(float(co.B))
-            zs.append(float(co.C))
-            vs.append(float(va))
-                        
-            minx = float(math.floor(min(minx,float(co.A))))
-            maxx = float(math.ceil(max(maxx,float(co.A))))
-            miny = float(math.floor(min(miny,float(co.B))))
-            maxy = float(math.ceil(max(maxy,float(co.B))))
-            minz = float(math.floor(min(minz,float(co.C))))
-            maxz = float(math.ceil(max(maxz,float(co.C)))  )                   
-        
-        return xs,ys,zs,vs,(minx,maxx),(miny,maxy),(minz,maxz)
-    
+        order = np.argsort(vals,kind="stable")
+        xs,ys,zs,vs = crss[order,0],crss[order,1],crss[order,2],vals[order]
+        minx,maxx = min(1000.0,float(math.floor(xs.min()))),max(-1000.0,float(math.ceil(xs.max())))
+        miny,maxy = min(1000.0,float(math.floor(ys.min()))),max(-1000.0,float(math.ceil(ys.max())))
+        minz,maxz = min(1000.0,float(math.floor(zs.min()))),max(-1000.0,float(math.ceil(zs.max())))
+        return xs.tolist(),ys.tolist(),zs.tolist(),vs.tolist(),(minx,maxx),(miny,maxy),(minz,maxz)
+
+    def get_atoms_density(self, interp_method, coords=None, derivs=[0], fo=2,fc=-1,log_level=0):
+        # The density (and/or its derivatives) at many atoms in one batch, as a DataFrame with a column per deriv
+        #Paramaters
+        #-----------
+        #coords : (N,3) array like or VectorArray = None
+        #    xyz coordinates, None is every atom of the structure in the order of pobj.dataFrame() so it can be joined on the index
+        #derivs : list of int = [0]
+        #    0 density, 1 radient, 2 laplacian, 3 critical point
+        if coords is None:
+            coords = self.pobj.get_table().get_structure_coords()
+        if not isinstance(coords,v3.VectorArray):
+            coords = v3.VectorArray(coords)
+        self.make_interper_if_needed(interp_method,log_level,fo,fc)
+        crs_coords = self.crs_spc.xyz_to_crs_array(coords)
+        all_vals = self.interper.get_derivs_values(crs_coords.npy,derivs)
+        names = {0:"density",1:"radient",2:"laplacian",3:"criticalpoint"}
+        cols = {}
+        for deriv,vals in zip(derivs,all_vals):
+            cols[names[deriv]] = np.asarray(vals,dtype=float)
+        return pd.DataFrame(cols)
+
     def get_map_cross_section(self, sliced,layer):
         vals = self.interper.get_cross_section(sliced.lower(),layer)        
         return vals
@@ -8,7 +8,6 @@ import os
 from os.path import exists
 import urllib.request
 from Bio.PDB.MMCIFParser import MMCIFParser        
-from Bio.PDB.MMCIF2Dict import MMCIF2Dict
 from Bio.PDB.PDBParser import PDBParser
 
 import struct
@@ -24,11 +23,13 @@ from maptial.geo import pdbloader as pload
 from maptial.map import mapfunctions as mfun
 
 class MapLoader(object):
-    def __init__(self, pdb_code, directory="", cif=False):
+    def __init__(self, pdb_code, directory="", cif=False, fast=False, cache=True, cache_key="mtime"):
+        #cache, cache_key :
+        #    The parsed structure is kept in an .npz next to its file, see PdbLoader, so it is only parsed again if it changes
         # PUBLIC INTERFACE
         self.mobj = mobj.MapObject(pdb_code)
         self.pobj = pobj.PdbObject(pdb_code)
-        self.pload = pload.PdbLoader(pdb_code, directory=directory, cif=cif,source="ebi")
+        self.pload = pload.PdbLoader(pdb_code, directory=directory, cif=cif,source="ebi",fast=fast,cache=cache,cache_key=cache_key)
         
         # Private data
         self._ccp4_binary = None
@@ -155,43 +156,17 @@ class MapLoader(object):
 
     def load_pdb(self):
         self.pobj = self.pload.load_pdb()
-        # Having loaded the pdb object there is some info we need for ED        
-        if self._cif:           
-            self._struc_dict = MMCIF2Dict(self._filepath)
-            found_em = False
-            dbs = self._struc_dict['_database_2.database_id']
-            db_vals = self._struc_dict['_database_2.database_code']
-            self.mobj.exp_method = self._struc_dict['_exptl.method'][0]
-            for i in range(0,len(dbs)):
-                db = dbs[i]
-                if db == "EMDB": 
-                    found_em = True
-                    self.mobj.em_code = db_vals[i]
-                    self.em_code = self.mobj.em_code                                                          
-                    self.mobj.resolution = self._struc_dict['_em_diffraction_shell.high_resolution'][0]
-                    self.mobj.em_link = f"https://www.ebi.ac.uk/emdb/{self.em_code}"
-                    break
-            if not found_em:
-                self.mobj.resolution = self._struc_dict['_reflns.d_resolution_high'][0]                                            
-            self.has_both = False           
-        else:
-            self.mobj.resolution = self.pobj.resolution
-            self.mobj.exp_method = self.pobj.exp_method
-            found_em = False
-            with open(self._filepath,"r") as fr:
-                lines = fr.readlines()
-                for line in lines:                    
-                    #REMARK 900 RELATED ID: EMD-6240   RELATED DB: EMDB                              
-                    if "REMARK 900 RELATED ID:" in line and "EMD-" in line and not found_em:
-                        found_em=True
-                        info = line.split(" ")
-                        self.mobj.em_code = info[4]
-                        self.em_code = self.mobj.em_code
-                        self.has_both = False
-                        self.mobj.em_link = f"https://www.ebi.ac.uk/emdb/{self.em_code}"
-                
-        
-            
+        # Having loaded the pdb object there is some info we need for ED, read with the structure
+        metadata = self.pobj.metadata
+        self.mobj.exp_method = metadata["exp_method"]
+        self.mobj.resolution = metadata["resolution"]
+        if self._cif:
+            self.has_both = False
+        if metadata["em_code"] != "":
+            self.mobj.em_code = metadata["em_code"]
+            self.em_code = self.mobj.em_code
+            self.has_both = False
+            self.mobj.em_link = f"https://www.ebi.ac.uk/emdb/{self.em_code}"
         return True
 
     def load_map(self):        
@@ -0,0 +1,136 @@
+"""
+RSA 19/10/26
+
+How well the model fits the map, per atom and per residue, calculated in bulk.
+Per atom: the density at the centre and the average over a sphere, both sigma scaled against the whole map.
+Per residue: the averages of those and the real space correlation (RSCC) between the map and a model density
+made of a gaussian per atom, over the map voxels within the mask radius of the residue's atoms.
+
+"""
+
+import math
+import numpy as np
+from maptial.xyz import vectorthree as v3
+
+# rough electron counts to weight the model density
+ELECTRONS = {"H":1,"C":6,"N":7,"O":8,"P":15,"S":16}
+
+class ModelFit(object):
+    def __init__(self, map_functions, interp_method="linear", radius=1.0, mask_radius=2.0, resolution=-1, fo=2,fc=-1,log_level=0):
+        #Paramaters
+        #-----------
+        #map_functions : MapFunctions
+        #    With both the map and the structure
+        #radius : float = 1.0
+        #    The radius of the sphere averaged around each atom
+        #mask_radius : float = 2.0
+        #    The map voxels within this distance of an atom belong to it for the correlation
+        #resolution : float = -1
+        #    Sets the width of the model gaussians, -1 takes it from the structure
+        self.mf = map_functions
+        self.interp_method = interp_method
+        self.radius = radius
+        self.mask_radius = mask_radius
+        self.resolution = resolution
+        if self.resolution is None or self.resolution <= 0:
+            self.resolution = self.mf.pobj.resolution
+        if self.resolution is None or self.resolution <= 0:
+            self.resolution = 2.0
+        self.fo = fo
+        self.fc = fc
+        self.log_level = log_level
+        self.mf.make_interper_if_needed(interp_method,log_level,fo,fc)
+        self.mean,self.sd = self.mf.interper.get_mean_sd()
+        self.atoms = self.mf.pobj.dataFrame()
+        self.coords = self.atoms[["x","y","z"]].to_numpy(dtype=float)
+
+    def atom_metrics(self):
+        # the atoms DataFrame with density, density_sd and sphere_sd added
+        atoms = self.atoms.copy()
+        dens = self.mf.get_atoms_density(self.interp_method,self.coords,[0],self.fo,self.fc,self.log_level)["density"].to_numpy()
+        offsets = self.get_sphere_offsets()
+        sphere = (self.coords[:,None,:] + offsets[None,:,:]).reshape(-1,3)
+        sphere_dens = self.mf.get_atoms_density(self.interp_method,sphere,[0],self.fo,self.fc,self.log_level)["density"].to_numpy()
+        sphere_dens = sphere_dens.reshape(len(self.coords),len(offsets)).mean(axis=1)
+        atoms["density"] = dens
+        atoms["density_sd"] = (dens - self.mean) / self.sd
+        atoms["sphere_sd"] = (sphere_dens - self.mean) / self.sd
+        return atoms
+
+    def residue_metrics(self, atoms=None):
+        # a DataFrame of a row per residue with the averaged atom metrics and the rscc
+        if atoms is None:
+            atoms = self.atom_metrics()
+        # grouped on the chain and ridx as integers, so residues with an insertion code are kept apart,
+        # and numbered by their first atom so the residues are in the order of the structure
+        chain_codes = np.unique(atoms["chain"].astype(str).to_numpy(),return_inverse=True)[1].reshape(-1)
+        res_keys = np.stack([chain_codes,atoms["ridx"].to_numpy(dtype=int)],axis=1)
+        res_ids,first,res_idx = np.unique(res_keys,axis=0,return_index=True,return_inverse=True)
+        order = np.empty(len(res_ids),dtype=int)
+        order[np.argsort(first,kind="stable")] = np.arange(len(res_ids))
+        res_idx = order[res_idx.reshape(-1)]
+        atoms = atoms.assign(res_idx=res_idx)
+        residues = atoms.groupby("res_idx",sort=True).agg(chain=("chain","first"),rid=("rid","first"),aa=("aa","first"),
+                        atoms=("atom","count"),density_sd=("density_sd","mean"),min_density_sd=("density_sd","min"),
+                        sphere_sd=("sphere_sd","mean"))
+        residues["rscc"] = self.get_rscc(res_idx,len(res_ids))
+        return residues.reset_index(drop=True)
+
+    def get_rscc(self, res_idx, num_res):
+        # the correlation of map and model density per residue, over the voxels masked by its atoms
+        atom_idx,voxels,dists = self.get_atom_voxels()
+        grid_vals = self.mf.interper.get_grid_values()
+        map_vals = grid_vals.reshape(-1)
+        model_vals = self.get_model_density(atom_idx,voxels,dists,grid_vals.shape)
+        # each voxel counted once per residue
+        pairs = np.unique(np.stack([res_idx[atom_idx],voxels],axis=1),axis=0)
+        res,vox = pairs[:,0],pairs[:,1]
+        x,y = map_vals[vox],model_vals[vox]
+        n = np.bincount(res,minlength=num_res).astype(float)
+        sx,sy = np.bincount(res,x,num_res),np.bincount(res,y,num_res)
+        sxx,syy,sxy = np.bincount(res,x*x,num_res),np.bincount(res,y*y,num_res),np.bincount(res,x*y,num_res)
+        with np.errstate(divide="ignore",invalid="ignore"):
+            cov = sxy - sx*sy/n
+            var = (sxx - sx*sx/n) * (syy - sy*sy/n)
+            rscc = cov / np.sqrt(var)
+        return np.where(var > 0,rscc,np.nan)
+
+    def get_atom_voxels(self, chunk_size=1000):
+        # The atom to voxel mask, as aligned arrays of atom index, flattened voxel index and distance
+        # The voxels in a box around each atom's crs position are kept within the mask radius by their real distance
+        #chunk_size : int = 1000
+        #    The atoms whose boxes are made together, bounding the memory to chunk_size boxes
+        crs_coords = self.mf.crs_spc.xyz_to_crs_array(v3.VectorArray(self.coords)).npy
+        FMS = np.array(self.mf.interper.get_grid_values().shape)
+        one = self.mf.crs_spc.crs_to_xyz_array(v3.VectorArray(np.eye(3))).npy - self.mf.crs_spc.crs_to_xyz_array(v3.VectorArray(np.zeros((1,3)))).npy
+        reach = int(math.ceil(self.mask_radius / np.linalg.norm(one,axis=1).min())) + 1
+        steps = np.arange(-reach,reach+1)
+        box = np.stack(np.meshgrid(steps,steps,steps,indexing="ij"),axis=-1).reshape(-1,3)
+        all_idx,all_flat,all_dists = [np.zeros(0,dtype=int)],[np.zeros(0,dtype=int)],[np.zeros(0)]
+        for start in range(0,len(self.coords),chunk_size):
+            coords = self.coords[start:start+chunk_size]
+            voxels = np.floor(crs_coords[start:start+chunk_size]).astype(int)[:,None,:] + box[None,:,:]
+            voxel_xyz = self.mf.crs_spc.crs_to_xyz_array(v3.VectorArray(voxels.reshape(-1,3).astype(float))).npy
+            dists = np.linalg.norm(voxel_xyz.reshape(len(coords),len(box),3) - coords[:,None,:],axis=2)
+            atom_idx,box_idx = np.nonzero(dists <= self.mask_radius)
+            wrapped = np.mod(voxels[atom_idx,box_idx],FMS)
+            all_idx.append(atom_idx + start)
+            all_flat.append(np.ravel_multi_index((wrapped[:,0],wrapped[:,1],wrapped[:,2]),tuple(FMS)))
+            all_dists.append(dists[atom_idx,box_idx])
+        return np.concatenate(all_idx),np.concatenate(all_flat),np.concatenate(all_dists)
+
+    def get_model_density(self, atom_idx, voxels, dists, FMS):
+        # a gaussian per atom weighted by its electrons, only on the masked voxels
+        sigma = 0.225 * self.resolution
+        weights = np.array([ELECTRONS.get(str(ele).upper(),6) for ele in self.atoms["element"]],dtype=float)
+        contrib = weights[atom_idx] * np.exp(-dists**2 / (2*sigma*sigma))
+        model = np.zeros(int(np.prod(FMS)))
+        np.add.at(model,voxels,contrib)
+        return model
+
+    def get_sphere_offsets(self):
+        # a small grid of points within the sphere, the centre included
+        gap = self.radius / 2
+        steps = np.arange(-2,3) * gap
+        offsets = np.stack(np.meshgrid(steps,steps,steps,indexing="ij"),axis=-1).reshape(-1,3)
+        return offsets[np.linalg.norm(offsets,axis=1) <= self.radius + 0.000001]
@@ -0,0 +1,70 @@
+"""
+RSA 19/10/26
+
+A bounded least-recently-used cache of slice results, thread safe for the web viewer.
+Coordinates in the keys are quantised to a tolerance so tiny float differences still hit.
+
+"""
+
+import threading
+from collections import OrderedDict
+
+class SliceCache(object):
+    def __init__(self, max_size=32, tolerance=0.0001):
+        # PUBLIC INTERFACE
+        self.max_size = max_size
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+        # PRIVATE INTERFACE
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def make_key(self, central, linear, planar, *params):
+        pnts = []
+        for pnt in [central, linear, planar]:
+            pnts.append(tuple(int(round(v/self.tolerance)) for v in (pnt.A,pnt.B,pnt.C)))
+        return tuple(pnts) + tuple(params)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, matches=None):
+        # matches is a function of the key, all entries are removed if None
+        with self._lock:
+            if matches is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            gone = [key for key in self._entries if matches(key)]
+            for key in gone:
+                del self._entries[key]
+            return len(gone)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            hit_rate = 0
+            if total > 0:
+                hit_rate = self.hits / total
+            return {"size":len(self._entries),"max_size":self.max_size,
+                    "hits":self.hits,"misses":self.misses,"hit_rate":hit_rate}
@@ -0,0 +1,54 @@
+"""
+RSA 19/10/26
+
+The atoms near each pixel of a slice, found with one ball query over the structure's spatial index.
+They are kept as flat arrays of (pixel, atom, distance) with offsets per pixel, the description
+strings are only made for the pixels that are asked for.
+
+"""
+
+import numpy as np
+
+class SliceNeighbours(object):
+    def __init__(self, pobj, xyz_coords, rnge):
+        #Paramaters
+        #-----------
+        #pobj : PdbObject
+        #xyz_coords : Matrix3d
+        #    The vector coordinates of a 2d slice
+        #rnge : (float,float)
+        #    The min and max distance of an atom from a pixel
+        self.pobj = pobj
+        a,b,c = xyz_coords.shape()
+        self.shape = (a,b)
+        coords = xyz_coords.get_as_np()[:,:,0].reshape(-1,3)
+        self.pixels,self.atoms,self.distances = pobj.get_space().query_radius_pairs(coords,rnge[1],rnge[0])
+        # the pairs for flat pixel p are offsets[p]:offsets[p+1]
+        self.offsets = np.concatenate([[0],np.cumsum(np.bincount(self.pixels,minlength=a*b))])
+
+    def get_atoms(self, i, j):
+        # the (line indices, distances) of the atoms near pixel i,j
+        p = i*self.shape[1] + j
+        start,end = self.offsets[p],self.offsets[p+1]
+        return self.atoms[start:end],self.distances[start:end]
+
+    def get_counts(self):
+        # a 2d array of how many atoms are near each pixel
+        return np.diff(self.offsets).reshape(self.shape)
+
+    def get_text(self, i, j, ishtml=False):
+        # the description string of pixel i,j as PdbObject.get_neighbours makes it
+        a = ""
+        idxs,dists = self.get_atoms(i,j)
+        for idx,dis in zip(idxs,dists):
+            desc = self.pobj.get_row_description(idx,dis)
+            if desc not in a:
+                if ishtml:
+                    a+="<br>......"+ desc
+                else:
+                    a+="\n......"+desc
+        return a
+
+    def get_texts(self, ishtml=False):
+        # every pixel's description as a list of rows
+        return [[self.get_text(i,j,ishtml) for j in range(self.shape[1])] for i in range(self.shape[0])]
@@ -0,0 +1,161 @@
+"""
+RSA 19/10/26
+
+Finds all the critical points of an interpolated map.
+Seeds are the grid cells where each component of the gradient changes sign, these are refined by Newton's method
+on the interpolated gradient and hessian, duplicates are merged through a spatial hash and each point is
+classified by the eigenvalues of its hessian as (rank, signature):
+    (3,-3) maximum, (3,-1) saddle as in a bond, (3,+1) saddle as in a ring, (3,+3) minimum
+
+"""
+
+import numpy as np
+
+# x,y,z are left as nan here as they need the map's crs transform
+CRITICAL_POINT_DTYPE = [("c",float),("r",float),("s",float),("x",float),("y",float),("z",float),("value",float),("rank",int),("signature",int)]
+
+class CriticalPointFinder(object):
+    def __init__(self, interper, max_iter=20, tolerance=0.0001, merge_distance=0.1, batch_size=5000):
+        #Paramaters
+        #-----------
+        #interper : Interpolator
+        #    A smooth one of degree 3 or more, bspline or mv3, as a linear or nearest interpolation has no hessian
+        #max_iter : int = 20
+        #    The most Newton steps for a seed
+        #tolerance : float = 0.0001
+        #    In grid units, a seed has converged when its step is smaller than this
+        #merge_distance : float = 0.1
+        #    In grid units, converged points closer than this are the same critical point
+        #batch_size : int = 5000
+        #    How many seeds are refined together
+        if interper.degree < 3:
+            raise ValueError("Critical points need a smooth interpolator of degree 3 or more, such as bspline or mv3, not degree " + str(interper.degree))
+        self.interper = interper
+        self.max_iter = max_iter
+        self.tolerance = tolerance
+        self.merge_distance = merge_distance
+        self.batch_size = batch_size
+        self.FMS = np.array([interper._F,interper._M,interper._S])
+        # a hessian with no entry above this is flat, where Newton's method has nowhere to go
+        self.flat = max(interper.max - interper.min,abs(interper.max),abs(interper.min),1) * 0.000001
+
+    def find(self, min_value=None, box=None):
+        # A numpy structured array of the critical points with CRITICAL_POINT_DTYPE, positions in crs grid units
+        #min_value : float = None
+        #    Only seed cells that have a corner above this value
+        #box : ((c,r,s),(c,r,s)) = None
+        #    The low and high corners of a region in crs grid units, only the critical points in it are found,
+        #    None is the whole unit cell. The region can cross the edge of the cell, it is taken periodically
+        seeds = self.get_seeds(min_value,box)
+        found = []
+        for start in range(0,len(seeds),self.batch_size):
+            found.append(self.refine(seeds[start:start+self.batch_size]))
+        if len(found) > 0:
+            points = np.concatenate(found)
+        else:
+            points = np.zeros((0,3))
+        if box is not None:
+            points = points[self.in_box(points,box)]
+        points = self.merge(points)
+        return self.classify(points)
+
+    def get_seeds(self, min_value=None, box=None):
+        # the centres of the cells where all 3 components of the grid gradient change sign
+        vals = self.interper._orig
+        cells = np.ones(vals.shape,dtype=bool)
+        for axis in range(3):
+            grad = (np.roll(vals,-1,axis) - np.roll(vals,1,axis)) / 2
+            lo,hi = self._cell_corners(grad)
+            cells &= (lo <= 0) & (hi >= 0)
+        if min_value is not None:
+            lo,hi = self._cell_corners(vals)
+            cells &= hi > min_value
+        seeds = np.argwhere(cells).astype(float) + 0.5
+        if box is not None:
+            seeds = seeds[self.in_box(seeds,box)]
+        return seeds
+
+    def in_box(self, points, box):
+        # which of the crs points are in the box, periodically
+        lo,hi = np.asarray(box[0],dtype=float),np.asarray(box[1],dtype=float)
+        return np.all(np.mod(points - lo,self.FMS) <= hi - lo,axis=1)
+
+    def refine(self, seeds):
+        # Newton's method on the gradient, the points that converge near their seed
+        pnts = np.array(seeds,dtype=float)
+        active = np.ones(len(pnts),dtype=bool)
+        converged = np.zeros(len(pnts),dtype=bool)
+        for it in range(self.max_iter):
+            if not active.any():
+                break
+            val,grads,hessians = self.interper.get_gradients_hessians(pnts[active])
+            idx = np.where(active)[0]
+            # a flat seed would "converge" with a zero step without being a critical point
+            flat = np.abs(hessians).max(axis=(1,2)) < self.flat
+            if flat.any():
+                active[idx[flat]] = False
+                idx,grads,hessians = idx[~flat],grads[~flat],hessians[~flat]
+            steps = -np.einsum("nij,nj->ni",np.linalg.pinv(hessians),grads)
+            # never step more than a cell at a time
+            sizes = np.linalg.norm(steps,axis=1)
+            big = sizes > 1
+            steps[big] = steps[big] / sizes[big,None]
+            pnts[idx] += steps
+            done = sizes < self.tolerance
+            converged[idx[done]] = True
+            active[idx[done]] = False
+        near = np.all(np.abs(pnts - seeds) <= 1.5,axis=1)
+        return np.mod(pnts[converged & near],self.FMS)
+
+    def merge(self, points):
+        # spatial hash of cells the size of the merge distance, checking the neighbouring cells across the periodic edge
+        ncells = np.maximum(np.floor(self.FMS / self.merge_distance).astype(int),1)
+        hashed = {}
+        kept = []
+        for pnt in points:
+            cell = tuple(np.floor(pnt / self.merge_distance).astype(int) % ncells)
+            duplicate = False
+            for di in [-1,0,1]:
+                for dj in [-1,0,1]:
+                    for dk in [-1,0,1]:
+                        near = ((cell[0]+di) % ncells[0],(cell[1]+dj) % ncells[1],(cell[2]+dk) % ncells[2])
+                        for other in hashed.get(near,[]):
+                            diff = np.abs(pnt - other)
+                            diff = np.minimum(diff,self.FMS - diff)
+                            if np.linalg.norm(diff) < self.merge_distance:
+                                duplicate = True
+                if duplicate:
+                    break
+            if not duplicate:
+                hashed.setdefault(cell,[]).append(pnt)
+                kept.append(pnt)
+        return np.array(kept).reshape(-1,3)
+
+    def classify(self, points):
+        table = np.zeros(len(points),dtype=CRITICAL_POINT_DTYPE)
+        if len(points) == 0:
+            return table
+        val,grads,hessians = self.interper.get_gradients_hessians(points)
+        eigs = np.linalg.eigvalsh(hessians)
+        scale = np.maximum(np.abs(eigs).max(axis=1,keepdims=True),self.flat)
+        nonzero = np.abs(eigs) > scale * 0.000001
+        # rank 0 is a flat point not a critical point
+        keep = nonzero.any(axis=1)
+        points,val,eigs,nonzero,table = points[keep],val[keep],eigs[keep],nonzero[keep],table[keep]
+        table["c"],table["r"],table["s"] = points[:,0],points[:,1],points[:,2]
+        table["x"],table["y"],table["z"] = np.nan,np.nan,np.nan
+        table["value"] = val
+        table["rank"] = nonzero.sum(axis=1)
+        table["signature"] = (np.sign(eigs) * nonzero).sum(axis=1)
+        return table
+
+    def _cell_corners(self, grid):
+        # the min and max over the 8 corners of each cell (i,j,k) to (i+1,j+1,k+1)
+        lo,hi = grid.copy(),grid.copy()
+        for di in [0,1]:
+            for dj in [0,1]:
+                for dk in [0,1]:
+                    corner = np.roll(grid,(-di,-dj,-dk),axis=(0,1,2))
+                    lo = np.minimum(lo,corner)
+                    hi = np.maximum(hi,corner)
+        return lo,hi
@@ -79,6 +79,8 @@ class Interpolator(ABC):
         self.TOLERANCE = 2.2204460492503131e-016 # smallest such that 1.0+DBL_EPSILON != 1.0                                
         self.min = np.min(self._npy)
         self.max = np.max(self._npy)
+        self.pool = None # an InterpolatorPool to share the bulk evaluations over processes
+        self._projections = {}
     ############################################################################################################            
     @abstractmethod
     def get_value(self, x, y, z):
@@ -305,35 +307,37 @@ class Interpolator(ABC):
         dd = (va + vb - 2 * val) / (self.h * self.h)
         return dd
                 
+    def get_grid_values(self):
+        # the map values on the grid, as given to the interpolator
+        return self._orig
+
+    def get_mean_sd(self):
+        return float(np.mean(self._orig)),float(np.std(self._orig))
+
     def get_fms(self,f,m,s):
         return self._npy[int(f),int(m),int(s)]
             
-    def get_projection(self,slice,xmin=-1,xmax=-1,ymin=-1,ymax=-1):
-        vals = None        
-        if slice == "xy":        
-            vals = self._orig.max(axis=(2))
-        elif slice == "yz":        
-            vals = self._orig.max(axis=(0))
-        elif slice == "zx":        
-            vals = self._orig.max(axis=(1))
+    def get_projection(self,slice,xmin=-1,xmax=-1,ymin=-1,ymax=-1,projection="max"):
+        #projection : string ("max","sum","mean")
+        #    The whole projections are calculated once and kept, a window is wrapped periodically out of them
+        key = (slice,projection)
+        if key not in self._projections:
+            axis = {"xy":2,"yz":0,"zx":1}[slice]
+            if projection == "sum":
+                self._projections[key] = self._orig.sum(axis=axis)
+            elif projection == "mean":
+                self._projections[key] = self._orig.mean(axis=axis)
+            else:
+                self._projections[key] = self._orig.max(axis=axis)
+        vals = self._projections[key]
         
         if xmin == -1 and xmax == -1 and ymin == -1 and ymax == -1:
-            return vals
+            return vals.copy()
         
         imax,jmax = vals.shape
-        newvals = np.zeros((xmax-xmin,ymax-ymin))
-        for i in range(xmin,xmax):
-            for j in range(ymin,ymax):
-                x,y = i,j
-                a,b = i-xmin,j-ymin
-                while x < 0:
-                    x += imax
-                while y < 0:
-                    y += jmax
-                x = x%imax
-                y = y%jmax
-                newvals[a,b] = vals[x,y]
-        return newvals
+        xs = np.mod(np.arange(xmin,xmax),imax)
+        ys = np.mod(np.arange(ymin,ymax),jmax)
+        return vals[np.ix_(xs,ys)]
     
     def get_cross_section(self,slice,layer):        
         if slice == "xy":        
@@ -462,36 +466,11 @@ class Interpolator(ABC):
         
         
         a,b,c = unit_coords.shape()        
-        coords = []
-        if True:            
-            for i in range(a):                
-                for j in range(b):                    
-                    vec = unit_coords.get(i,j,0)
-                    coords.append([vec.A,vec.B,vec.C])                
-            if deriv == 3:
-                vals = self.get_criticalpoints(coords)
-            elif deriv == 2:
-                vals = self.get_laplacians(coords)
-            elif deriv == 1:
-                vals = self.get_radients(coords)
-            else:
-                vals = self.get_values(coords)            
-            
-            ret_vals = d3.Matrix3d(a,b)
-            count = 0
-            for i in range(a):                                
-                for j in range(b):                                                            
-                    ret_vals.add(i,j,data=vals[count])
-                    count += 1                                                    
-            
-            if ret_type == "np":
-                return ret_vals.get_as_np()
-            elif ret_type == "vals":
-                return ret_vals.matrix
-            elif ret_type == "2d":
-                return ret_vals.get_as_np(is2d=True)
-            else:
-                return ret_vals
+        coords = unit_coords.get_as_vector_array().npy[::c]
+        vals = self.get_deriv_values(coords,deriv)
+        ret_vals = d3.Matrix3d(a,b)
+        ret_vals.set_from_np(np.asarray(vals,dtype=float).reshape(a,b,1))
+        return self.get_ret_type(ret_vals,ret_type)
     
     def get_val_slice3d(self,unit_coords, deriv = 0, ret_type = "3d"):
         
@@ -514,37 +493,115 @@ class Interpolator(ABC):
         
 
         a,b,c = unit_coords.shape()        
-        coords = []
-        if True:            
-            for i in range(a):
-                for j in range(b):
-                    for k in range(c):
-                        vec = unit_coords.get(i,j,k)
-                        coords.append([vec.A,vec.B,vec.C])                
-            if deriv == 3:
-                vals = self.get_criticalpoints(coords)
-            elif deriv == 2:
-                vals = self.get_laplacians(coords)
-            elif deriv == 1:
-                vals = self.get_radients(coords)
-            else:
-                vals = self.get_values(coords)            
-            # put back into shape
-            ret_vals = d3.Matrix3d(a,b,c)
-            count = 0
-            for i in range(a):                                
-                for j in range(b):                                        
-                    for k in range(c):
-                        ret_vals.add(i,j,k=k,data=vals[count])
-                        count += 1                                                    
-            if ret_type == "np":
-                return ret_vals.get_as_np()
-            elif ret_type == "vals":
-                return ret_vals.matrix
-            elif ret_type == "2d":
-                return ret_vals.get_as_np(is2d=True)
-            else:
-                return ret_vals
+        vals = np.zeros((a,b,c))
+        for layer,slab in self.get_val_slabs(unit_coords,deriv):
+            vals[:,:,layer] = slab
+        ret_vals = d3.Matrix3d(a,b,c)
+        ret_vals.set_from_np(vals)
+        return self.get_ret_type(ret_vals,ret_type)
+
+    def get_val_slabs(self,unit_coords, deriv = 0):
+        # A generator of the (layer, 2d values) of a 3d slice a depth layer at a time, so only a layer is worked on at once
+        a,b,c = unit_coords.shape()
+        coords = unit_coords.get_as_np()
+        for layer in range(c):
+            slab = self.get_deriv_values(coords[:,:,layer].reshape(-1,3),deriv)
+            yield layer,np.asarray(slab,dtype=float).reshape(a,b)
+
+    def get_deriv_values(self,coords,deriv=0):
+        if self.pool is not None:
+            return self.pool.get_deriv_values(coords,deriv)
+        if deriv == 3:
+            return self.get_criticalpoints(coords)
+        elif deriv == 2:
+            return self.get_laplacians(coords)
+        elif deriv == 1:
+            return self.get_radients(coords)
+        else:
+            return self.get_values(coords)
+
+    def get_derivs_values(self,coords,derivs=[0,1,2,3]):
+        # several derivatives of the same coordinates in one pass, a list of values aligned with derivs
+        if self.pool is not None:
+            return self.pool.get_derivs_values(coords,derivs)
+        return self.get_derivs_list(coords,derivs)
+
+    def get_derivs_list(self,coords,derivs):
+        # overridden where the derivatives can share the work of their neighbourhood
+        return [self.get_deriv_values(coords,deriv) for deriv in derivs]
+
+    def get_derivs_list_numerical(self,xyz,derivs):
+        # A single 7 point stencil around each coordinate gives the value, the forward difference radient
+        # and the central difference laplacian and critical point, as the individual numerical functions do
+        xyz = np.asarray(xyz,dtype=float)
+        if set(derivs) <= {0}:
+            vals = np.asarray(self.get_values(xyz),dtype=float)
+            return [vals for deriv in derivs]
+        h = self.h
+        offsets = np.array([[0,0,0],[-h,0,0],[h,0,0],[0,-h,0],[0,h,0],[0,0,-h],[0,0,h]])
+        stencil = (xyz[:,None,:] + offsets[None,:,:]).reshape(-1,3)
+        svals = np.asarray(self.get_values(stencil),dtype=float).reshape(-1,7)
+        val = svals[:,0]
+        dx = (svals[:,2] - val) / h
+        dy = (svals[:,4] - val) / h
+        dz = (svals[:,6] - val) / h
+        rad = np.abs(dx) + np.abs(dy) + np.abs(dz)
+        ddx = (svals[:,1] + svals[:,2] - 2 * val) / (h * h)
+        ddy = (svals[:,3] + svals[:,4] - 2 * val) / (h * h)
+        ddz = (svals[:,5] + svals[:,6] - 2 * val) / (h * h)
+        lap = ddx + ddy + ddz
+        signs = np.where(ddx < 0,-1,1) + np.where(ddy < 0,-1,1) + np.where(ddz < 0,-1,1)
+        cps = np.where(np.abs(rad) < 1.5,signs,0)
+        by_deriv = {0:val,1:rad,2:lap,3:cps}
+        return [by_deriv[deriv] for deriv in derivs]
+
+    def get_gradients_hessians(self,xyz):
+        # Central difference gradients (N,3) and hessians (N,3,3) from a 19 point stencil per coordinate
+        xyz = np.asarray(xyz,dtype=float)
+        h = self.h
+        offsets = [[0,0,0]]
+        for i in range(3):
+            for sign in [-1,1]:
+                off = [0,0,0]
+                off[i] = sign*h
+                offsets.append(off)
+        pairs = [(0,1),(0,2),(1,2)]
+        for i,j in pairs:
+            for si,sj in [(1,1),(1,-1),(-1,1),(-1,-1)]:
+                off = [0,0,0]
+                off[i],off[j] = si*h,sj*h
+                offsets.append(off)
+        offsets = np.array(offsets)
+        stencil = (xyz[:,None,:] + offsets[None,:,:]).reshape(-1,3)
+        svals = np.asarray(self.get_values(stencil),dtype=float).reshape(len(xyz),len(offsets))
+        val = svals[:,0]
+        grads = np.zeros((len(xyz),3))
+        hessians = np.zeros((len(xyz),3,3))
+        for i in range(3):
+            minus,plus = svals[:,1+2*i],svals[:,2+2*i]
+            grads[:,i] = (plus - minus) / (2 * h)
+            hessians[:,i,i] = (plus + minus - 2 * val) / (h * h)
+        for p in range(len(pairs)):
+            i,j = pairs[p]
+            pp,pm,mp,mm = [svals[:,7+4*p+q] for q in range(4)]
+            hessians[:,i,j] = (pp - pm - mp + mm) / (4 * h * h)
+            hessians[:,j,i] = hessians[:,i,j]
+        return val,grads,hessians
+
+    def get_val_slices(self,unit_coords, derivs=[0], ret_type="vals"):
+        # a 2d slice per derivative from one pass over the coordinates
+        a,b,c = unit_coords.shape()
+        coords = unit_coords.get_as_vector_array().npy[::c]
+        all_vals = self.get_derivs_values(coords,derivs)
+        slices = []
+        for vals in all_vals:
+            ret_vals = d3.Matrix3d(a,b)
+            ret_vals.set_from_np(np.asarray(vals,dtype=float).reshape(a,b,1))
+            slices.append(self.get_ret_type(ret_vals,ret_type))
+        return slices
+
+    def get_ret_type(self,ret_vals,ret_type):
+        return ret_vals.get_as(ret_type)
         
 
     def build_cube_around(self, x, y, z, width):        
@@ -851,6 +908,31 @@ class Multivariate(Interpolator):
     def get_criticalpoints(self, xyz):
         return self.get_criticalpoints_individual(xyz)
     ## iplement abstract interface ###########################################
+
+    def get_derivs_list(self, xyz, derivs):
+        # the polynomial is fitted once per point and shared by all the derivatives
+        all_vals = [[] for deriv in derivs]
+        for x,y,z in xyz:
+            u_x, u_y, u_z = self.get_adjusted_fms(x,y,z)
+            xn,yn,zn,coeffs = self.make_coeffs(u_x,u_y,u_z)
+            by_deriv = {}
+            if 0 in derivs:
+                by_deriv[0] = self.get_value_multivariate(zn, yn, xn, coeffs)
+            if 1 in derivs or 3 in derivs:
+                dx = self.get_value_multivariate(zn, yn, xn, coeffs,["x"])
+                dy = self.get_value_multivariate(zn, yn, xn, coeffs,["y"])
+                dz = self.get_value_multivariate(zn, yn, xn, coeffs,["z"])
+                by_deriv[1] = self.make_radient(dx,dy,dz)
+            if 2 in derivs or 3 in derivs:
+                ddx = self.get_value_multivariate(zn, yn, xn, coeffs,["x","x"])
+                ddy = self.get_value_multivariate(zn, yn, xn, coeffs,["y","y"])
+                ddz = self.get_value_multivariate(zn, yn, xn, coeffs,["z","z"])
+                by_deriv[2] = self.make_laplacian(ddx,ddy,ddz)
+                if 3 in derivs:
+                    by_deriv[3] = self.make_criticalpoint(ddx,ddy,ddz,by_deriv[1])
+            for i in range(len(derivs)):
+                all_vals[i].append(by_deriv[derivs[i]])
+        return all_vals
                
     def get_value_multivariate(self, x, y, z, coeffs,wrt=[]):        
         #This is using a value scheme that makes sens of our new fitted polyCube
@@ -970,6 +1052,9 @@ class Bspline(Interpolator):
     def get_criticalpoints(self, xyz):
         return self.get_criticalpoints_individual(xyz)
 
+    def get_derivs_list(self, xyz, derivs):
+        return self.get_derivs_list_numerical(xyz,derivs)
+
     def get_value(self, x, y, z):
         u_x, u_y, u_z = x,y,z        
         # the values need to be within the buffer zone
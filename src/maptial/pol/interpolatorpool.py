@@ -0,0 +1,94 @@
+"""
+RSA 19/10/26
+
+A pool of worker processes that evaluate an interpolator over chunks of coordinates.
+The prepared grid (values, padded values or spline coefficients) is put once into shared memory,
+so the workers attach to it rather than each being sent a copy of the map.
+
+"""
+
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# the arrays of an interpolator that are big enough to share, anything else is pickled to the workers
+SHARED_ARRAYS = ["_npy","_coeffs"]
+
+# worker process state, set once by _init_worker
+_worker_interper = None
+_worker_shms = []
+
+def _init_worker(skeleton, shared):
+    global _worker_interper, _worker_shms
+    _worker_interper = skeleton
+    _worker_shms = []
+    for name,(shm_name,shape,dtype) in shared.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_shms.append(shm) # keep the memory open for the life of the worker
+        setattr(_worker_interper,name,np.ndarray(shape,dtype=dtype,buffer=shm.buf))
+
+def _eval_chunk(args):
+    coords,deriv = args
+    if isinstance(deriv,list):
+        return np.asarray(_worker_interper.get_derivs_values(coords,deriv),dtype=float)
+    return np.asarray(_worker_interper.get_deriv_values(coords,deriv),dtype=float)
+
+class InterpolatorPool(object):
+    def __init__(self, interper, processes=4, chunk_size=2000):
+        #Paramaters
+        #-----------
+        #interper : Interpolator
+        #    An initialised interpolator, its prepared grid is copied once into shared memory
+        #processes : int = 4
+        #chunk_size : int = 2000
+        #    The number of coordinates sent to a worker at a time
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._shms = []
+        shared = {}
+        skeleton = copy.copy(interper)
+        skeleton.pool = None
+        skeleton._orig = None # only used for projections which are not done in the workers
+        skeleton._projections = {}
+        for name in SHARED_ARRAYS:
+            arr = getattr(interper,name,None)
+            if isinstance(arr,np.ndarray):
+                shm = shared_memory.SharedMemory(create=True,size=max(arr.nbytes,1))
+                np.ndarray(arr.shape,dtype=arr.dtype,buffer=shm.buf)[:] = arr
+                self._shms.append(shm)
+                shared[name] = (shm.name,arr.shape,arr.dtype)
+                setattr(skeleton,name,None)
+        self._pool = multiprocessing.get_context().Pool(processes,initializer=_init_worker,initargs=(skeleton,shared))
+
+    def get_deriv_values(self, coords, deriv=0):
+        # coords is an (N,3) array of crs coordinates, the values come back in the same order
+        return self._map_chunks(coords,deriv,np.zeros(0))
+
+    def get_derivs_values(self, coords, derivs):
+        # a list of values aligned with derivs, from one pass over the coordinates
+        derivs = list(derivs)
+        vals = self._map_chunks(coords,derivs,np.zeros((len(derivs),0)))
+        return [vals[i] for i in range(len(derivs))]
+
+    def _map_chunks(self, coords, deriv, empty):
+        coords = np.asarray(coords,dtype=float)
+        if len(coords) == 0:
+            return empty
+        num_chunks = max(self.processes,int(np.ceil(len(coords)/self.chunk_size)))
+        chunks = [(chunk,deriv) for chunk in np.array_split(coords,num_chunks) if len(chunk) > 0]
+        return np.concatenate(self._pool.map(_eval_chunk,chunks),axis=-1)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
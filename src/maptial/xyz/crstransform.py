@@ -10,6 +10,7 @@ from maptial.xyz import matrixthree as m3
 from maptial.xyz import matrix3d as d3
 
 import math
+import numpy as np
 
 class CrsTransform(object):
     def __init__(self,  dim_order,
@@ -79,6 +80,31 @@ class CrsTransform(object):
         s = vCRS.get_by_idx(self.map2crs[2]);        
         return v3.VectorThree(c,r,s);
 
+    def crs_to_xyz_array(self, CRS):
+        # The same as crs_to_xyz for a VectorArray of many points at once
+        crs_vals = CRS.npy
+        samp = np.array(self.axis_sampling,dtype=float)
+        if (self.angles[0] == 90 and self.angles[1] == 90 and self.angles[2] == 90):
+            cell = np.array(self.cell_dims,dtype=float)
+            xyz_vals = crs_vals[:,self.map2crs] * (cell/samp) + self.origin.npy
+        else:
+            starts = np.array(self.crs_starts,dtype=float)
+            frac_vals = (crs_vals[:,self.map2xyz] + starts[self.map2xyz]) / samp
+            xyz_vals = frac_vals @ self.orthoMat.npy.T
+        return v3.VectorArray(xyz_vals)
+
+    def xyz_to_crs_array(self, XYZ):
+        # The same as xyz_to_crs for a VectorArray of many points at once
+        xyz_vals = XYZ.npy
+        samp = np.array(self.axis_sampling,dtype=float)
+        if (self.angles[0] == 90 and self.angles[1] == 90 and self.angles[2]== 90):
+            cell = np.array(self.cell_dims,dtype=float)
+            crs_vals = (xyz_vals - self.origin.npy) / (cell/samp)
+        else:
+            starts = np.array(self.crs_starts,dtype=float)
+            crs_vals = (xyz_vals @ self.deOrthoMat.npy.T) * samp - starts[self.map2xyz]
+        return v3.VectorArray(crs_vals[:,self.map2crs])
+
     def convert_coords_to_xyz(self,crs_coords):
         coords = []
         for i in range(len(crs_coords)):
@@ -92,13 +118,8 @@ class CrsTransform(object):
     
     def convert_coords_to_crs(self,xyz_coords):
         a,b,c = xyz_coords.shape()
-        m3 = d3.Matrix3d(a,b,c)        
-        for i in range(a):
-            for j in range(b):
-                for k in range(c):                        
-                    vec = xyz_coords.get(i,j,k=k)
-                    vec_t = self.xyz_to_crs(vec)
-                    m3.add(i,j,k=k,data=vec_t)            
+        m3 = d3.Matrix3d(a,b,c,vector=True)
+        m3.set_from_vector_array(self.xyz_to_crs_array(xyz_coords.get_as_vector_array()))
         return m3
 
     ########## PRIVATE INTERFACE #############
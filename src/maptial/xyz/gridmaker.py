@@ -6,6 +6,7 @@ This class handles transformations in 3d space from a plabe defined by 3 given p
 """
 
 import math
+import numpy as np
 from maptial.xyz import matrix3d as d3
 
 class GridMaker(object):
@@ -18,11 +19,10 @@ class GridMaker(object):
         if depth_samples > 1:
             return self.get_unit_grid3d(width,samples, depth_samples)
         else:
-            mat2 = d3.Matrix3d(samples,samples)
-            for i in range(samples):                
-                for j in range(samples):
-                    tpl = ((i-offset)*gap,(j-offset)*gap,0)
-                    mat2.add(i,j,data=tpl)
+            mat2 = d3.Matrix3d(samples,samples,vector=True)
+            steps = (np.arange(samples)-offset)*gap
+            mat2.npy[:,:,0,0] = steps[:,None]
+            mat2.npy[:,:,0,1] = steps[None,:]
             return mat2
 
     def get_unit_grid3d(self,width,samples,depth_samples):        
@@ -32,16 +32,22 @@ class GridMaker(object):
         depth_offset =(depth_samples-1)/2
         print(samples,samples,depth_samples)
 
-        mat3 = d3.Matrix3d(samples,samples,depth_samples)
-        
-        for i in range(samples):            
-            for j in range(samples):                
-                for k in range(depth_samples):
-                    tpl = ((i-offset)*gap,(j-offset)*gap,(k-depth_offset)*gap)
-                    mat3.add(i,j,k,data=tpl)                            
+        mat3 = d3.Matrix3d(samples,samples,depth_samples,vector=True)
+        steps = (np.arange(samples)-offset)*gap
+        depth_steps = (np.arange(depth_samples)-depth_offset)*gap
+        mat3.npy[:,:,:,0] = steps[:,None,None]
+        mat3.npy[:,:,:,1] = steps[None,:,None]
+        mat3.npy[:,:,:,2] = depth_steps[None,None,:]
         return mat3
 
+    def get_unit_grid_layer(self,width,samples,depth_samples,layer):
+        # the single depth layer of get_unit_grid3d, so a 3d grid can be worked through a layer at a time
+        gap = width/(samples-1)
+        depth_offset =(depth_samples-1)/2
+        mat2 = self.get_unit_grid(width,samples)
+        mat2.npy[:,:,0,2] = (layer-depth_offset)*gap
+        return mat2
+
     
     
                         
-                        
\ No newline at end of file
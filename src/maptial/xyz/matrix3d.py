@@ -1,74 +1,110 @@
 
-
+import numbers
 import numpy as np
+from maptial.xyz import vectorthree as v3
 
 class Matrix3d(object):
-    def __init__(self, width,length,depth=1):        
-        #An arbitrary typed 3d object
+    def __init__(self, width,length,depth=1,vector=False):
+        #An arbitrary typed 3d object, backed by a single numpy array
         #Paramaters
         #-----------
         #width : int
         #length : int
         #depth : int = 1
-        
-        self.matrix = []
+        #vector : bool = False
+        #    If True each element is a 3d point, stored as a trailing axis of 3 floats
+
         self.width = width
         self.length = length
         self.depth = depth
-        for i in range(width):
-            row = []
-            for j in range(length):
-                col = []
-                for k in range(depth):
-                    col.append(0)
-                row.append(col)
-            self.matrix.append(row)
+        self.vector = vector
+        if vector:
+            self.npy = np.zeros((width,length,depth,3))
+        else:
+            self.npy = np.zeros((width,length,depth))
 
-    def shape(self):        
+    def shape(self):
         return (self.width,self.length,self.depth)
 
-    def print(self):        
-        for i in range(self.depth):                        
+    @property
+    def matrix(self):
+        return self.get_as_vals()
+
+    def print(self):
+        for i in range(self.depth):
             print("------")
-            for j in range(self.length):     
-                row = []           
+            for j in range(self.length):
+                row = []
                 for k in range(self.width):
-                    row.append(self.matrix[k][j][i])
+                    row.append(self.get(k,j,i))
                 print(row)
-    
+
     def add(self,i,j,k=0,data=0):
-        self.matrix[i][j][k] = data
-    
+        if self.vector:
+            if isinstance(data,v3.VectorThree):
+                data = (data.A,data.B,data.C)
+        elif self.npy.dtype != object and not isinstance(data,numbers.Number):
+            # only fall back to objects if something other than a number is stored
+            self.npy = self.npy.astype(object)
+        self.npy[i,j,k] = data
+
     def get(self,i,j,k=0):
-        return self.matrix[i][j][k]
+        if self.vector:
+            a,b,c = self.npy[i,j,k]
+            return v3.VectorThree(abc=[float(a),float(b),float(c)])
+        return self.npy[i,j,k]
 
     def set_from_np(self,npy):
-        self.matrix.clear()
-        self.width, self.length, self.depth = npy.shape        
-        for i in range(self.width):
-            row = []
-            for j in range(self.length):
-                col = []
-                for k in range(self.depth):
-                    col.append(npy[i,j,k])
-                row.append(col)
-            self.matrix.append(row)
+        npy = np.asarray(npy)
+        if npy.ndim == 2:
+            npy = npy.reshape(npy.shape[0],npy.shape[1],1)
+        self.width, self.length, self.depth = npy.shape[:3]
+        self.vector = npy.ndim == 4
+        self.npy = npy
 
     def get_as_np(self,is2d=False):
-        np_vals = np.zeros((self.width,self.length,self.depth))
-        for i in range(self.depth):                                    
-            for j in range(self.length):                     
-                for k in range(self.width):
-                    np_vals[k,j,i] = self.get(k,j,k=i)
+        np_vals = self.npy
+        if np_vals.dtype == object:
+            np_vals = np_vals.astype(float)
         if is2d:
             return np_vals[:,:,0]
         else:
             return np_vals
-        
-    def get_as_vals(self):
-        return self.matrix
-                
 
+    def get_as(self,ret_type):
+        # the return types used by the slice functions
+        if ret_type == "np":
+            return self.get_as_np()
+        elif ret_type == "vals":
+            return self.get_as_vals()
+        elif ret_type == "2d":
+            return self.get_as_np(is2d=True)
+        else:
+            return self
+
+    def copy(self):
+        mat = Matrix3d(self.width,self.length,self.depth,vector=self.vector)
+        mat.npy = self.npy.copy()
+        return mat
+
+    def get_as_vals(self):
+        if self.vector:
+            return [[[self.get(i,j,k) for k in range(self.depth)] for j in range(self.length)] for i in range(self.width)]
+        return self.npy.tolist()
 
+    def set_from_vector_array(self,vecs):
+        # vecs is a VectorArray in i,j,k order
+        self.vector = True
+        self.npy = vecs.npy.reshape(self.width,self.length,self.depth,3)
 
-        
\ No newline at end of file
+    def get_as_vector_array(self):
+        # a VectorArray in i,j,k order, a view if this is a vector matrix
+        if self.vector:
+            return v3.VectorArray(self.npy.reshape(-1,3))
+        vals = []
+        for elem in self.npy.reshape(-1):
+            if isinstance(elem,v3.VectorThree):
+                vals.append((elem.A,elem.B,elem.C))
+            else:
+                vals.append(tuple(elem))
+        return v3.VectorArray(vals)
@@ -6,6 +6,7 @@ This class handles transformations in 3d space from a plabe defined by 3 given p
 """
 
 import math
+import numpy as np
 from maptial.xyz import vectorthree as v3
 from maptial.xyz import matrix3d as d3
 
@@ -171,34 +172,26 @@ class SpaceTransform(object):
 
         return pointPrime
 
+    def apply_transformations(self, points):
+        # The same as apply_transformation for a VectorArray of many points
+        # The rotations are linear so they are the unit axes we have already transformed
+        axes = np.array([self.xAxis.npy,self.yAxis.npy,self.zAxis.npy])
+        return v3.VectorArray(points.npy @ axes + self.centre.npy)
+
+    def reverse_transformations(self, points):
+        # The same as reverse_transformation for a VectorArray of many points
+        axes = np.array([self.xAxis.npy,self.yAxis.npy,self.zAxis.npy])
+        return v3.VectorArray((points.npy - self.centre.npy) @ np.linalg.inv(axes))
+
     def convert_coords(self,unit_coords):
-        coords = []
-        # 2d or 3d?
-        if type(unit_coords) is d3.Matrix3d:
-            return self.convert_coords3d(unit_coords)
-        else:
-            a,b = unit_coords.shape()
-            mat2 = d3.Matrix3d(a,b)            
-            for i in range(a):                
-                for j in range(b):
-                    vec = v3.VectorThree(unit_coords.get(i,j)[0],unit_coords.get(i,j)[1],0)
-                    vec_t = self.apply_transformation(vec)                                    
-                    mat2.add(i,j,vec_t)
-            return mat2
+        # 2d or 3d are the same, a 2d grid has a depth of 1
+        a,b,c = unit_coords.shape()
+        mat = d3.Matrix3d(a,b,c,vector=True)
+        mat.set_from_vector_array(self.apply_transformations(unit_coords.get_as_vector_array()))
+        return mat
     
     def convert_coords3d(self,unit_coords):        
-        a,b,c = unit_coords.shape()
-        mat3 = d3.Matrix3d(a,b,c)
-        for i in range(a):            
-            for j in range(b):                
-                for k in range(c):
-                    x = unit_coords.get(i,j,k=k)[0]
-                    y = unit_coords.get(i,j,k=k)[1]
-                    z = unit_coords.get(i,j,k=k)[2]
-                    vec = v3.VectorThree(x,y,z)
-                    vec_t = self.apply_transformation(vec)
-                    mat3.add(i,j,k,vec_t)                            
-        return mat3
+        return self.convert_coords(unit_coords)
                         
 ##### INTERNAL FUNCTIONS ###
     def _get_quadrant(self,x, y):                           
@@ -10,25 +10,25 @@ import numpy as np
 # class interface
 
 class VectorThree(object):
+    # slots rather than a per-instance numpy array, there are a lot of these
+    __slots__ = ("A","B","C","Valid")
+
     def __init__(self, a=0.,b=0.,c=0.,abc=[0.,0.,0.]):    
         if a != 0 or b != 0 or c!=0:
             self.A = a
             self.B = b
             self.C = c        
-            self.Valid = True
-            self.npy = np.zeros((3))
-            self.npy[0] = a
-            self.npy[1] = b
-            self.npy[2] = c
         else:
-            self.npy = np.array(abc)        
-            self.A = self.npy[0]
-            self.B = self.npy[1]
-            self.C = self.npy[2]
-
+            self.A = abc[0]
+            self.B = abc[1]
+            self.C = abc[2]
+        self.Valid = True
 
+    @property
+    def npy(self):
+        # built on demand, it is only needed for matrix multiplication
+        return np.array([self.A,self.B,self.C],dtype=float)
 
-    
     def from_coords(self, coords):    
         coords = coords.strip()
         if coords[0] == "(":
@@ -40,8 +40,7 @@ class VectorThree(object):
         self.B = float(b)
         self.C = float(c) 
         self.Valid = True
-        self.npy = np.array([self.A,self.B,self.C])
-        return VectorThree(abc=self.npy.tolist())
+        return VectorThree(abc=[self.A,self.B,self.C])
                         
     def make_from_key(self,key):                            
         key = key.Substring(1)
@@ -50,20 +49,20 @@ class VectorThree(object):
         self.A = float(sk[0])
         self.B = float(sk[1])
         self.C = float(sk[2])        
-        self.npy = np.array([self.A,self.B,self.C])
         self.Valid = True
         
     def get_by_idx(self,idx):    
-        return  self.npy[idx]   
-        #if idx == 0:
-        #    return self.A;
-        #elif idx == 1:
-        #    return self.B;
-        #else:
-        #    return self.C;
+        if idx == 0:
+            return self.A
+        elif idx == 1:
+            return self.B
+        else:
+            return self.C
         
+    def __getitem__(self,idx):
+        return self.get_by_idx(idx)
+
     def put_by_idx(self, idx, val):
-        self.npy[idx] = val
         if idx == 0:
             self.A = val            
         elif idx == 1:
@@ -139,3 +138,77 @@ def v3_multiply(ABC, PQR):
     B = ABC.B * PQR.B
     C = ABC.C * PQR.C
     return VectorThree(A,B,C)
+
+# array of many vectors, for the bulk code paths
+
+class VectorArray(object):
+    # An N x 3 float array of vectors, column 0,1,2 are A,B,C
+    #Paramaters
+    #-----------
+    #vals : (N,3) array like, or a list of VectorThree
+    __slots__ = ("npy",)
+
+    def __init__(self, vals=[]):
+        if len(vals) > 0 and isinstance(vals[0],VectorThree):
+            self.npy = np.array([[v.A,v.B,v.C] for v in vals],dtype=float)
+        else:
+            self.npy = np.asarray(vals,dtype=float).reshape(-1,3)
+
+    def __len__(self):
+        return self.npy.shape[0]
+
+    def __getitem__(self, idx):
+        return self.get_vector(idx)
+
+    @property
+    def A(self):
+        return self.npy[:,0]
+    @property
+    def B(self):
+        return self.npy[:,1]
+    @property
+    def C(self):
+        return self.npy[:,2]
+
+    def get_vector(self, idx):
+        a,b,c = self.npy[idx]
+        return VectorThree(abc=[float(a),float(b),float(c)])
+
+    def to_vectors(self):
+        return [VectorThree(abc=row) for row in self.npy.tolist()]
+
+    def distance(self,ABC):
+        # ABC is a VectorThree (distances to a single point) or a VectorArray of the same length
+        dif = self.npy - _as_npy(ABC)
+        return np.sqrt(np.einsum("ij,ij->i",dif,dif))
+
+    def magnitude(self):
+        return np.sqrt(np.einsum("ij,ij->i",self.npy,self.npy))
+
+    def dot_product(self,ABC):
+        other = np.broadcast_to(_as_npy(ABC),self.npy.shape)
+        return np.einsum("ij,ij->i",self.npy,other)
+
+    def get_angle(self,ABC):
+        other = VectorArray(np.broadcast_to(_as_npy(ABC),self.npy.shape))
+        cosTheta = self.dot_product(other) / (self.magnitude() * other.magnitude())
+        return np.arccos(np.clip(cosTheta,-1,1)) #in radians
+
+def _as_npy(ABC):
+    if isinstance(ABC,VectorThree):
+        return np.array([ABC.A,ABC.B,ABC.C],dtype=float)
+    elif isinstance(ABC,VectorArray):
+        return ABC.npy
+    return np.asarray(ABC,dtype=float)
+
+def va_add(ABC, PQR):
+    return VectorArray(_as_npy(ABC) + _as_npy(PQR))
+
+def va_subtract(ABC, PQR):
+    return VectorArray(_as_npy(ABC) - _as_npy(PQR))
+
+def va_divide(ABC, PQR):
+    return VectorArray(_as_npy(ABC) / _as_npy(PQR))
+
+def va_multiply(ABC, PQR):
+    return VectorArray(_as_npy(ABC) * _as_npy(PQR))
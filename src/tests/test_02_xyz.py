@@ -0,0 +1,53 @@
+import os, sys
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(Path(__file__).parent)))
+
+import numpy as np
+from maptial.xyz import vectorthree as v3
+from maptial.xyz import spacetransform as space
+from maptial.xyz import crstransform as crs
+from maptial.xyz import matrix3d as d3
+from maptial.xyz import gridmaker as grid
+
+def test_vector_array():
+    print("test_vector_array")
+    vecs = [v3.VectorThree(1,2,3),v3.VectorThree(4,5,6)]
+    arr = v3.VectorArray(vecs)
+    assert len(arr) == 2
+    ref = v3.VectorThree(1,0,0)
+    for i in range(len(vecs)):
+        assert abs(arr.distance(ref)[i] - vecs[i].distance(ref)) < 1e-12
+        assert abs(arr.get_angle(ref)[i] - vecs[i].get_angle(ref)) < 1e-12
+        assert abs(arr.dot_product(ref)[i] - vecs[i].dot_product(ref)) < 1e-12
+    assert v3.va_subtract(arr,arr).magnitude().max() == 0
+    
+def test_bulk_transforms():
+    print("test_bulk_transforms")
+    pts = np.array([[0.5,-1,2],[3,0.25,-4],[0,0,0]])
+    spc = space.SpaceTransform(v3.VectorThree(1,2,3),v3.VectorThree(4,-2,1),v3.VectorThree(0,5,-1))
+    bulk = spc.apply_transformations(v3.VectorArray(pts))
+    ct = crs.CrsTransform([40,50,60],[-3,5,7],[48,56,64],[2,0,1],[30.,40.,50.],[80.,100.,110.])
+    bulk_crs = ct.xyz_to_crs_array(bulk)
+    for i in range(len(pts)):
+        one = spc.apply_transformation(v3.VectorThree(abc=list(pts[i])))
+        assert abs(one.distance(bulk[i])) < 1e-6
+        one_crs = ct.xyz_to_crs(one)
+        assert abs(one_crs.distance(bulk_crs[i])) < 1e-6
+    
+def test_matrix3d():
+    print("test_matrix3d")
+    mat = d3.Matrix3d(2,3)
+    mat.add(1,2,data=5.5)
+    assert mat.shape() == (2,3,1)
+    assert mat.get(1,2) == 5.5
+    assert mat.get_as_np(is2d=True)[1,2] == 5.5
+    assert mat.get_as_vals()[1][2][0] == 5.5
+    gm = grid.GridMaker()
+    u_coords = gm.get_unit_grid(4,5)
+    assert u_coords.get(0,4).A == -2 and u_coords.get(0,4).B == 2
+    assert len(u_coords.get_as_vector_array()) == 25
+
+if __name__ == "__main__":    
+    test_vector_array()
+    test_bulk_transforms()
+    test_matrix3d()
@@ -0,0 +1,319 @@
+import os, sys, tempfile
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(Path(__file__).parent)))
+
+from maptial.xyz import vectorthree as v3
+from maptial.xyz import spacetransform as space
+from maptial.xyz import gridmaker as grid
+from maptial.map import slicecache as scache
+from maptial.map import mapobject as mobj
+from maptial.map import mapfunctions as mfun
+from maptial.map import modelfit as mfit
+from maptial.pol import interpolator as pol
+from maptial.pol import criticalfinder as cfind
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbobject as pdbo
+import numpy as np
+
+DATADIR = os.path.join(os.path.dirname(Path(__file__).parent),"data","")
+
+def make_map_functions(interp_method="linear",processes=1,pobj=None):
+    # a small synthetic orthogonal map so no map files are needed
+    F,M,S = 16,14,12
+    mo = mobj.MapObject("test")
+    hdr = mo.map_header
+    hdr["01_NC"],hdr["02_NR"],hdr["03_NS"] = F,M,S
+    hdr["05_NCSTART"],hdr["06_NRSTART"],hdr["07_NSSTART"] = 0,0,0
+    hdr["08_NX"],hdr["09_NY"],hdr["10_NZ"] = F,M,S
+    hdr["11_X_length"],hdr["12_Y_length"],hdr["13_Z_length"] = 16.,14.,12.
+    hdr["14_Alpha"],hdr["15_Beta"],hdr["16_Gamma"] = 90.,90.,90.
+    hdr["17_MAPC"],hdr["18_MAPR"],hdr["19_MAPS"] = 1,2,3
+    mo.F,mo.M,mo.S = F,M,S
+    x,y,z = np.meshgrid(np.arange(F),np.arange(M),np.arange(S),indexing="ij")
+    mo.values = np.sin(2*np.pi*x/F) * np.cos(2*np.pi*y/M) + np.sin(2*np.pi*z/S)
+    return mfun.MapFunctions("test",mo,pobj,interp_method,processes=processes)
+
+def test_slice_cache():
+    print("test_slice_cache")
+    cache = scache.SliceCache(max_size=2,tolerance=0.001)
+    c,l,p = v3.VectorThree(1,2,3),v3.VectorThree(2,2,3),v3.VectorThree(1,3,3)
+    key = cache.make_key(c,l,p,5,20,"linear",1,0,2,-1)
+    assert key == cache.make_key(v3.VectorThree(1.0000001,2,3),l,p,5,20,"linear",1,0,2,-1)
+    assert cache.get(key) is None
+    cache.put(key,"slice1")
+    assert cache.get(key) == "slice1"
+    cache.put(cache.make_key(c,l,p,5,21,"linear",1,0,2,-1),"slice2")
+    cache.put(cache.make_key(c,l,p,5,22,"linear",1,0,2,-1),"slice3")
+    assert cache.size() == 2
+    assert cache.get(key) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+    assert cache.invalidate(lambda k: k[4] == 21) == 1
+    assert cache.size() == 1
+
+def test_map_slice_cache():
+    print("test_map_slice_cache")
+    mf = make_map_functions()
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7,6),v3.VectorThree(8,8,6)
+    first = mf.get_slice(c,l,p,6,10,"linear",ret_type="2d")
+    expected = first.copy()
+    # a caller changing its slice does not change the cached one
+    first[:] = 100
+    second = mf.get_slice(c,l,p,6,10,"linear",ret_type="2d")
+    assert mf.slice_cache.stats()["hits"] == 1
+    assert np.allclose(second,expected)
+    second[:] = -100
+    assert np.allclose(mf.get_slices(c,l,p,6,10,"linear",ret_type="2d")[0],expected)
+    # only the matching entries are invalidated
+    mf.get_slice(c,l,p,6,10,"linear",deriv=1,ret_type="2d")
+    assert mf.slice_cache.size() == 2
+    assert mf.invalidate_slice_cache(interp_method="bspline") == 0
+    assert mf.invalidate_slice_cache(interp_method="linear",fo=2,fc=-1) == 2
+    assert mf.slice_cache.size() == 0
+    misses = mf.slice_cache.stats()["misses"]
+    assert np.allclose(mf.get_slice(c,l,p,6,10,"linear",ret_type="2d"),expected)
+    assert mf.slice_cache.stats()["misses"] == misses + 1
+
+def test_progressive_slice():
+    print("test_progressive_slice")
+    mf = make_map_functions()
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7,6),v3.VectorThree(8,8,6)
+    slices = list(mf.get_slice(c,l,p,6,49,"linear",ret_type="2d",progressive=True,first_samples=13))
+    assert [s.shape[0] for s in slices] == [13,25,49]
+    full = make_map_functions().get_slice(c,l,p,6,49,"linear",ret_type="2d")
+    assert np.allclose(slices[-1],full)
+    assert np.allclose(slices[0],full[::4,::4])
+    slices = list(mf.get_slice(c,l,p,6,97,"linear",ret_type="2d",progressive=True,first_samples=13,deadline=0))
+    assert len(slices) == 1
+    # sizes that don't halve down still get the levels between
+    assert mf.get_progressive_levels(200,25) == [25,49,97,200]
+    assert mf.get_progressive_levels(100,25) == [25,34,100]
+    assert mf.get_progressive_levels(1,2) == [1]
+    for samples in [100,200]:
+        slices = list(mf.get_slice(c,l,p,6,samples,"linear",ret_type="2d",progressive=True))
+        assert [s.shape[0] for s in slices] == mf.get_progressive_levels(samples,25)
+        for level in slices:
+            assert np.allclose(level,make_map_functions().get_slice(c,l,p,6,level.shape[0],"linear",ret_type="2d"))
+    try:
+        next(mf.get_slice(c,l,p,6,49,"linear",progressive=True,first_samples=1))
+        assert False
+    except ValueError:
+        pass
+
+def test_navigate_slice():
+    print("test_navigate_slice")
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7.5,6),v3.VectorThree(8,8,6.5)
+    width,samples = 6,13
+    mf = make_map_functions()
+    prev_vals = mf.get_slice(c,l,p,width,samples,"linear",ret_type="2d")
+    # 1 angstrom is 2 sample steps, a pan within the plane reuses the overlap, the others are recalculated
+    for nav,shifted in [("UP",True),("DN",True),("LE",True),("RI",True),("FW",False),("CL",False)]:
+        c2,l2,p2,vals = mf.navigate_slice(c,l,p,nav,1.0,width,samples,"linear",ret_type="2d",prev_vals=prev_vals)
+        assert (mf._get_inplane_shift((c,l,p),c2,l2,p2,width,samples) is not None) == shifted
+        full = make_map_functions().get_slice(c2,l2,p2,width,samples,"linear",ret_type="2d")
+        assert np.allclose(vals,full)
+
+def test_process_pool():
+    print("test_process_pool")
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7,6),v3.VectorThree(8,8,6)
+    full = make_map_functions().get_slice(c,l,p,6,30,"linear",ret_type="2d")
+    mf = make_map_functions(processes=2)
+    pooled = mf.get_slice(c,l,p,6,30,"linear",ret_type="2d")
+    mf.close_pool()
+    assert np.allclose(pooled,full)
+
+def test_get_slices():
+    print("test_get_slices")
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7,6),v3.VectorThree(8,8,6)
+    mf = make_map_functions("bspline")
+    together = mf.get_slices(c,l,p,4,8,"bspline",derivs=[0,1,2,3],ret_type="2d")
+    mf = make_map_functions("bspline")
+    for deriv in [0,1,2,3]:
+        single = mf.get_slice(c,l,p,4,8,"bspline",deriv=deriv,ret_type="2d")
+        assert np.allclose(single,together[deriv])
+
+def test_critical_points():
+    print("test_critical_points")
+    mf = make_map_functions("bspline")
+    table = mf.get_critical_points(min_value=1.5)
+    maxima = table[table["signature"] == -3]
+    assert len(maxima) > 0 and np.all(table["rank"] == 3)
+    # sin(2pi x/16)cos(2pi y/14) + sin(2pi z/12) peaks at 2 at (4,0,3)
+    best = maxima[np.argmax(maxima["value"])]
+    assert abs(best["c"]-4) < 0.1 and min(best["r"],14-best["r"]) < 0.1 and abs(best["s"]-3) < 0.1
+    assert abs(best["value"]-2) < 0.05
+
+def test_critical_points_flat():
+    print("test_critical_points_flat")
+    # linear and nearest have no hessian so cannot find critical points
+    for interp_method in ["linear","nearest"]:
+        try:
+            make_map_functions(interp_method).get_critical_points(interp_method=interp_method)
+            assert False, interp_method + " should need a smooth interpolator"
+        except ValueError:
+            pass
+    # every cell of a constant map is a seed but none is a critical point
+    interper = pol.create_interpolator("bspline",np.ones((16,14,12)),(16,14,12))
+    finder = cfind.CriticalPointFinder(interper)
+    assert len(finder.get_seeds()) == 16*14*12
+    assert len(finder.find()) == 0
+
+def test_critical_points_box():
+    print("test_critical_points_box")
+    mf = make_map_functions("bspline")
+    full = mf.get_critical_points()
+    def inside(table,lo,hi):
+        crs = np.stack([table["c"],table["r"],table["s"]],axis=1)
+        return np.all(np.mod(crs - lo,(16,14,12)) <= np.array(hi) - lo,axis=1)
+    # the points in a box are those of the whole cell that fall in it, also when the box crosses the edge of the cell
+    for lo,hi in [((2,3,1),(9,10,7)),((-4,-3,8),(3,5,14))]:
+        sub = mf.get_critical_points(box=(lo,hi))
+        assert len(sub) > 0
+        expected = full[inside(full,np.array(lo),hi)]
+        assert np.all(inside(sub,np.array(lo),hi))
+        assert len(sub) == len(expected)
+        for pt in sub:
+            near = (abs(expected["c"]-pt["c"]) < 1e-6) & (abs(expected["r"]-pt["r"]) < 1e-6) & (abs(expected["s"]-pt["s"]) < 1e-6)
+            match = expected[near]
+            assert len(match) == 1 and match[0]["signature"] == pt["signature"]
+    # the box of MapFunctions is in angstroms, which for this map are the grid units
+    finder = cfind.CriticalPointFinder(mf.interper)
+    assert len(finder.find(box=((2,3,1),(9,10,7)))) == len(mf.get_critical_points(box=((2,3,1),(9,10,7))))
+
+def test_slice_slabs():
+    print("test_slice_slabs")
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7,6),v3.VectorThree(8,8,6)
+    mf = make_map_functions()
+    vals,xyz = mf.get_slice(c,l,p,6,10,"linear",depth_samples=5)
+    # 3d volumes are not kept in the slice cache
+    assert mf.slice_cache.size() == 0
+    layers = 0
+    for layer,slab,xyz_layer in mf.get_slice_slabs(c,l,p,6,10,"linear",5):
+        assert np.allclose(slab,vals[:,:,layer])
+        assert np.allclose(xyz_layer.npy[:,:,0],xyz.npy[:,:,layer])
+        layers += 1
+    assert layers == 5
+
+def test_projection():
+    print("test_projection")
+    mf = make_map_functions()
+    full = mf.get_map_projection("xy")
+    assert np.allclose(full,mf.mobj.values.max(axis=2))
+    window = mf.get_map_projection("xy",-3,20,2,5)
+    assert window.shape == (23,3)
+    assert np.allclose(window[0],full[13,2:5]) and np.allclose(window[19],full[0,2:5])
+    assert np.allclose(mf.get_map_projection("yz",projection="mean"),mf.mobj.values.mean(axis=0))
+
+def test_slice_projection():
+    print("test_slice_projection")
+    c,l,p = v3.VectorThree(8,7,6),v3.VectorThree(9,7.5,6),v3.VectorThree(8,8,6.5)
+    mf = make_map_functions()
+    vals,xyz = mf.get_slice(c,l,p,6,13,"linear",depth_samples=5)
+    maxs = mf.get_slice_projection(c,l,p,6,13,"linear",2,ret_type="2d",batch_size=200)
+    means = mf.get_slice_projection(c,l,p,6,13,"linear",2,projection="mean",ret_type="2d")
+    assert np.allclose(maxs,vals.max(axis=2))
+    assert np.allclose(means,vals.mean(axis=2))
+
+def test_view_projection():
+    print("test_view_projection")
+    mf = make_map_functions()
+    c,view = v3.VectorThree(8,7,6),v3.VectorThree(0,0,2)
+    auto = mf.get_view_projection(c,view,6,13,"linear",2,ret_type="2d")
+    assert np.all(np.isfinite(auto))
+    # an up along the view cannot set the image so the automatic one is taken
+    for up in [v3.VectorThree(0,0,1),v3.VectorThree(0,0,-3)]:
+        assert np.allclose(mf.get_view_projection(c,view,6,13,"linear",2,up=up,ret_type="2d"),auto)
+    assert np.all(np.isfinite(mf.get_view_projection(c,view,6,13,"linear",2,up=v3.VectorThree(0,1,0),ret_type="2d")))
+
+def test_atoms_density():
+    print("test_atoms_density")
+    po = pl.PdbLoader("6eex",DATADIR,cif=False,cache=False).load_pdb()
+    mf = make_map_functions(pobj=po)
+    dens = mf.get_atoms_density("linear",derivs=[0,1])
+    atoms = po.dataFrame().join(dens)
+    assert len(dens) == len(atoms) and list(dens.columns) == ["density","radient"]
+    first = mf.get_crs(v3.VectorThree(atoms["x"][0],atoms["y"][0],atoms["z"][0]))
+    assert np.isclose(atoms["density"][0],mf.interper.get_value(first.A,first.B,first.C))
+
+def test_atoms_projection():
+    print("test_atoms_projection")
+    po = pl.PdbLoader("6eex",DATADIR,cif=False,cache=False).load_pdb()
+    mf = make_map_functions(pobj=po)
+    xs,ys,zs,vs,bx,by,bz = mf.get_atoms_projection("linear")
+    assert len(xs) == len(po.lines) and vs == sorted(vs)
+    assert bx[0] <= min(xs) and bx[1] >= max(xs)
+    # a structure with no atoms gives the default bounds
+    mf = make_map_functions(pobj=pdbo.PdbObject("empty"))
+    assert mf.get_atoms_projection("linear") == ([],[],[],[],(1000,-1000),(1000,-1000),(1000,-1000))
+
+def test_model_fit():
+    print("test_model_fit")
+    po = pl.PdbLoader("6eex",DATADIR,cif=False,cache=False).load_pdb()
+    fit = mfit.ModelFit(make_map_functions(pobj=po))
+    residues = fit.residue_metrics()
+    assert len(residues) == 7 and residues["atoms"].sum() == len(po.dataFrame())
+    # a map made of the model density fits perfectly
+    atom_idx,voxels,dists = fit.get_atom_voxels()
+    # the mask is the same made a few atoms at a time
+    chunked = fit.get_atom_voxels(chunk_size=7)
+    assert all(np.array_equal(a,b) for a,b in zip((atom_idx,voxels,dists),chunked))
+    shape = fit.mf.mobj.values.shape
+    mf = make_map_functions(pobj=po)
+    mf.mobj.values = fit.get_model_density(atom_idx,voxels,dists,shape).reshape(shape)
+    mf.interper_vals = []
+    mf.make_interper_if_needed("linear",0,2,-1)
+    assert np.allclose(mfit.ModelFit(mf).residue_metrics()["rscc"],1)
+
+def test_model_fit_order():
+    print("test_model_fit_order")
+    # residue numbers of different lengths stay in the order of the structure, not of their text
+    with open(DATADIR + "6eex.pdb") as fr:
+        text = fr.read()
+    for old,new in [(" A 707 "," A  99 "),(" A 708 "," A 100 "),(" A 709 "," A1000 ")]:
+        text = text.replace(old,new)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp,"6eex.pdb"),"w") as fw:
+            fw.write(text)
+        po = pl.PdbLoader("6eex",os.path.join(tmp,""),cif=False).load_pdb()
+    residues = mfit.ModelFit(make_map_functions(pobj=po)).residue_metrics()
+    assert residues["rid"].tolist() == [99,100,1000,710,711,712,801]
+    assert residues["aa"].tolist()[:3] == ["GLY","SER","THR"]
+
+def test_slice_neighbours():
+    print("test_slice_neighbours")
+    po = pl.PdbLoader("6eex",DATADIR,cif=False,cache=False).load_pdb()
+    mf = make_map_functions(pobj=po)
+    c,l,p = v3.VectorThree(3,9,20),v3.VectorThree(4,9,20),v3.VectorThree(3,10,20)
+    naybs = mf.get_slice_neighbours_batch(c,l,p,6,7,(0,2))
+    texts = mf.get_slice_neighbours(c,l,p,6,7,(0,2))
+    assert naybs.get_counts().sum() > 0
+    # against a scan of every atom at every pixel
+    xyz = space.SpaceTransform(c,l,p).convert_coords(grid.GridMaker().get_unit_grid(6,7))
+    coords = np.array([[a["x"],a["y"],a["z"]] for a in po.lines],dtype=float)
+    for i in range(7):
+        for j in range(7):
+            pixel = xyz.get(i,j)
+            dists = np.linalg.norm(coords - np.array([pixel.A,pixel.B,pixel.C]),axis=1)
+            near = np.where(dists <= 2)[0]
+            assert list(naybs.get_atoms(i,j)[0]) == list(near) and naybs.get_counts()[i,j] == len(near)
+            assert np.allclose(naybs.get_atoms(i,j)[1],dists[near])
+            assert texts[i][j] == po.get_neighbours(pixel,(0,2),po.lines)
+
+if __name__ == "__main__":    
+    test_slice_cache()
+    test_map_slice_cache()
+    test_progressive_slice()
+    test_navigate_slice()
+    test_process_pool()
+    test_get_slices()
+    test_critical_points()
+    test_critical_points_flat()
+    test_critical_points_box()
+    test_slice_slabs()
+    test_projection()
+    test_slice_projection()
+    test_view_projection()
+    test_atoms_density()
+    test_atoms_projection()
+    test_model_fit()
+    test_model_fit_order()
+    test_slice_neighbours()
@@ -0,0 +1,305 @@
+import os, sys
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(Path(__file__).parent)))
+
+from maptial.xyz import vectorthree as v3
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbreader as prd
+from maptial.geo import pdbcache as pcache
+import numpy as np
+import pytest
+import tempfile
+
+DATADIR = os.path.join(os.path.dirname(Path(__file__).parent),"data","")
+
+def load_6eex():
+    return pl.PdbLoader("6eex",DATADIR,cif=False,cache=False).load_pdb()
+
+def read_frames(path):
+    # a Parquet or Arrow IPC file as written by geometrystream.write_frames
+    import pyarrow as pa
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pandas()
+    with pa.ipc.open_file(path) as reader:
+        return reader.read_all().to_pandas()
+
+def test_spatial_index():
+    print("test_spatial_index")
+    po = load_6eex()
+    coords = np.array([[a["x"],a["y"],a["z"]] for a in po.lines],dtype=float)
+    anchor = v3.VectorThree(5,10,15)
+    dists = np.linalg.norm(coords - anchor.npy,axis=1)
+    in_scope = po.get_inscope_atoms(anchor,6)
+    assert [po.get_key(a) for a in in_scope] == [po.get_key(po.lines[i]) for i in np.where(dists <= 6)[0]]
+    near_dists,near_idxs = po.get_nearest_atoms([[5,10,15]],k=3)
+    assert list(near_idxs[0]) == list(np.argsort(dists)[:3])
+    batch = po.get_inscope_atoms_batch([[5,10,15],[0,0,0]],6)
+    assert len(batch) == 2 and len(batch[0][0]) == len(in_scope)
+    assert po.get_neighbours(anchor,(0,6)) == po.get_neighbours(anchor,(0,6),in_scope)
+    # atoms that are copies rather than the lines themselves
+    assert po.get_neighbours(anchor,(0,6)) == po.get_neighbours(anchor,(0,6),[dict(a) for a in in_scope])
+
+def test_invalidate():
+    print("test_invalidate")
+    po = load_6eex()
+    atm = po.lines[10]
+    key = po.get_key(atm)
+    po.get_atm_key(key),po.get_table(),po.get_space()
+    # an edit that keeps the number of lines is only seen after invalidate
+    atm["x"],atm["rid"] = atm["x"] + 100,9999
+    assert po.get_table().coords[10,0] != atm["x"]
+    po.invalidate()
+    assert po.get_table().coords[10,0] == atm["x"]
+    assert po.get_inscope_atoms(v3.VectorThree(atm["x"],atm["y"],atm["z"]),0.1) == [atm]
+    assert po.get_atm_key(key) is not atm and po.get_atm_key(po.get_key(atm)) is atm
+    # add_line_string keeps the keys and moves the others on
+    po.add_line_string(9999,1000,"ALA","CA","A","A",0.0,0.0,0.0,1.0,10.0,"C")
+    assert po.get_atm_key("A:1000@CA.A") is po.lines[-1]
+    assert len(po.get_table()) == len(po.lines) and len(po.get_space()) == len(po.lines)
+
+def test_key_index():
+    print("test_key_index")
+    po = load_6eex()
+    atm = po.lines[10]
+    key = po.get_key(atm)
+    assert po.get_atm_key(key) is atm
+    assert po.get_atm_key("Z:1@CA.A") is None
+    coords = po.get_coords_keys([key,"Z:1@CA.A"])
+    assert coords.shape == (2,3)
+    assert np.allclose(coords[0],[atm["x"],atm["y"],atm["z"]]) and np.allclose(coords[1],0)
+
+def test_atom_table():
+    print("test_atom_table")
+    po = load_6eex()
+    table = po.get_table()
+    df = po.dataFrame()
+    assert len(table) == len(po.lines) and len(df) == len(table.order)
+    assert np.allclose(table.get_structure_coords(),df[["x","y","z"]].to_numpy())
+    assert list(table.get_strings("atom",table.order)) == list(df["atom"])
+    assert table.names["chain"] == ["A"] and np.all(table.codes["chain"] == 0)
+    # the accessors read the table, the line dicts are only made when lines is used and match the rows
+    po = load_6eex()
+    key = "A:709@CA.A"
+    first_three = po.get_first_three()
+    text = po.get_neighbours(v3.VectorThree(5,10,15),(0,6))
+    in_scope = po.get_inscope_atoms(v3.VectorThree(5,10,15),6)
+    atm = po.get_atm_key(key)
+    assert len(po.get_atom_coords()) == len(table) and np.allclose(po.get_coords_keys([key]),[[atm["x"],atm["y"],atm["z"]]])
+    assert po._lines is None and po.get_num_lines() == len(table)
+    assert po.lines == table.get_lines() and po.get_atm_key(key) == atm and po.get_first_three() == first_three
+    assert po.get_neighbours(v3.VectorThree(5,10,15),(0,6)) == text and po.get_inscope_atoms(v3.VectorThree(5,10,15),6) == in_scope
+
+def test_fast_reader():
+    print("test_fast_reader")
+    from Bio.PDB import PDBParser, MMCIFIO
+    with open(DATADIR + "6eex.pdb","r") as fr:
+        lines = [line for line in fr.readlines() if line[0:6] in ("ATOM  ","HETATM")]
+    # alternative locations on the first atom, the B one with the higher occupancy, and an inserted residue
+    alt_a = lines[0][:16] + "A" + lines[0][17:54] + "  0.40" + lines[0][60:]
+    alt_b = lines[0][:16] + "B" + lines[0][17:54] + "  0.60" + lines[0][60:]
+    inserted = [line[:26] + "A" + line[27:] for line in lines if line[22:26] == lines[-1][22:26]]
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = tmp + "/"
+        with open(tmpdir + "altr.pdb","w") as fw:
+            fw.writelines([alt_b,alt_a] + lines[1:] + inserted)
+        io = MMCIFIO()
+        io.set_structure(PDBParser(PERMISSIVE=True).get_structure("altr",tmpdir + "altr.pdb"))
+        io.save(tmpdir + "altr.cif")
+        for cif in [False,True]:
+            bio = pl.PdbLoader("altr",tmpdir,cif=cif,cache=False).load_pdb()
+            loader = pl.PdbLoader("altr",tmpdir,cif=cif,fast=True)
+            assert loader.load_pdb_fast()
+            fast = loader.pobj
+            assert fast.lines == bio.lines
+            assert fast.dataFrame().equals(bio.dataFrame())
+            assert fast.resolution == bio.resolution and fast.exp_method == bio.exp_method
+        assert fast.lines[0]["version"] == "A" and fast.lines[0]["occupancy"] == 0.4
+        # a residue that comes back is left to Biopython
+        with open(tmpdir + "dupr.pdb","w") as fw:
+            fw.writelines(lines + lines[:3])
+        try:
+            prd.read_pdb(tmpdir + "dupr.pdb")
+            assert False
+        except prd.ReaderFallback:
+            pass
+        assert len(pl.PdbLoader("dupr",tmpdir,fast=True).load_pdb().lines) > 0
+
+def test_metadata():
+    print("test_metadata")
+    with open(DATADIR + "6eex.pdb","r") as fr:
+        lines = fr.readlines()
+    first = [line[0:6] for line in lines].index("ATOM  ")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = tmp + "/"
+        with open(tmpdir + "emx.pdb","w") as fw:
+            fw.writelines(lines[:first] + ["REMARK 900 RELATED ID: EMD-6240   RELATED DB: EMDB\n"] + lines[first:])
+        for fast in [False,True]:
+            po = pl.PdbLoader("emx",tmpdir,fast=fast,cache=False).load_pdb()
+            assert po.metadata == {"exp_method":"x-ray diffraction","resolution":1.1,"em_code":"EMD-6240"}
+        items = prd.read_cif_items(["loop_\n","_database_2.database_id\n","_database_2.database_code\n","PDB 6EEX\n","EMDB EMD-6240\n",
+                                    "_exptl.method 'ELECTRON MICROSCOPY'\n","_em_diffraction_shell.high_resolution 3.20\n"],prd.CIF_CATEGORIES)
+        assert prd.read_cif_metadata(items) == {"exp_method":"ELECTRON MICROSCOPY","resolution":"3.20","em_code":"EMD-6240"}
+
+def test_cache():
+    print("test_cache")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = tmp + "/"
+        with open(DATADIR + "6eex.pdb","r") as fr:
+            lines = fr.readlines()
+        with open(tmpdir + "6eex.pdb","w") as fw:
+            fw.writelines(lines)
+        assert pl.warm_cache(["6eex"],tmpdir) == []
+        assert os.path.exists(tmpdir + "6eex.pdb.npz")
+        bio = pl.PdbLoader("6eex",tmpdir,cache=False).load_pdb()
+        for key in ["mtime","hash"]:
+            loader = pl.PdbLoader("6eex",tmpdir,cache=True,cache_key=key)
+            po = loader.load_pdb()
+            assert loader.load_cache()
+            po = loader.pobj
+            assert po.lines == bio.lines and po.dataFrame().equals(bio.dataFrame())
+            assert po.metadata == bio.metadata and po.resolution == bio.resolution and po.exp_method == bio.exp_method
+            assert [str(res) for res in po.chains["A"].values()] == [str(res) for res in bio.chains["A"].values()]
+        # a changed file is not taken from the cache
+        with open(tmpdir + "6eex.pdb","w") as fw:
+            fw.writelines(lines[:-3])
+        assert pcache.load_pobj("6eex",tmpdir + "6eex.pdb") is None
+        assert len(pl.PdbLoader("6eex",tmpdir,cache=True).load_pdb().lines) == len(bio.lines)
+        # a cif that cannot be read falls back to the pdb file, whose cache is found again
+        with open(tmpdir + "6eex.cif","w") as fw:
+            fw.write("not a cif\n")
+        loader = pl.PdbLoader("6eex",tmpdir,cif=True)
+        loader.load_pdb()
+        assert loader.source_filepath == tmpdir + "6eex.pdb" and loader.load_cache()
+        assert loader.source_filepath == tmpdir + "6eex.pdb" and not os.path.exists(tmpdir + "6eex.cif.npz")
+
+def test_residue_index():
+    print("test_residue_index")
+    from maptial.geo import pdbgeometry as pg
+    po = load_6eex()
+    res = po.get_residue("A",709)
+    assert res is po.chains["A"][709] and po.get_residue("A",1) is None and po.get_residue("Z",709) is None
+    cas = po.get_chain_atoms("A","CA")
+    assert [atm.res.rid for atm in cas] == [rid for rid,res in po.chains["A"].items() if "CA" in res.atoms]
+    assert all(atm.atom_type == "O" for atm in po.get_chain_atoms("A",element="O"))
+    df = pg.GeometryMaker([po]).calculateGeometry(["N:CA","N:CA:C:N+1","CA:{CA&2@0}"])
+    n,ca = po.chains["A"][709].atoms["N"],po.chains["A"][709].atoms["CA"]
+    assert np.isclose(df[df["rid"] == 709]["N:CA"].values[0],v3.VectorThree(n.x,n.y,n.z).distance(v3.VectorThree(ca.x,ca.y,ca.z)),atol=0.001)
+    assert len(df) == len(cas) - 1
+
+def test_nearest_atoms():
+    print("test_nearest_atoms")
+    from maptial.geo import pdbgeometry as pg
+    po = load_6eex()
+    gm = pg.GeometryMaker([po])
+    # the k-d tree matches against a scan of the candidates
+    for chain,resdic in po.chains.items():
+        for rid,res in resdic.items():
+            for atm in res.atoms.values():
+                for geo in ["{O&3@1}","{CA@i}","(O,N&2@0)","{N,O@2}"]:
+                    geo_atom = gm.geoToAtoms("CA:" + geo)[1]
+                    candidates,nearest,criteria = gm.getMatchingAtoms(po,rid,chain,res,atm,geo_atom)
+                    scanned = gm.getNearestAtomMatch(po,atm,candidates,nearest,criteria) if len(candidates) > 0 else []
+                    best,criteria = gm.getBestAtoms(po,rid,chain,res,atm,geo_atom)
+                    assert best == scanned
+    assert po.get_atom_space("A","O") is po.get_atom_space("A","O")
+    assert len(po.get_atom_space()) == sum([len(res.atoms) for res in po.chains["A"].values()])
+    ca = po.chains["A"][709].atoms["CA"]
+    dis,atm,other = gm.getNearestAtom(po,ca,709,"A",["O"],3,1)
+    assert abs(atm.res.rid - 709) >= 3 and other.endswith("|O")
+    assert gm.getNearestAtom(po,ca,709,"A",["O"],3,0) == (0,"","")
+
+def test_array_calculations():
+    print("test_array_calculations")
+    from maptial.geo import geocalculator as calc
+    rng = np.random.default_rng(1)
+    c1,c2,c3,c4 = [rng.uniform(-10,10,(50,3)) for i in range(4)]
+    c4[0] = c3[0] # no dihedral
+    dis = calc.getDistances(c1,c2)
+    angs = calc.getAngles(c1,c2,c3)
+    dihs = calc.getDihedrals(c1,c2,c3,c4)
+    for i in range(50):
+        assert dis[i] == calc.getDistance(*c1[i],*c2[i])
+        assert angs[i] == calc.getAngle(*c1[i],*c2[i],*c3[i])
+        assert dihs[i] == calc.getDihedral(*c1[i],*c2[i],*c3[i],*c4[i])
+    assert dihs[0] == -180
+    # the rounding is python's, halves included
+    vals = np.concatenate([rng.uniform(-180,180,10000),(np.arange(-2000,2000) + 0.5) / 1000,np.round(rng.uniform(-1,1,10000),4)])
+    assert calc._round3(vals).tolist() == [round(val,3) for val in vals.tolist()]
+
+def test_geometry_criteria():
+    print("test_geometry_criteria")
+    from maptial.geo import pdbcontacts as pc
+    from maptial.geo import pdbgeometry as pg
+    po = load_6eex()
+    # N:N:CA has no angle, so it must only be calculated once the criteria are checked
+    cm = pc.ContactMaker([po])
+    for rid in po.chains["A"]:
+        assert cm.calculateContacts(po,"A",rid,cm.geoToAtoms("N:N:CA[dis|>1]")) == []
+    # the rows are the same calculated one residue at a time as all together
+    gm = pg.GeometryMaker([po])
+    for geo in ["N:CA:C:N+1","N:{O@i}[dis|<8]","CA:{O&2@i}[rid|>1]"]:
+        together = gm.calculateGeometries(po,[geo])[0]
+        for chain,res in po.chains.items():
+            for rid in res:
+                one = gm.calculateOneGeometry(po,chain,rid,gm.geoToAtoms(geo),"normal")
+                assert one == together[(chain,rid)]
+    # a tuple with no angle is nan whether a few are calculated one at a time or many as arrays
+    atm = po.chains["A"][709].atoms["CA"]
+    for num in [1,8]:
+        vals = gm.calculateValues([(atm,atm,atm)]*num,"normal")
+        assert len(vals) == num and all(val != val for val in vals)
+
+def test_geometry_pool():
+    print("test_geometry_pool")
+    from maptial.geo import pdbgeometry as pg
+    from maptial.geo import geometrypool as gp
+    geos = ["N:CA","N:CA:C:N+1","CA:{O&3@1}"]
+    pobjs = [load_6eex(),load_6eex()]
+    with gp.GeometryPool(DATADIR,processes=2,cache=False) as pool:
+        assert pool.calculate_geometry(["6eex","6eex"],geos).equals(pg.GeometryMaker(pobjs).calculateGeometry(geos))
+        assert pool.calculate_data(["6eex","6eex"]).equals(pg.GeometryMaker(pobjs).calculateData())
+        assert pool.failed == []
+
+def test_geometry_stream():
+    print("test_geometry_stream")
+    import pandas as pd
+    from maptial.geo import pdbgeometry as pg
+    from maptial.geo import geometrystream as gs
+    geos = ["N:CA","CA:{O&3@1}"]
+    pobj = load_6eex()
+    serial = pg.GeometryMaker([pobj,pobj]).calculateGeometry(geos)
+    frames = list(gs.iter_geometry(["6eex",pobj],geos,DATADIR,cif=False,cache=False))
+    assert len(frames) == 2 and pd.concat(frames,ignore_index=True).equals(serial)
+    pytest.importorskip("pyarrow") # writing needs pyarrow
+    # the first structure has no resolution, and an int column is a float one later
+    first = frames[0].assign(resolution=None)
+    second = frames[1].assign(rid=frames[1]["rid"] + 0.5)
+    mixed = pd.concat([first.assign(resolution=np.nan),second],ignore_index=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for format in ["parquet","arrow"]:
+            path = os.path.join(tmp,"geo." + format)
+            assert gs.write_frames(gs.iter_geometry(["6eex","6eex"],geos,DATADIR,cache=False),path) == len(serial)
+            assert read_frames(path).equals(serial)
+            assert gs.write_frames(iter([first,second]),path) == len(mixed)
+            written = read_frames(path)
+            assert written["resolution"].dtype == float and written["rid"].dtype == float
+            assert written.equals(mixed)
+            # once settled a later frame is cast to the schema
+            assert gs.write_frames(iter([second,first]),path,settle=1) == len(mixed)
+            assert read_frames(path)["resolution"].isna().sum() == len(first)
+
+if __name__ == "__main__":    
+    test_spatial_index()
+    test_key_index()
+    test_invalidate()
+    test_atom_table()
+    test_fast_reader()
+    test_metadata()
+    test_cache()
+    test_residue_index()
+    test_nearest_atoms()
+    test_array_calculations()
+    test_geometry_criteria()
+    test_geometry_pool()
+    test_geometry_stream()